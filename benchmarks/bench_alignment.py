@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+import outOfCore
+from chunkedStore import ChunkedStore
+from kineticDataset import KineticDataset
+from wavelengthGrid import interpolationMatrix
+
+'''
+Segments whose wavelength axes are shifted by a fraction of a pixel, as when
+the grating calibration drifts between files. Resampling a kinetic on to
+another axis gate by gate with numpy.interp, against the one sparse matrix
+product of kineticPipeline.resampleWavelengths. The aligned join must match
+the join of the same segments recorded on one axis.
+'''
+
+# nm, a fraction of the pixel spacing either way
+SHIFTS = [0., 0.15, -0.1]
+
+
+def prepare(generator, rawKinetics):
+    kinetics = {}
+    for index, (kinetic, background, startTime, gateStep) in enumerate(rawKinetics, 1):
+        kinetic = KineticDataset.fromDataFrame(kinetic)
+        kp.addTimeAxis(kinetic, generator.timeZero, startTime, gateStep)
+        kp.removeCosmicRays(kinetic)
+        kinetics[index] = kp.subtractBackground(kinetic, background.values)
+    return kinetics
+
+
+@pytest.fixture(scope='module')
+def shiftedKinetics(generator):
+    return prepare(generator, generator.kinetics(wavelengthShifts=SHIFTS))
+
+
+@pytest.fixture(scope='module')
+def unshiftedKinetics(generator):
+    return prepare(generator, generator.kinetics())
+
+
+def shiftedCopies(kinetics):
+    '''
+    The kinetics resampled on to their axes moved by SHIFTS, within their
+    range: the same noise as the unshifted ones, so joins of the two differ
+    by the resampling alone. (The generator's shifted kinetics are another
+    draw of the noise, which at the late, faint joins moves the scaling
+    factors more than the resampling does.)
+    '''
+    shifted = {}
+    for (index, kinetic), shift in zip(kinetics.items(), SHIFTS):
+        wavelengths = kinetic.wavelengths+shift
+        inside = (wavelengths >= kinetic.wavelengths[0]) & (wavelengths <= kinetic.wavelengths[-1])
+        shifted[index] = kp.resampleWavelengths(kinetic.copy(), wavelengths[inside])
+    return shifted
+
+
+def perGate(kinetic, grid):
+    return np.column_stack([np.interp(grid, kinetic.wavelengths, kinetic.data[:, gate])
+                            for gate in range(kinetic.shape[1])])
+
+
+def sparseProduct(kinetic, grid):
+    return kp.resampleWavelengths(kinetic.copy(deep=False), grid).data
+
+
+@pytest.mark.parametrize('method', [perGate, sparseProduct], ids=['per_gate', 'sparse'])
+def test_resample(benchmark, shiftedKinetics, method):
+    grid = shiftedKinetics[1].wavelengths[2:-2]
+    kinetic = shiftedKinetics[2]
+    data = benchmark(method, kinetic, grid)
+    np.testing.assert_allclose(data, perGate(kinetic, grid), atol=1e-9*np.abs(kinetic.data).max())
+
+
+def test_interpolation_matrix():
+    source = np.array([1., 2., 4.])
+    matrix = interpolationMatrix(source, np.array([1., 1.5, 3., 4.]))
+    np.testing.assert_allclose(matrix.toarray(), [[1, 0, 0], [0.5, 0.5, 0], [0, 0.5, 0.5], [0, 0, 1]])
+    assert interpolationMatrix(source, np.array([1., 1.5, 3., 4.])) is matrix
+
+
+def test_aligned_join(shiftedKinetics, unshiftedKinetics):
+    with pytest.raises(ValueError):
+        kp.joinPair(shiftedKinetics[1], shiftedKinetics[2])
+    completeKinetic, sfs, overlappedTimes = kp.joinKinetics(shiftedCopies(unshiftedKinetics))
+    expected, expectedSfs, expectedTimes = kp.joinKinetics(unshiftedKinetics)
+    assert overlappedTimes == expectedTimes
+    # the first segment's axis, less the pixels the others do not reach
+    np.testing.assert_array_equal(completeKinetic.wavelengths, expected.wavelengths[1:-1])
+    np.testing.assert_allclose(sfs['sf'].values[1:].astype(float), expectedSfs['sf'].values[1:].astype(float), rtol=0.01)
+    # the interpolated bands agree, each gate to within a fraction of the
+    # counts in it (its sum alone is close to zero at the late gates)
+    difference = np.abs(completeKinetic.data.sum(axis=0)-expected.data[1:-1].sum(axis=0))
+    assert (difference <= 0.02*np.abs(expected.data[1:-1]).sum(axis=0)).all()
+    assert kp.alignWavelengths({1: shiftedKinetics[1]})[1] is shiftedKinetics[1]
+
+
+def test_aligned_out_of_core(shiftedKinetics, tmp_path):
+    completeKinetic, sfs, overlappedTimes = kp.joinKinetics(shiftedKinetics)
+    store = ChunkedStore(str(tmp_path))
+    outOfCoreKinetic, outOfCoreSfs, outOfCoreTimes = outOfCore.joinSegments(store, list(shiftedKinetics.values()),
+                                                                            blockColumns=16)
+    np.testing.assert_array_equal(outOfCoreKinetic.wavelengths, completeKinetic.wavelengths)
+    np.testing.assert_allclose(outOfCoreKinetic.data, completeKinetic.data)
+    assert 'segment2_align_wavelengths' in store.datasets()
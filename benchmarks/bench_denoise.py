@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from kineticDataset import KineticDataset
+from svdDenoise import SVDDenoise
+
+'''
+Truncated SVD denoising of the joined kinetic: a full SVD truncated to the
+rank kept, as users did in their own scripts, against the randomized SVD of
+svdDenoise. The randomized approximation must leave a residual within 1% of
+the best possible one at that rank.
+'''
+
+
+def fullSVDDenoise(data, rank):
+    u, s, vt = np.linalg.svd(data, full_matrices=False)
+    return (u[:, :rank]*s[:rank]) @ vt[:rank]
+
+
+def randomizedSVDDenoise(data, rank):
+    return SVDDenoise(rank).denoise(data)
+
+
+METHODS = [pytest.param(fullSVDDenoise, id='full'), pytest.param(randomizedSVDDenoise, id='randomized')]
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_svd_denoise(benchmark, completeKinetic, method):
+    data = completeKinetic.data
+    denoised = benchmark.pedantic(method, args=(data, kp.SVD_RANK), rounds=3, iterations=1)
+    best = np.linalg.norm(data-fullSVDDenoise(data, kp.SVD_RANK))
+    assert np.linalg.norm(data-denoised) <= 1.01*best
+
+
+def test_scree(benchmark, completeKinetic):
+    scree = benchmark(kp.singularValues, completeKinetic)
+    exact = np.linalg.svd(completeKinetic.data, compute_uv=False)
+    assert len(scree) == kp.SCREE_COMPONENTS
+    # the signal components are found to high accuracy, the noise floor less so
+    np.testing.assert_allclose(scree['singularValue'].values[:3], exact[:3], rtol=1e-6)
+    assert scree['explained'].sum() <= 1.
+
+
+def test_denoise_segment(generator):
+    # a segment with shot and read noise but no cosmic rays, whose imperfect
+    # removal would dominate the error
+    startTime, gateStep, numPoints, gain = generator.segments[0]
+    times = startTime+gateStep*np.arange(numPoints)
+    truth = generator.cleanKinetic(times)*gain
+    rng = np.random.RandomState(0)
+    noisy = rng.poisson(truth)+rng.normal(0, generator.readNoise, truth.shape)
+    segment = KineticDataset(noisy, generator.wavelengths, times)
+    denoised = kp.denoiseSVD(segment.copy(), len(generator.bands))
+    assert denoised.history[-1][0] == 'svd denoise'
+    rawError = np.sqrt(np.mean((segment.data-truth)**2))
+    denoisedError = np.sqrt(np.mean((denoised.data-truth)**2))
+    assert denoisedError < 0.7*rawError
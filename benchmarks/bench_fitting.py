@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from decayFitting import DecayFit
+
+'''
+Lifetime maps of the joined kinetic: fitting every wavelength with
+scipy.optimize.curve_fit one at a time, as users did after saving kinetic
+slices, against the batched variable projection fit of decayFitting. The
+batched bi-exponential fit must recover the lifetimes of the synthetic bands.
+'''
+
+
+def perRowFits(times, data):
+    from scipy.optimize import curve_fit
+
+    def mono(t, amplitude, tau):
+        # curve_fit tries negative lifetimes on wavelengths with no decay
+        with np.errstate(over='ignore'):
+            return amplitude*np.exp(-t/tau)
+
+    taus = np.full(data.shape[0], np.nan)
+    for row, decay in enumerate(data):
+        try:
+            taus[row] = curve_fit(mono, times, decay, p0=(decay.max(), times.mean()), maxfev=2000)[0][1]
+        except RuntimeError:
+            pass
+    return taus
+
+
+def batchedFits(times, data):
+    return DecayFit('mono').fit(times, data)[0][:, 0]
+
+
+METHODS = [pytest.param(perRowFits, id='per_row'), pytest.param(batchedFits, id='batched')]
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_lifetime_map(benchmark, completeKinetic, method):
+    after = completeKinetic.times > 0
+    times, data = completeKinetic.times[after].astype(float), completeKinetic.data[:, after]
+    taus = benchmark.pedantic(method, args=(times, data), rounds=1, iterations=1)
+    benchmark.extra_info['failedFits'] = int(np.isnan(taus).sum())
+    assert taus.shape == (data.shape[0],)
+
+
+@pytest.mark.parametrize('model', list(kp.DECAY_MODELS))
+def test_fit_decays(benchmark, completeKinetic, model):
+    fits = benchmark.pedantic(kp.fitDecays, args=(completeKinetic, model), rounds=1, iterations=1)
+    assert len(fits) == completeKinetic.shape[0]
+    # wavelengths with no emission have no decay to converge on
+    signal = completeKinetic.data.max(axis=1) > 10*fits['rms'].values
+    assert fits['converged'][signal].all()
+
+
+def test_bi_exponential_lifetimes(generator, completeKinetic):
+    # at the first band's centre the second band is negligible
+    centre, width, amplitude, decays = generator.bands[0]
+    trace = kp.getKineticSlice(completeKinetic, centre, 1.)
+    fit = kp.fitDecays(trace, 'bi').iloc[0]
+    trueLifetimes = sorted(lifetime for fraction, lifetime in decays)
+    np.testing.assert_allclose([fit['tau1'], fit['tau2']], trueLifetimes, rtol=0.1)
+    assert fit['converged']
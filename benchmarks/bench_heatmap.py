@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from heatmapPyramid import HeatmapPyramid
+
+'''
+Drawing the heatmap panel as it is panned and zoomed: resampling the whole
+kinetic onto the log time axis for every view, against building the image
+pyramid once and cropping the right level of it for each view.
+'''
+
+# plot size in screen pixels
+WIDTH, HEIGHT = 600, 400
+
+
+def zoomViews(extent, numViews=10):
+    # zooming in on the middle of the kinetic by a third each time
+    centre = np.array([(extent[0]+extent[1])/2, (extent[2]+extent[3])/2])
+    half = np.array([(extent[1]-extent[0])/2, (extent[3]-extent[2])/2])
+    return [((centre[0]-half[0]*0.66**i, centre[0]+half[0]*0.66**i), (centre[1]-half[1]*0.66**i, centre[1]+half[1]*0.66**i))
+            for i in range(numViews)]
+
+
+def resampleEachView(kinetic, views, pyramid=None):
+    return [HeatmapPyramid(kinetic.data, kinetic.wavelengths, kinetic.times).view(xlim, ylim, WIDTH, HEIGHT)
+            for xlim, ylim in views]
+
+
+def cachedPyramid(kinetic, views, pyramid=None):
+    return [pyramid.view(xlim, ylim, WIDTH, HEIGHT) for xlim, ylim in views]
+
+
+@pytest.fixture(scope='module')
+def pyramid(completeKinetic):
+    return HeatmapPyramid(completeKinetic.data, completeKinetic.wavelengths, completeKinetic.times)
+
+
+def test_build_pyramid(benchmark, completeKinetic):
+    pyramid = benchmark(HeatmapPyramid, completeKinetic.data, completeKinetic.wavelengths, completeKinetic.times)
+    assert pyramid.levels[0].shape[0] == completeKinetic.shape[0]
+
+
+@pytest.mark.parametrize('method', [resampleEachView, cachedPyramid], ids=['resample_each_view', 'pyramid'])
+def test_zoom(benchmark, completeKinetic, pyramid, method):
+    views = zoomViews(pyramid.extent())
+    rendered = benchmark(method, completeKinetic, views, pyramid)
+    for (image, extent), (expected, expectedExtent), (xlim, ylim) in zip(rendered, cachedPyramid(completeKinetic, views, pyramid), views):
+        np.testing.assert_array_equal(image, expected)
+        # never much more than a cell per pixel, and covering the view
+        assert image.shape[1] <= max(2*WIDTH, pyramid.levels[0].shape[1])
+        tolerance = 1e-9*(abs(xlim[1])+abs(ylim[1]))
+        assert extent[0] <= xlim[0]+tolerance and extent[1] >= xlim[1]-tolerance
+        assert min(extent[2:]) <= ylim[0]+tolerance and max(extent[2:]) >= ylim[1]-tolerance
+
+
+def test_levels(completeKinetic, pyramid):
+    finest, coarser = pyramid.levels[:2]
+    rows, columns = coarser.shape
+    np.testing.assert_allclose(coarser, finest[:2*rows, :2*columns].reshape(rows, 2, columns, 2).mean(axis=(1, 3)),
+                               rtol=1e-5)
+    # the last gate is in the middle of the last column
+    times = np.asarray(completeKinetic.times, dtype=float)
+    assert np.log10(times.max()) == pytest.approx(pyramid.timeOrigin+(finest.shape[1]-0.5)*pyramid.columnWidth)
+    # which averages the gates in it: only the last, unless MAX_COLUMNS
+    # leaves columns wider than the late gate steps
+    gates = np.flatnonzero(times > 0)
+    columns = ((np.log10(times[gates])-pyramid.timeOrigin)/pyramid.columnWidth).astype(int)
+    lastColumn = gates[columns >= finest.shape[1]-1]
+    np.testing.assert_allclose(finest[:, -1], completeKinetic.data[:, lastColumn].mean(axis=1), rtol=1e-5,
+                               atol=1e-5*np.abs(completeKinetic.data).max())
+    with pytest.raises(ValueError):
+        HeatmapPyramid(completeKinetic.data[:, :1], completeKinetic.wavelengths, [-1.])
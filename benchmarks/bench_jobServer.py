@@ -0,0 +1,199 @@
+import os
+import glob
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from session import Session
+import jobServer
+from jobServer import JobClient, JobQueue, JobServerError, makeServer
+
+'''
+Processing a session on the local job server, as a shared processing PC
+would: submitted over HTTP (on a Unix socket where there are any), run in a
+fresh worker process with the server's parsed file cache, and polled until
+done. Against running it in this
+process, which is what the app always did. Both must save the same joined
+kinetic. Jobs from two users share one bounded pool, each taken only with
+files that user can read and an output folder they can write to.
+'''
+
+unixOnly = pytest.mark.skipif(not hasattr(os, 'getuid'), reason='users are told apart on Unix sockets only')
+
+
+def startServer(address, directory):
+    server = makeServer(address, workers=2, cacheDir=os.path.join(directory, 'sharedCache'),
+                        tokenFile=os.path.join(directory, 'token'))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = server.server_address if isinstance(address, str) else server.server_address[1]
+    return server, JobClient(address, tokenFile=os.path.join(directory, 'token'))
+
+
+def stopServer(server):
+    server.shutdown()
+    server.server_close()
+    server.jobs.close()
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('jobServer'))
+    server, client = startServer(os.path.join(directory, 'jobs.sock') if hasattr(socket, 'AF_UNIX') else 0,
+                                 directory)
+    yield server, client
+    stopServer(server)
+
+
+@pytest.fixture(scope='module')
+def session(generator, ascFiles):
+    files, calibrationPath = ascFiles
+    segments = [{'kinetic': kinetic, 'background': background, 'startTime': startTime, 'gateStep': gateStep}
+                for kinetic, background, startTime, gateStep in files]
+    return Session(segments, generator.timeZero, removeCosmicRays=True, calibration=calibrationPath)
+
+
+def runOnServer(client, session, output):
+    jobId = client.submit(session, os.path.dirname(session.segments[0]['kinetic']), output)
+    return client.wait(jobId, interval=0.05, timeout=300)
+
+
+def runInProcess(session, output):
+    os.makedirs(output, exist_ok=True)
+    return session.runToFolder(output)
+
+
+def readKinetic(output):
+    return pd.read_csv(os.path.join(output, 'completeKinetic.csv'), index_col=0)
+
+
+def test_in_process(benchmark, session, tmp_path):
+    completeKinetic, sfs = benchmark.pedantic(runInProcess, args=(session, str(tmp_path)), rounds=3, iterations=1)
+    assert readKinetic(str(tmp_path)).shape == completeKinetic.shape
+
+
+def test_job_server(benchmark, server, session, tmp_path):
+    server, client = server
+    job = benchmark.pedantic(runOnServer, args=(client, session, str(tmp_path/'server')), rounds=3, iterations=1)
+    assert job['state'] == 'done', job['error']
+    runInProcess(session, str(tmp_path/'local'))
+    expected = readKinetic(str(tmp_path/'local'))
+    assert job['shape'] == list(expected.shape)
+    if hasattr(os, 'getuid'):
+        # told by the system who submitted it
+        assert job['uid'] == os.getuid()
+    np.testing.assert_array_equal(readKinetic(str(tmp_path/'server')).values, expected.values)
+    # every file parsed once, for every job after
+    assert glob.glob(os.path.join(server.jobs.cacheDir, '*.npz'))
+    assert not glob.glob(os.path.join(server.jobs.cacheDir, '*.tmp'))
+
+
+def test_refused_and_cancelled(server, session, tmp_path):
+    server, client = server
+    with pytest.raises(JobServerError):
+        client._request('POST', value={'session': {'timeZero': 0}, 'directory': str(tmp_path)})
+    # an output that cannot be made, inside a file
+    with pytest.raises(JobServerError, match='cannot write'):
+        client.submit(session, str(tmp_path), os.path.join(session.segments[0]['kinetic'], 'results'))
+    with pytest.raises(JobServerError):
+        client.status('999')
+    directory = os.path.dirname(session.segments[0]['kinetic'])
+    # more jobs than workers, so the last is still queued, or else running
+    jobIds = [client.submit(session, directory, str(tmp_path/str(i))) for i in range(3)]
+    cancelled = client.cancel(jobIds[-1])
+    assert cancelled['state'] == 'cancelled'
+    for jobId in jobIds[:-1]:
+        assert client.wait(jobId, interval=0.05, timeout=300)['state'] == 'done'
+    assert client.status(jobIds[-1])['state'] == 'cancelled'
+    with pytest.raises(JobServerError):
+        client.cancel(jobIds[0])
+    assert [job['id'] for job in client.status()][-3:] == jobIds
+
+
+def test_port_needs_token(session, tmp_path):
+    server, client = startServer(0, str(tmp_path))
+    try:
+        directory = os.path.dirname(session.segments[0]['kinetic'])
+        stranger = JobClient(client.address, tokenFile=str(tmp_path/'no-token'))
+        with pytest.raises(JobServerError, match='token'):
+            stranger.submit(session, directory, str(tmp_path/'stranger'))
+        assert oct(os.stat(client.tokenFile).st_mode & 0o777) == '0o600'
+        assert client.status() == []
+    finally:
+        stopServer(server)
+
+
+def test_finished_jobs_pruned(session, tmp_path):
+    jobs = JobQueue(workers=1, cacheDir=str(tmp_path/'cache'), maxFinished=2)
+    try:
+        content = session.toContent(str(tmp_path))
+        jobIds = [jobs.submit(content, str(tmp_path)) for _ in range(4)]
+        for jobId in jobIds:
+            jobs.cancel(jobId)
+        jobIds.append(jobs.submit(content, str(tmp_path)))
+        # the two most recent finished jobs, and the new one
+        assert [job['id'] for job in jobs.status()] == jobIds[2:]
+    finally:
+        jobs.close()
+
+
+@pytest.fixture
+def sharedCopy(session):
+    '''
+    The session's files copied to a folder every user can read, with an
+    output folder every user can write to.
+    '''
+    directory = tempfile.mkdtemp()
+    os.chmod(directory, 0o755)
+    segments = []
+    for segment in session.segments:
+        segments.append(dict(segment, kinetic=shutil.copy(segment['kinetic'], directory),
+                             background=shutil.copy(segment['background'], directory)))
+    output = os.path.join(directory, 'results')
+    os.mkdir(output)
+    os.chmod(output, 0o777)
+    yield Session(segments, session.timeZero, removeCosmicRays=True), directory, output
+    shutil.rmtree(directory)
+
+
+@unixOnly
+def test_two_submitters(session, sharedCopy, tmp_path):
+    shared, directory, output = sharedCopy
+    owner = (os.getuid(), os.getgid())
+    # another user, in none of the owner's groups
+    other = (os.getuid()+4321, os.getgid()+4321)
+    jobs = JobQueue(workers=1, cacheDir=str(tmp_path/'cache'))
+    try:
+        # the owner's data, in a folder only they can open
+        os.chmod(os.path.dirname(session.segments[0]['kinetic']), 0o700)
+        with pytest.raises(ValueError, match='cannot read'):
+            jobs.submit(session.toContent(str(tmp_path)), str(tmp_path), output, user=other)
+        with pytest.raises(ValueError, match='cannot write'):
+            jobs.submit(shared.toContent(directory), directory, str(tmp_path/'other'), user=other)
+        if os.geteuid() == 0 and not all(jobServer._readable(path, other+({other[1]},))
+                                         for path in (np.__file__, jobServer.__file__)):
+            pytest.skip('jobs run as the other user, who cannot read this Python or the code')
+        content = shared.toContent(directory)
+        jobIds = []
+        for index in range(2):
+            for user in (owner, other):
+                jobIds.append(jobs.submit(content, directory, os.path.join(output, '{0}_{1}'.format(user[0], index)),
+                                          user=user))
+        with pytest.raises(PermissionError):
+            jobs.cancel(jobIds[0], user=other)
+        mostRunning = 0
+        while any(job['state'] not in ('done', 'failed') for job in jobs.status()):
+            mostRunning = max(mostRunning, sum(job['state'] == 'running' for job in jobs.status()))
+            time.sleep(0.01)
+        assert mostRunning == 1
+        assert [job['state'] for job in jobs.status()] == ['done']*4, [job['error'] for job in jobs.status()]
+        assert [job['uid'] for job in jobs.status()] == [owner[0], other[0]]*2
+        if os.geteuid() == 0:
+            # run as the submitter, not as the server
+            for job in jobs.status():
+                assert os.stat(os.path.join(job['output'], 'completeKinetic.csv')).st_uid == job['uid']
+    finally:
+        jobs.close()
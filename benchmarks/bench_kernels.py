@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from cosmicRayRemoval import CosmicRayRemoval, NUMBA_AVAILABLE
+
+'''
+NumPy against numba kernels for cosmic ray removal and the band averaged
+kinetic slice, in single and double precision. Every numba run is checked
+against the NumPy result. The numba cases are skipped when it is not installed; they are
+compiled (or loaded from numba's cache) before timing.
+'''
+
+BACKENDS = [
+    pytest.param(False, id='numpy'),
+    pytest.param(True, id='numba', marks=pytest.mark.skipif(not NUMBA_AVAILABLE, reason='numba not installed')),
+]
+DTYPES = [pytest.param(np.float64, id='float64'), pytest.param(np.float32, id='float32')]
+
+
+@pytest.mark.parametrize('dtype', DTYPES)
+@pytest.mark.parametrize('useNumba', BACKENDS)
+def test_cosmic_ray_kernel(benchmark, rawKinetics, useNumba, dtype):
+    data = rawKinetics[0][0].values.astype(dtype)
+    crr = CosmicRayRemoval(useNumba=useNumba)
+    crr.removeCosmicRays(data[:, :2])
+    corrected = benchmark.pedantic(crr.removeCosmicRays, args=(data,), rounds=3, iterations=1)
+    expected = CosmicRayRemoval(useNumba=False).removeCosmicRays(data)
+    assert corrected.dtype == expected.dtype
+    tolerance = 1e-6 if dtype == np.float32 else 1e-12
+    np.testing.assert_allclose(corrected, expected, rtol=tolerance, atol=tolerance*np.abs(expected).max())
+
+
+@pytest.mark.parametrize('dtype', DTYPES)
+@pytest.mark.parametrize('useNumba', BACKENDS)
+def test_kinetic_slice_band_kernel(benchmark, generator, completeKinetic, useNumba, dtype):
+    kinetic = completeKinetic.copy()
+    kinetic.data = kinetic.data.astype(dtype)
+    centreWavelength = generator.bands[0][0]
+    kp.getKineticSlice(kinetic, centreWavelength, 5., useNumba=useNumba)
+    data = benchmark(kp.getKineticSlice, kinetic, centreWavelength, 5., useNumba=useNumba)
+    expected = kp.getKineticSlice(kinetic, centreWavelength, 5., useNumba=False)
+    np.testing.assert_allclose(data.values, expected.values, rtol=1e-10, atol=1e-10*np.abs(expected.values).max())
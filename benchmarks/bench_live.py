@@ -0,0 +1,118 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from syntheticData import SyntheticKineticGenerator
+from liveSplice import LiveSplicer, FolderWatcher
+
+'''
+Live splicing, with the files handed over as the watcher would find them
+during an acquisition. Every segment is joined as soon as it and its
+background are there, whatever order they are written in, and a segment
+that cannot be read yet is not lost: it is read again once rewritten, and
+the segments after it wait for it.
+'''
+
+
+@pytest.fixture(scope='module')
+def liveFiles(generator, tmp_path_factory):
+    '''
+    (kinetic, background) paths of each segment, named as live mode expects.
+    '''
+    directory = str(tmp_path_factory.mktemp('live_{0}x{1}'.format(generator.numPixels, generator.numGates)))
+    files = []
+    for kinetic, background, startTime, gateStep in generator.kinetics():
+        stem = os.path.join(directory, 'PL_start{0}_step{1}'.format(startTime, gateStep))
+        SyntheticKineticGenerator.writeAsc(kinetic, stem+'.asc')
+        SyntheticKineticGenerator.writeAsc(background, stem+'_bg.asc')
+        files.append((stem+'.asc', stem+'_bg.asc'))
+    return files
+
+
+def makeSplicer(generator):
+    return LiveSplicer(generator.timeZero, nrows=generator.numPixels)
+
+
+def spliceAll(generator, filepaths):
+    splicer = makeSplicer(generator)
+    joined = []
+    for filepath in filepaths:
+        joined += splicer.addFile(filepath)
+    return splicer, joined
+
+
+@pytest.fixture(scope='module')
+def inOrder(generator, liveFiles):
+    return spliceAll(generator, [filepath for files in liveFiles for filepath in files])[0]
+
+
+def test_live_splice(benchmark, generator, liveFiles):
+    filepaths = [filepath for files in liveFiles for filepath in files]
+    splicer, joined = benchmark.pedantic(spliceAll, args=(generator, filepaths), rounds=3, iterations=1)
+    assert len(joined) == splicer.numSegments == len(liveFiles)
+    assert splicer.pendingFiles() == []
+
+
+def test_background_after_kinetic(generator, liveFiles, inOrder):
+    splicer = makeSplicer(generator)
+    (kinetic, background), = liveFiles[:1]
+    assert splicer.addFile(kinetic) == []
+    assert splicer.nextSegmentFiles() == [kinetic]
+    assert splicer.addFile(background) == splicer.joinedStems
+    assert splicer.numSegments == 1
+
+
+def test_out_of_order(generator, liveFiles, inOrder):
+    # the kinetics in time order, but the first background written last
+    (kinetic, background), later = liveFiles[0], liveFiles[1:]
+    splicer = makeSplicer(generator)
+    assert splicer.addFile(kinetic) == []
+    for laterKinetic, laterBackground in later:
+        assert splicer.addFile(laterBackground) == []
+        assert splicer.addFile(laterKinetic) == []
+    assert len(splicer.pendingFiles()) == len(liveFiles)
+    joined = splicer.addFile(background)
+    assert joined == inOrder.joinedStems
+    assert splicer.pendingFiles() == []
+    np.testing.assert_array_equal(splicer.completeKinetic.data, inOrder.completeKinetic.data)
+    pd.testing.assert_frame_equal(splicer.scalingFactors(), inOrder.scalingFactors())
+
+
+def test_failed_segment_retried(generator, liveFiles, inOrder, tmp_path):
+    filepaths = []
+    for kinetic, background in liveFiles:
+        filepaths += [shutil.copy(kinetic, str(tmp_path)), shutil.copy(background, str(tmp_path))]
+    # the second kinetic is only half written when first read
+    halfWritten = filepaths[2]
+    with open(halfWritten) as f:
+        text = f.read()
+    with open(halfWritten, 'w') as f:
+        f.write(text[:len(text)//2])
+    splicer = makeSplicer(generator)
+    watcher = FolderWatcher(str(tmp_path))
+    assert sorted(watcher.poll()+watcher.poll()) == sorted(filepaths)
+    splicer.addFile(filepaths[0])
+    splicer.addFile(filepaths[1])
+    splicer.addFile(filepaths[2])
+    with pytest.raises(ValueError, match='incomplete rows'):
+        splicer.addFile(filepaths[3])
+    assert splicer.numSegments == 1
+    assert splicer.nextSegmentFiles() == filepaths[2:4]
+    # the segments after it wait for it
+    for filepath in filepaths[4:]:
+        with pytest.raises(ValueError):
+            splicer.addFile(filepath)
+    for filepath in splicer.nextSegmentFiles():
+        watcher.retry(filepath)
+    assert watcher.poll()+watcher.poll() == []
+    with open(halfWritten, 'w') as f:
+        f.write(text)
+    os.utime(halfWritten, (0, 0))
+    retried = watcher.poll()+watcher.poll()
+    assert retried == [halfWritten]
+    joined = splicer.addFile(halfWritten)
+    assert len(joined) == len(liveFiles)-1
+    assert splicer.pendingFiles() == []
+    np.testing.assert_array_equal(splicer.completeKinetic.data, inOrder.completeKinetic.data)
+    assert splicer.overlappedTimes == inOrder.overlappedTimes
@@ -0,0 +1,105 @@
+import tracemalloc
+import numpy as np
+import pytest
+import kineticPipeline as kp
+import outOfCore
+from chunkedStore import ChunkedStore
+from session import Session
+
+'''
+The whole chain in memory against out of core, where every stage is read and
+written a block of gates at a time through a ChunkedStore. The peak memory
+allocated by each is recorded, and both must give the same joined kinetic.
+Out of core, the peak must be bounded by the chunks of lines parsed and the
+blocks of gates processed at once, not by the size of the kinetics.
+'''
+
+BLOCK_COLUMNS = 64
+
+
+def workingBytes(generator, blockColumns=BLOCK_COLUMNS):
+    # a chunk of lines as parsed, and a block of gates of a whole kinetic
+    return 8*(outOfCore.CHUNK_ROWS*generator.numGates+generator.numPixels*blockColumns)
+
+
+@pytest.fixture(scope='module')
+def session(generator, ascFiles):
+    files, calibrationPath = ascFiles
+    segments = [{'kinetic': kinetic, 'background': background, 'startTime': startTime, 'gateStep': gateStep}
+                for kinetic, background, startTime, gateStep in files]
+    return Session(segments, generator.timeZero, removeCosmicRays=True, calibration=calibrationPath)
+
+
+def inMemory(session, directory):
+    return session.run()
+
+
+def outOfCoreRun(session, directory):
+    return session.runOutOfCore(directory, blockColumns=BLOCK_COLUMNS)
+
+
+def tracedPeak(func, *args, **kwargs):
+    '''
+    func(*args, **kwargs) and the peak memory allocated while it ran, in
+    bytes. tracemalloc is only stopped again if it was started here.
+    '''
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]-baseline
+    finally:
+        if started:
+            tracemalloc.stop()
+    return result, peak
+
+
+@pytest.mark.parametrize('method', [inMemory, outOfCoreRun], ids=['in_memory', 'out_of_core'])
+def test_chain_memory(benchmark, request, generator, session, tmp_path, method):
+    # also compiles the kernels before anything is measured
+    expected, expectedSfs, expectedTimes = session.run()
+    (completeKinetic, sfs, overlappedTimes), peak = tracedPeak(benchmark.pedantic, method, args=(session, str(tmp_path)),
+                                                               rounds=1, iterations=1)
+    benchmark.extra_info['peakMB'] = peak/2**20
+    np.testing.assert_allclose(completeKinetic.data, expected.data)
+    np.testing.assert_array_equal(completeKinetic.times, expected.times)
+    np.testing.assert_allclose(sfs['sf'].values[1:].astype(float), expectedSfs['sf'].values[1:].astype(float))
+    assert overlappedTimes == expectedTimes
+    if method is outOfCoreRun:
+        # a few copies of the working blocks, and the interpreter's own
+        assert peak < 4*workingBytes(generator)+2**20
+        if request.node.get_closest_marker('large'):
+            inMemoryPeak = tracedPeak(inMemory, session, str(tmp_path))[1]
+            assert peak < inMemoryPeak/10
+
+
+def test_read_kinetic_to_store(generator, ascFiles, tmp_path):
+    files, calibrationPath = ascFiles
+    full = kp.readKinetic(files[0][0], ',', nrows=generator.numPixels)
+    roi = (full.wavelengths[10], full.wavelengths[-10])
+    expected = kp.readKinetic(files[0][0], ',', nrows=generator.numPixels, roi=roi, binning=3)
+    store = ChunkedStore(str(tmp_path))
+    kinetic = outOfCore.readKineticToStore(store, 'kinetic', files[0][0], ',', nrows=generator.numPixels, roi=roi,
+                                           binning=3, chunkRows=32)
+    np.testing.assert_array_equal(kinetic.data, expected.data)
+    np.testing.assert_array_equal(kinetic.wavelengths, expected.wavelengths)
+    reopened = ChunkedStore(str(tmp_path), mode='r').dataset('kinetic')
+    np.testing.assert_array_equal(reopened.data, expected.data)
+    np.testing.assert_array_equal(reopened.times, expected.times)
+
+
+def test_own_background(generator, ascFiles, tmp_path):
+    kineticPath, backgroundPath, startTime, gateStep = ascFiles[0][0]
+    backgroundEndTime = startTime-generator.timeZero+10*gateStep
+    expected = kp.readKinetic(kineticPath, ',', nrows=generator.numPixels)
+    kp.addTimeAxis(expected, generator.timeZero, startTime, gateStep)
+    kp.removeCosmicRays(expected)
+    kp.subtractBackground(expected, kp.estimateBackground(expected, backgroundEndTime))
+    kinetic = outOfCore.processSegment(ChunkedStore(str(tmp_path)), 'segment1', kineticPath, None, startTime, gateStep,
+                                       generator.timeZero, ',', removeCosmicRays=True,
+                                       backgroundEndTime=backgroundEndTime, nrows=generator.numPixels, blockColumns=7)
+    np.testing.assert_allclose(kinetic.data, expected.data, atol=1e-9*np.abs(expected.data).max())
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+import outOfCore
+from chunkedStore import ChunkedStore
+from kineticSplice import bootstrapScalingFactor, overlapScores
+
+'''
+Choosing the overlapped gates each scaling factor is fitted to: the earliest
+gate, as joinKinetics always did, against scoring every overlapped gate for
+signal-to-noise at once and fitting the best. A misfired gate (no signal,
+only read noise) at the start of an overlap ruins the earliest gate fit but
+is passed over by the scored selection.
+'''
+
+
+def scalingFactor(index):
+    # the gain of each segment is three times the last (see syntheticData)
+    return 3.**(1-index)
+
+
+@pytest.fixture(scope='module')
+def misfired(generator, preparedKinetics):
+    '''
+    The prepared kinetics with the earliest overlapped gate of the first
+    join with more than one overlapped gate replaced by read noise.
+    '''
+    for index in list(preparedKinetics)[1:]:
+        overlappedTimes = np.intersect1d(preparedKinetics[index-1].times, preparedKinetics[index].times)
+        if overlappedTimes.size > 1:
+            break
+    else:
+        pytest.skip('no join overlaps by more than one gate at this size')
+    kinetic = preparedKinetics[index].copy()
+    column = np.flatnonzero(kinetic.times == overlappedTimes[0])[0]
+    kinetic.data[:, column] = np.random.RandomState(1).normal(0, generator.readNoise, kinetic.shape[0])
+    return {**preparedKinetics, index: kinetic}, index
+
+
+@pytest.mark.parametrize('overlapSelection', kp.OVERLAP_SELECTIONS)
+def test_join_selection(benchmark, preparedKinetics, overlapSelection):
+    completeKinetic, sfs, overlappedTimes = benchmark(kp.joinKinetics, preparedKinetics,
+                                                      overlapSelection=overlapSelection)
+    np.testing.assert_allclose(sfs['sf'].values[1:].astype(float), [scalingFactor(index) for index in sfs.index[1:]],
+                               rtol=0.02)
+    assert ('snr' in sfs.columns) == (overlapSelection == 'snr')
+
+
+def test_misfired_gate(misfired):
+    kinetics, index = misfired
+    earliest = kp.joinKinetics(kinetics)[1]
+    completeKinetic, sfs, overlappedTimes = kp.joinKinetics(kinetics, overlapSelection='snr')
+    assert float(earliest.loc[index, 'sf']) != pytest.approx(scalingFactor(index), rel=0.5)
+    assert float(sfs.loc[index, 'sf']) == pytest.approx(scalingFactor(index), rel=0.02)
+    # spliced at the same time, fitted at a later one
+    assert overlappedTimes == kp.joinKinetics(kinetics)[2]
+    assert float(sfs.loc[index, 'fitTime']) > float(sfs.loc[index, 'time'])
+    lines = kp.overlappedTimesTable(overlappedTimes, sfs)
+    assert [line.split()[0] for line in lines] == overlappedTimes
+    assert len(lines[index-2].split()) == 4
+
+
+def test_misfired_out_of_core(misfired, tmp_path):
+    kinetics, index = misfired
+    completeKinetic, sfs, overlappedTimes = kp.joinKinetics(kinetics, overlapSelection='snr')
+    outOfCoreKinetic, outOfCoreSfs, outOfCoreTimes = outOfCore.joinSegments(
+        ChunkedStore(str(tmp_path)), list(kinetics.values()), blockColumns=16, overlapSelection='snr')
+    np.testing.assert_allclose(outOfCoreKinetic.data, completeKinetic.data)
+    np.testing.assert_allclose(outOfCoreSfs['fitTime'].values[1:].astype(float), sfs['fitTime'].values[1:].astype(float))
+
+
+def test_overlap_scores():
+    rng = np.random.RandomState(0)
+    band = np.exp(-0.5*((np.arange(200)-100)/15.)**2)
+    signal = np.array([0., 10., 100.])[:, None]*band
+    scores = overlapScores(signal+rng.normal(0, 1, signal.shape), signal+rng.normal(0, 1, signal.shape))
+    assert scores[0] < 3
+    assert scores[2] > 5*scores[1]
+
+
+def test_misfired_interval(misfired):
+    # the interval is for the factor reported, from the earliest gate it was
+    # fitted to alone, not from every overlapped gate
+    kinetics, index = misfired
+    overlappedTime, scalingFactor, error, overlappedPair, interval, selection = kp.matchOverlap(
+        kinetics[index-1], kinetics[index], bootstrap=kp.BOOTSTRAP_RESAMPLES)
+    assert interval == bootstrapScalingFactor(*overlappedPair, numResamples=kp.BOOTSTRAP_RESAMPLES)
+    assert interval[0] <= scalingFactor <= interval[1]
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from kineticDataset import KineticDataset
+from kineticSplice import KineticSplice
+
+# Steps working in place are given a fresh copy every round via pedantic's setup
+
+
+def test_parse_kinetic(benchmark, generator, ascFiles):
+    files, calibrationPath = ascFiles
+    kineticPath = files[0][0]
+    kinetic = benchmark(kp.readKinetic, kineticPath, ',', nrows=generator.numPixels)
+    assert kinetic.shape == (generator.numPixels, generator.segments[0][2])
+
+
+def test_parse_kinetic_roi(benchmark, generator, ascFiles):
+    files, calibrationPath = ascFiles
+    full = kp.readKinetic(files[0][0], ',', nrows=generator.numPixels)
+    roi = (full.wavelengths[generator.numPixels//4], full.wavelengths[3*generator.numPixels//4-1])
+    kinetic = benchmark(kp.readKinetic, files[0][0], ',', nrows=generator.numPixels, roi=roi, binning=4)
+    assert kinetic.shape == (generator.numPixels//8, full.shape[1])
+    rows = slice(generator.numPixels//4, 3*generator.numPixels//4)
+    np.testing.assert_allclose(kinetic.data, full.data[rows].reshape(-1, 4, full.shape[1]).sum(axis=1))
+    np.testing.assert_allclose(kinetic.wavelengths, full.wavelengths[rows].reshape(-1, 4).mean(axis=1))
+
+
+@pytest.mark.parametrize('roi', [(600., 500.), (1000., 1100.)], ids=['reversed', 'outside'])
+def test_parse_empty_roi(generator, ascFiles, roi):
+    kineticPath, backgroundPath = ascFiles[0][0][:2]
+    with pytest.raises(ValueError):
+        kp.readKinetic(kineticPath, ',', nrows=generator.numPixels, roi=roi)
+    with pytest.raises(ValueError):
+        kp.readBackground(backgroundPath, ',', nrows=generator.numPixels, roi=roi)
+
+
+def test_parse_background(benchmark, generator, ascFiles):
+    files, calibrationPath = ascFiles
+    background = benchmark(kp.readBackground, files[0][1], ',', nrows=generator.numPixels)
+    assert len(background) == generator.numPixels
+
+
+def test_add_time_axis(benchmark, generator, rawKinetics):
+    kinetic, background, startTime, gateStep = rawKinetics[1]
+    kinetic = KineticDataset.fromDataFrame(kinetic)
+    benchmark(kp.addTimeAxis, kinetic, generator.timeZero, startTime, gateStep)
+    assert kinetic.times[0] == startTime-generator.timeZero
+
+
+def test_cosmic_ray_removal(benchmark, rawKinetics):
+    kinetic = KineticDataset.fromDataFrame(rawKinetics[0][0])
+    corrected = benchmark.pedantic(kp.removeCosmicRays, setup=lambda: ((kinetic.copy(),), {}), rounds=3)
+    assert corrected.shape == kinetic.shape
+    assert corrected.data.max() < kinetic.data.max()
+
+
+def test_subtract_background(benchmark, rawKinetics):
+    kinetic = KineticDataset.fromDataFrame(rawKinetics[0][0])
+    background = rawKinetics[0][1].values
+    subtracted = benchmark.pedantic(kp.subtractBackground, setup=lambda: ((kinetic.copy(), background), {}), rounds=10)
+    np.testing.assert_allclose(subtracted.data+background[:, None], kinetic.data)
+
+
+def test_kinetic_splice(benchmark, generator, preparedKinetics):
+    joined, toJoin = preparedKinetics[1], preparedKinetics[2]
+    overlappedTime = np.intersect1d(joined.times, toJoin.times).min()
+    kspl = KineticSplice((joined.spectrum(overlappedTime), toJoin.spectrum(overlappedTime)))
+    scalingFactor, error = benchmark(kspl.calculateScalingFactor)
+    trueScalingFactor = generator.segments[0][3]/generator.segments[1][3]
+    assert abs(scalingFactor-trueScalingFactor) < 0.05*trueScalingFactor
+
+
+def test_join(benchmark, generator, preparedKinetics):
+    completeKinetic, sfs, overlappedTimes = benchmark.pedantic(kp.joinKinetics, args=(preparedKinetics,), rounds=3, iterations=1)
+    gains = np.array([segment[3] for segment in generator.segments])
+    # the joined kinetic is always on the scale of the first segment
+    trueScalingFactors = gains[0]/gains[1:]
+    np.testing.assert_allclose(sfs['sf'].values[1:].astype(float), trueScalingFactors, rtol=0.05)
+    assert completeKinetic.shape[0] == generator.numPixels
+    assert not np.isnan(completeKinetic.data).any()
+    assert len(overlappedTimes) == len(trueScalingFactors)
+
+
+def test_join_bootstrap(benchmark, preparedKinetics):
+    completeKinetic, sfs, overlappedTimes = benchmark.pedantic(kp.joinKinetics, args=(preparedKinetics,), kwargs={'bootstrap': kp.BOOTSTRAP_RESAMPLES},
+                                                               rounds=3, iterations=1)
+    sfs = sfs.iloc[1:].astype(float)
+    assert (sfs['ciLow'] <= sfs['sf']).all() and (sfs['sf'] <= sfs['ciHigh']).all()
+
+
+def test_log_rebin(benchmark, completeKinetic):
+    rebinned = benchmark(kp.rebinLogTime, completeKinetic)
+    assert rebinned.shape[1] < completeKinetic.shape[1]
+    assert rebinned.variance.shape == rebinned.shape
+    # unit variances propagate to 1/n, giving the gates in each bin
+    ones = np.ones((1, completeKinetic.shape[1]))
+    counts = 1/kp.rebinLogTime(KineticDataset(ones, [0.], completeKinetic.times, variance=ones)).variance[0]
+    assert np.isclose(counts.sum(), completeKinetic.shape[1])
+    # and the mean of each bin keeps the total signal
+    np.testing.assert_allclose((rebinned.data*counts).sum(axis=1), completeKinetic.data.sum(axis=1))
+
+
+def test_calibration(benchmark, generator, completeKinetic):
+    calibration = generator.calibration()
+    calibrated = benchmark.pedantic(kp.applyCalibration, setup=lambda: ((completeKinetic.copy(), calibration), {}), rounds=10)
+    assert calibrated.shape == completeKinetic.shape
+
+
+def test_kinetic_slice_band(benchmark, generator, completeKinetic):
+    centreWavelength = generator.bands[0][0]
+    data = benchmark(kp.getKineticSlice, completeKinetic, centreWavelength, 5.)
+    assert len(data) == completeKinetic.shape[1]
+
+
+def test_kinetic_slice_integrated(benchmark, completeKinetic):
+    data = benchmark(kp.getKineticSlice, completeKinetic, 0., 0., integrated=True)
+    assert len(data) == completeKinetic.shape[1]
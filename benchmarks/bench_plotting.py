@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import kineticPipeline as kp
+from plotDecimation import decimate
+
+'''
+Redrawing the kinetics plot the way the app does (clear the axes, log time
+axis, one marker per point) with every gate against the min/max decimated
+trace. The decimated trace must cover the same range of values in every
+pixel column.
+'''
+
+WIDTH_PIXELS = 500
+
+
+@pytest.fixture(scope='module')
+def kineticAxes():
+    figure = Figure(figsize=(WIDTH_PIXELS/100., 4), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    return canvas, figure.add_subplot(111)
+
+
+def drawKinetic(canvas, ax, x, y, thin):
+    ax.cla()
+    if thin:
+        x, y = decimate(x, y, ax.get_window_extent().width, logX=True)
+    ax.semilogx(x, y, 'bo', markersize=4)
+    canvas.draw()
+    return x, y
+
+
+@pytest.fixture(scope='module')
+def kineticTrace(completeKinetic):
+    data = kp.getKineticSlice(completeKinetic, 0., 0., integrated=True)
+    data = data[data.index > 0]
+    return data.index.values.astype(float), data.values
+
+
+@pytest.mark.parametrize('thin', [False, True], ids=['every_gate', 'decimated'])
+def test_draw_kinetic(benchmark, kineticAxes, kineticTrace, thin):
+    x, y = benchmark.pedantic(drawKinetic, args=kineticAxes+kineticTrace+(thin,), rounds=10, iterations=1, warmup_rounds=1)
+    benchmark.extra_info['pointsDrawn'] = len(x)
+
+
+def test_decimation_keeps_envelope(kineticTrace):
+    x, y = kineticTrace
+    thinX, thinY = decimate(x, y, WIDTH_PIXELS, logX=True)
+    assert len(thinX) <= 2*WIDTH_PIXELS+2
+    edges = np.linspace(np.log10(x.min()), np.log10(x.max()), WIDTH_PIXELS+1)
+    full = np.digitize(np.log10(x), edges[1:-1])
+    thin = np.digitize(np.log10(thinX), edges[1:-1])
+    for column in np.unique(full):
+        assert y[full == column].min() == thinY[thin == column].min()
+        assert y[full == column].max() == thinY[thin == column].max()
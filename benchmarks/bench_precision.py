@@ -0,0 +1,53 @@
+import tracemalloc
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from kineticDataset import KineticDataset
+
+'''
+Single against double precision storage over the whole chain, from raw
+segments to a calibrated kinetic slice. Peak memory is reported in the
+extra_info column of the results (pytest --benchmark-columns=... or the
+saved JSON).
+'''
+
+
+def runPipeline(generator, rawKinetics, dtype):
+    kinetics = {}
+    for index, (kinetic, background, startTime, gateStep) in enumerate(rawKinetics):
+        kinetic = KineticDataset.fromDataFrame(kinetic, dtype=dtype)
+        kp.addTimeAxis(kinetic, generator.timeZero, startTime, gateStep)
+        kp.removeCosmicRays(kinetic)
+        kinetics[index+1] = kp.subtractBackground(kinetic, background.values)
+    completeKinetic, sfs, overlappedTimes = kp.joinKinetics(kinetics)
+    kp.applyCalibration(completeKinetic, generator.calibration())
+    integrated = kp.getKineticSlice(completeKinetic, 0., 0., integrated=True)
+    return completeKinetic, sfs, integrated
+
+
+def peakMemory(func, *args):
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1]/2**20
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32], ids=['float64', 'float32'])
+def test_pipeline_precision(benchmark, generator, rawKinetics, dtype):
+    (completeKinetic, sfs, integrated), peak = peakMemory(runPipeline, generator, rawKinetics, dtype)
+    benchmark.extra_info['peakMemoryMB'] = peak
+    benchmark.extra_info['resultMB'] = completeKinetic.nbytes/2**20
+    benchmark.pedantic(runPipeline, args=(generator, rawKinetics, dtype), rounds=3)
+    assert completeKinetic.dtype == dtype
+
+
+def test_single_precision_agrees(generator, rawKinetics):
+    single = runPipeline(generator, rawKinetics, np.float32)
+    double = runPipeline(generator, rawKinetics, np.float64)
+    np.testing.assert_allclose(single[1]['sf'].values[1:].astype(float), double[1]['sf'].values[1:].astype(float), rtol=1e-4)
+    # late gates decay to ~0, so compare those against the peak of the trace
+    np.testing.assert_allclose(single[2].values, double[2].values, rtol=1e-4, atol=1e-5*np.abs(double[2].values).max())
+    scale = np.abs(double[0].data).max()
+    assert np.abs(single[0].data-double[0].data).max() < 1e-5*scale
@@ -0,0 +1,55 @@
+import sys
+import tracemalloc
+import numpy as np
+import pytest
+from stageProfiler import StageProfiler
+
+'''
+Overhead of the stage profiler on a cosmic ray sized stage, with and without
+tracemalloc, which is only switched on with --profile. And the peak memory
+it records for a stage must be that stage's own, not the largest seen so far.
+'''
+
+needsResetPeak = pytest.mark.skipif(sys.version_info < (3, 9), reason='tracemalloc.reset_peak needs Python 3.9')
+
+
+@pytest.fixture
+def untraced():
+    # leave tracing as it was found
+    tracing = tracemalloc.is_tracing()
+    yield
+    if not tracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def allocate(profiler, rows, columns):
+    with profiler.stage('allocate'):
+        data = np.ones((rows, columns))
+        data *= 2
+        del data
+
+
+@pytest.mark.parametrize('traceMemory', [False, True], ids=['untraced', 'traced'])
+def test_stage_overhead(benchmark, untraced, generator, traceMemory):
+    profiler = StageProfiler(traceMemory=traceMemory)
+    benchmark(allocate, profiler, generator.numGates, generator.numPixels)
+    record = profiler.records[-1]
+    assert record['wallTime'] > 0
+    if not profiler.traceMemory:
+        assert record['peakMemoryMB'] is None
+
+
+def test_tracing_opt_in(untraced):
+    tracing = tracemalloc.is_tracing()
+    StageProfiler(profile=False)
+    assert tracemalloc.is_tracing() == tracing
+
+
+@needsResetPeak
+def test_small_stage_after_large(untraced):
+    profiler = StageProfiler(traceMemory=True)
+    allocate(profiler, 2000, 2000)
+    allocate(profiler, 100, 100)
+    large, small = [record['peakMemoryMB'] for record in profiler.records]
+    assert large > 25
+    assert small < 1
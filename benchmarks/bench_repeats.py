@@ -0,0 +1,70 @@
+import tracemalloc
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from session import Session
+
+'''
+Averaging repeated acquisitions of each segment: reading every repeat into
+one stack and taking its mean and variance, as was done outside the app,
+against the running average of kineticPipeline.readRepeats, which holds one
+repeat at a time. The peak memory allocated by each is recorded. The
+variance of the average must match the noise put in, and be carried through
+the join both in memory and out of core.
+'''
+
+NUM_REPEATS = 4
+
+
+@pytest.fixture(scope='module')
+def repeatFiles(generator, tmp_path_factory):
+    directory = tmp_path_factory.mktemp('repeats_{0}x{1}'.format(generator.numPixels, generator.numGates))
+    return generator.writeRepeats(str(directory), NUM_REPEATS)
+
+
+def stacked(filepaths, numPixels):
+    stack = np.stack([kp.readKinetic(filepath, ',', nrows=numPixels).data for filepath in filepaths])
+    return stack.mean(axis=0), stack.var(axis=0, ddof=1)/len(filepaths)
+
+
+def streamed(filepaths, numPixels):
+    kinetic = kp.readRepeats(filepaths, ',', nrows=numPixels)
+    return kinetic.data, kinetic.variance
+
+
+@pytest.mark.parametrize('method', [stacked, streamed], ids=['stacked', 'streamed'])
+def test_average_repeats(benchmark, generator, repeatFiles, method):
+    filepaths = repeatFiles[0][0]
+    tracemalloc.start()
+    mean, variance = benchmark.pedantic(method, args=(filepaths, generator.numPixels), rounds=1, iterations=1)
+    benchmark.extra_info['peakMB'] = tracemalloc.get_traced_memory()[1]/2**20
+    tracemalloc.stop()
+    expectedMean, expectedVariance = stacked(filepaths, generator.numPixels)
+    np.testing.assert_allclose(mean, expectedMean)
+    np.testing.assert_allclose(variance, expectedVariance, rtol=1e-9, atol=1e-9*expectedVariance.max())
+
+
+def test_repeat_variance(generator, repeatFiles):
+    from scipy.stats import chi2
+    filepaths, backgroundPath, startTime, gateStep = repeatFiles[0]
+    kinetic = kp.readRepeats(filepaths, ',', nrows=generator.numPixels)
+    gain = generator.segments[0][3]
+    times = startTime+gateStep*np.arange(kinetic.shape[1])
+    # Poisson and read noise, averaged over the repeats
+    trueVariance = (np.clip(generator.cleanKinetic(times)*gain, 0, None)+generator.readNoise**2)/NUM_REPEATS
+    ratio = kinetic.variance/trueVariance
+    # the median is untouched by the odd cosmic ray
+    degrees = NUM_REPEATS-1
+    np.testing.assert_allclose(np.median(ratio), chi2.median(degrees)/degrees, rtol=0.05)
+
+
+def test_repeats_joined(generator, repeatFiles, tmp_path):
+    segments = [{'kinetic': filepaths[0], 'repeats': filepaths[1:], 'background': backgroundPath,
+                 'startTime': startTime, 'gateStep': gateStep}
+                for filepaths, backgroundPath, startTime, gateStep in repeatFiles]
+    session = Session(segments, generator.timeZero, removeCosmicRays=True)
+    completeKinetic = session.run()[0]
+    assert completeKinetic.variance is not None
+    outOfCore = session.runOutOfCore(str(tmp_path), blockColumns=16)[0]
+    np.testing.assert_allclose(outOfCore.data, completeKinetic.data)
+    np.testing.assert_allclose(outOfCore.variance, completeKinetic.variance)
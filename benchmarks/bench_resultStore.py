@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import sharedArrays
+from chunkedStore import ChunkedStore, saveResults
+from session import Session
+
+'''
+Opening saved results from an analysis script: parsing completeKinetic.csv,
+as notebooks did, against opening the results store written beside it,
+whose arrays are memmaps and so are read only as they are used. Several
+worker processes then open the same store at once.
+'''
+
+
+@pytest.fixture(scope='module')
+def savedResults(generator, ascFiles, tmp_path_factory):
+    files, calibrationPath = ascFiles
+    segments = [{'kinetic': kinetic, 'background': background, 'startTime': startTime, 'gateStep': gateStep}
+                for kinetic, background, startTime, gateStep in files]
+    session = Session(segments, generator.timeZero, removeCosmicRays=True)
+    stages = {}
+    completeKinetic, sfs, overlappedTimes = session.run(stages=stages)
+    directory = str(tmp_path_factory.mktemp('results'))
+    completeKinetic.toDataFrame().to_csv(os.path.join(directory, 'completeKinetic.csv'))
+    segments = {index: segmentStages['background'] for index, segmentStages in stages.items()}
+    saveResults(ChunkedStore(os.path.join(directory, 'results_store')), completeKinetic, sfs, overlappedTimes,
+                segments, stages)
+    return directory, completeKinetic, sfs, overlappedTimes
+
+
+def readCsv(directory):
+    return pd.read_csv(os.path.join(directory, 'completeKinetic.csv'), index_col=0).values
+
+
+def openStore(directory):
+    return ChunkedStore(os.path.join(directory, 'results_store'), mode='r').dataset('completeKinetic').data
+
+
+@pytest.mark.parametrize('method', [readCsv, openStore], ids=['csv', 'store'])
+def test_open_results(benchmark, savedResults, method):
+    directory, completeKinetic, sfs, overlappedTimes = savedResults
+    data = benchmark(method, directory)
+    np.testing.assert_allclose(data, completeKinetic.data)
+
+
+def test_results_contents(savedResults):
+    directory, completeKinetic, sfs, overlappedTimes = savedResults
+    store = ChunkedStore(os.path.join(directory, 'results_store'), mode='r')
+    kinetic = store.dataset('completeKinetic')
+    np.testing.assert_array_equal(kinetic.data, completeKinetic.data)
+    np.testing.assert_array_equal(kinetic.times, completeKinetic.times)
+    assert [step[0] for step in kinetic.history] == [step[0] for step in completeKinetic.history]
+    pd.testing.assert_frame_equal(store.table('scalingFactors'), sfs.astype(float), check_names=True)
+    assert store.attrs['overlappedTimes'] == overlappedTimes
+    assert {'segment2', 'segment2_read_kinetic', 'segment2_cosmic_rays'} <= set(store.datasets())
+    assert 'segment2_read_background' in store
+    with pytest.raises(OSError):
+        store.write('completeKinetic/data', np.zeros(3))
+
+
+def sumStore(directory):
+    return float(openStore(directory).sum(dtype=np.float64))
+
+
+def test_shared_readers(savedResults):
+    directory, completeKinetic, sfs, overlappedTimes = savedResults
+    with sharedArrays.makePool(2) as pool:
+        sums = pool.map(sumStore, [directory]*2)
+    assert sums == [sumStore(directory)]*2
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from session import Session
+import stageGraph
+from stageGraph import StageGraph
+
+'''
+Reopening a saved session: the whole chain run in a fresh StageGraph, as in
+a new app or a headless run, with the files parsed from scratch against
+read back from the session's parsed file cache. Both must give the same
+joined kinetic, and the cached run must not parse a single file.
+'''
+
+
+@pytest.fixture(scope='module')
+def savedSession(generator, ascFiles):
+    files, calibrationPath = ascFiles
+    segments = [{'kinetic': kinetic, 'background': background, 'startTime': startTime, 'gateStep': gateStep}
+                for kinetic, background, startTime, gateStep in files]
+    session = Session(segments, generator.timeZero, removeCosmicRays=True, calibration=calibrationPath)
+    path = os.path.join(os.path.dirname(files[0][0]), 'session.json')
+    session.save(path)
+    return path
+
+
+def runSession(path, cached):
+    session = Session.load(path)
+    graph = StageGraph(cacheDir=session.cacheDir if cached else None)
+    return session.run(graph)[0], graph
+
+
+@pytest.mark.parametrize('cached', [False, True], ids=['parsed', 'cached'])
+def test_reopen_session(benchmark, savedSession, cached):
+    runSession(savedSession, cached)
+    completeKinetic, graph = benchmark.pedantic(runSession, args=(savedSession, cached), rounds=3, iterations=1)
+    benchmark.extra_info['stepsReused'] = graph.hits
+    expected = runSession(savedSession, False)[0]
+    np.testing.assert_array_equal(completeKinetic.data, expected.data)
+    np.testing.assert_array_equal(completeKinetic.times, expected.times)
+
+
+def test_reopen_without_parsing(savedSession, monkeypatch):
+    runSession(savedSession, True)
+    parsed = []
+
+    def counting(read):
+        def counted(filepath, *args, **kwargs):
+            parsed.append(os.path.basename(filepath))
+            return read(filepath, *args, **kwargs)
+        return counted
+
+    monkeypatch.setattr(stageGraph, '_readKinetic', counting(stageGraph._readKinetic))
+    monkeypatch.setattr(stageGraph, '_readBackground', counting(stageGraph._readBackground))
+    runSession(savedSession, True)
+    assert parsed == []
+    runSession(savedSession, False)
+    assert len(parsed) == len(Session.load(savedSession).paths())-1
+
+
+def test_session_round_trip(savedSession):
+    session = Session.load(savedSession)
+    session.save(savedSession)
+    reloaded = Session.load(savedSession)
+    assert reloaded.segments == session.segments
+    assert reloaded.files == session.files
+    assert all(os.path.isabs(path) for path in reloaded.paths())
+
+
+def test_joined_denoise_reapplied(savedSession, tmp_path):
+    session = Session.load(savedSession)
+    session.joinedDenoiseRank = 3
+    path = str(tmp_path/'denoised.json')
+    session.save(path)
+    reloaded = Session.load(path)
+    assert reloaded.joinedDenoiseRank == 3
+    graph = StageGraph()
+    completeKinetic = reloaded.run(graph, calibrate=False)[0]
+    joined = Session.load(savedSession).run(StageGraph(), calibrate=False)[0]
+    np.testing.assert_allclose(completeKinetic.data, kp.denoiseSVD(joined.copy(deep=False), 3).data)
+    # denoised again after a reprocess, from the cache
+    misses = graph.misses
+    np.testing.assert_array_equal(reloaded.run(graph, calibrate=False)[0].data, completeKinetic.data)
+    assert graph.misses == misses
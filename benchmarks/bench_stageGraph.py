@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from syntheticData import SyntheticKineticGenerator
+from stageGraph import StageGraph
+
+'''
+Reprocessing with the memoised stage graph after a change to the last of
+four segments, against running the whole chain in a fresh graph. Only that
+segment's stages from the change on, and the join adding it, may be run
+again: every other segment and the earlier joins come from the cache. The
+same goes for putting segments back in order.
+'''
+
+
+class RecordingGraph(StageGraph):
+    '''
+    A StageGraph listing the stages it runs rather than takes from the cache.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        StageGraph.__init__(self, *args, **kwargs)
+        self.computed = []
+
+    def run(self, name, func, inputs=(), **params):
+        misses = self.misses
+        result = StageGraph.run(self, name, func, inputs, **params)
+        if self.misses > misses:
+            self.computed.append(name)
+        return result
+
+
+@pytest.fixture(scope='module')
+def fourSegments(generator, tmp_path_factory):
+    generator = SyntheticKineticGenerator(numPixels=generator.numPixels, numGates=generator.numGates, numSegments=4)
+    directory = tmp_path_factory.mktemp('four_{0}x{1}'.format(generator.numPixels, generator.numGates))
+    return generator, generator.writeDataset(str(directory))[0]
+
+
+def process(graph, generator, files):
+    segments = [graph.processSegment(kinetic, background, startTime, gateStep, generator.timeZero, ',',
+                                     removeCosmicRays=True, nrows=generator.numPixels)
+                for kinetic, background, startTime, gateStep in files]
+    return graph.join(segments)
+
+
+def changeLastGateStep(files):
+    kinetic, background, startTime, gateStep = files[-1]
+    return files[:-1]+[(kinetic, background, startTime, 2*gateStep)]
+
+
+def changeLastBackground(files):
+    kinetic, background, startTime, gateStep = files[-1]
+    return files[:-1]+[(kinetic, files[0][1], startTime, gateStep)]
+
+
+def warmGraph(generator, files):
+    graph = RecordingGraph()
+    process(graph, generator, files)
+    graph.computed = []
+    return (graph, generator, changeLastGateStep(files)), {}
+
+
+@pytest.mark.parametrize('cached', [False, True], ids=['scratch', 'cached'])
+def test_reprocess_late_segment(benchmark, fourSegments, cached):
+    generator, files = fourSegments
+    if cached:
+        setup = lambda: warmGraph(generator, files)
+    else:
+        setup = lambda: ((RecordingGraph(), generator, changeLastGateStep(files)), {})
+    completeKinetic, sfs, overlappedTimes = benchmark.pedantic(process, setup=setup, rounds=3, iterations=1)
+    expected = process(StageGraph(), generator, changeLastGateStep(files))[0]
+    np.testing.assert_array_equal(completeKinetic.data, expected.data)
+    np.testing.assert_array_equal(completeKinetic.times, expected.times)
+
+
+def test_changed_gate_step(fourSegments):
+    generator, files = fourSegments
+    (graph, generator, changed), _ = warmGraph(generator, files)
+    process(graph, generator, changed)
+    assert graph.computed == ['time axis', 'cosmic rays', 'background', 'join']
+
+
+def test_changed_background(fourSegments):
+    generator, files = fourSegments
+    (graph, generator, changed), _ = warmGraph(generator, files)
+    # the first segment's background, already read
+    process(graph, generator, changeLastBackground(files))
+    assert graph.computed == ['background', 'join']
+    expected = process(StageGraph(), generator, changeLastBackground(files))[0]
+    np.testing.assert_array_equal(process(graph, generator, changeLastBackground(files))[0].data, expected.data)
+    assert graph.computed == ['background', 'join']
+
+
+def test_reordered(fourSegments):
+    generator, files = fourSegments
+    graph = RecordingGraph()
+    # the last two loaded the wrong way round: the second join fails
+    with pytest.raises(kp.NoOverlapError, match='join 3'):
+        process(graph, generator, files[:2]+files[:1:-1])
+    assert graph.computed.count('join') == 1
+    graph.computed = []
+    completeKinetic = process(graph, generator, files)[0]
+    assert graph.computed == ['join', 'join']
+    np.testing.assert_array_equal(completeKinetic.data, process(StageGraph(), generator, files)[0].data)
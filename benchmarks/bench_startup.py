@@ -0,0 +1,45 @@
+import os
+import re
+import subprocess
+import sys
+import pytest
+
+'''
+Application start up. Each run imports the app in a fresh interpreter with
+python -X importtime, so nothing is already in sys.modules, and reports the
+slowest top level imports in the extra_info column. The modules that are
+meant to be loaded only when first used (scipy, pyplot) must not appear.
+'''
+
+pytest.importorskip('PyQt5')
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code')
+LAZY_MODULES = ['scipy', 'matplotlib.pyplot']
+IMPORT_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def importApp():
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    script = 'import sys, app; print([m for m in {0!r} if m in sys.modules])'.format(LAZY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                            cwd=CODE_DIR, env=env, capture_output=True, text=True, check=True)
+    return result
+
+
+def cumulativeTimes(stderr):
+    '''
+    Cumulative import time (ms) of each top level import from -X importtime.
+    '''
+    times = {}
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is not None and len(match.group(3)) == 1:
+            times[match.group(4)] = int(match.group(2))/1000
+    return times
+
+
+def test_startup(benchmark):
+    result = benchmark.pedantic(importApp, rounds=3, iterations=1)
+    assert result.stdout.strip() == '[]', 'loaded at start up: ' + result.stdout.strip()
+    times = cumulativeTimes(result.stderr)
+    benchmark.extra_info['importMs'] = dict(sorted(times.items(), key=lambda item: -item[1])[:10])
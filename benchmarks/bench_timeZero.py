@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import kineticPipeline as kp
+from kineticDataset import KineticDataset
+
+'''
+Finding time zero from the rise of the first kinetic, and moving it once the
+time axes are added: rebuilding each kinetic's DataFrame with new columns,
+as the app did, against offsetting the stored time axis with
+kineticPipeline.shiftTimeZero.
+'''
+
+
+@pytest.fixture(scope='module')
+def firstKinetic(rawKinetics):
+    kinetic, background, startTime, gateStep = rawKinetics[0]
+    return KineticDataset.fromDataFrame(kinetic), startTime, gateStep
+
+
+def test_estimate_time_zero(benchmark, generator, firstKinetic):
+    kinetic, startTime, gateStep = firstKinetic
+    timeZero = benchmark(kp.estimateTimeZero, kinetic, startTime, gateStep)
+    assert timeZero == pytest.approx(generator.timeZero, abs=0.05*gateStep)
+
+
+def test_time_zero_cosmic_ray(generator, firstKinetic):
+    kinetic, startTime, gateStep = firstKinetic
+    spiked = kinetic.copy()
+    # far larger than the whole signal, in a gate before the rise
+    spiked.data[10, 2] += 100*kinetic.data.sum(axis=0).max()
+    assert kp.estimateTimeZero(spiked, startTime, gateStep) == pytest.approx(generator.timeZero, abs=0.05*gateStep)
+    # no gates before the rise
+    with pytest.raises(ValueError):
+        kp.estimateTimeZero(KineticDataset(kinetic.data[:, 10:], kinetic.wavelengths), startTime, gateStep)
+
+
+def rebuild(kinetics, timeZero):
+    frames = []
+    for kinetic in kinetics.values():
+        metadata = kinetic.metadata
+        times = kp.constructTimeAxis(timeZero, metadata['startTime'], metadata['gateStep'], kinetic.shape[1])
+        frames.append(kinetic.toDataFrame(copy=True).set_axis(times, axis=1))
+    return frames
+
+
+def offset(kinetics, timeZero):
+    return [kp.shiftTimeZero(kinetic.copy(deep=False), timeZero).toDataFrame() for kinetic in kinetics.values()]
+
+
+@pytest.mark.parametrize('method', [rebuild, offset], ids=['rebuild', 'offset'])
+def test_shift_time_zero(benchmark, generator, preparedKinetics, method):
+    frames = benchmark(method, preparedKinetics, generator.timeZero+2.5)
+    for frame, kinetic in zip(frames, preparedKinetics.values()):
+        np.testing.assert_allclose(frame.columns.values, kinetic.times-2.5)
+        np.testing.assert_array_equal(frame.values, kinetic.data)
+
+
+def test_fractional_time_zero(generator, preparedKinetics):
+    expected, expectedSfs, expectedTimes = kp.joinKinetics(preparedKinetics)
+    timeZero = generator.timeZero+0.37
+    shifted = {index: kp.shiftTimeZero(kinetic.copy(deep=False), timeZero) for index, kinetic in preparedKinetics.items()}
+    rebuilt = {index: kp.addTimeAxis(kinetic.copy(deep=False), timeZero, kinetic.metadata['startTime'],
+                                     kinetic.metadata['gateStep'])
+               for index, kinetic in preparedKinetics.items()}
+    for kinetics in (shifted, rebuilt):
+        # the gates in both segments of each join still have exactly the same times
+        completeKinetic, sfs, overlappedTimes = kp.joinKinetics(kinetics)
+        np.testing.assert_allclose(completeKinetic.times, expected.times-0.37)
+        np.testing.assert_allclose(sfs['sf'].values[1:].astype(float), expectedSfs['sf'].values[1:].astype(float))
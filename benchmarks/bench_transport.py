@@ -0,0 +1,103 @@
+import os
+import pickle
+import numpy as np
+import pytest
+import kineticPipeline as kp
+import sharedArrays
+from kineticDataset import KineticDataset
+from stageGraph import StageGraph
+
+'''
+Handing a stack to worker processes: pickling each block of gates to the
+workers and their results back, against passing shared memory handles with
+sharedArrays.mapColumnBlocks. The copy stage does no work of its own, so it
+times the transfer alone; the cosmic ray stage shows how much of a real
+stage the transfer costs. The bytes pickled per call are in extra_info.
+A warm up round keeps the workers starting up out of the timings.
+'''
+
+pytestmark = pytest.mark.skipif(not sharedArrays.AVAILABLE, reason='shared memory needs Python 3.8 or later')
+
+NUM_PROCESSES = 2
+# as it was before any pool was made
+ORIGINAL_ENVIRONMENT = dict(os.environ)
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with sharedArrays.makePool(NUM_PROCESSES) as pool:
+        yield pool
+
+
+def copyBlock(block):
+    return np.array(block)
+
+
+def removeCosmicRaysBlock(block):
+    return kp._removeCosmicRaysBlock(block)
+
+
+def columnBlocks(data, numBlocks):
+    edges = np.linspace(0, data.shape[1], numBlocks+1).astype(int)
+    return [data[:, start:stop] for start, stop in zip(edges[:-1], edges[1:])]
+
+
+def mapPickled(func, data, pool):
+    return np.hstack(pool.map(func, columnBlocks(data, NUM_PROCESSES)))
+
+
+def mapShared(func, data, pool):
+    return sharedArrays.mapColumnBlocks(func, data, pool)
+
+
+STAGES = [pytest.param(copyBlock, id='copy'), pytest.param(removeCosmicRaysBlock, id='cosmic_rays')]
+TRANSPORTS = [pytest.param(mapPickled, id='pickle'), pytest.param(mapShared, id='shared')]
+
+
+@pytest.mark.parametrize('transport', TRANSPORTS)
+@pytest.mark.parametrize('func', STAGES)
+def test_transport(benchmark, pool, completeKinetic, func, transport):
+    data = completeKinetic.data
+    result = benchmark.pedantic(transport, args=(func, data, pool), rounds=5, iterations=1, warmup_rounds=1)
+    if transport is mapPickled:
+        sent = sum(len(pickle.dumps((func, block), protocol=pickle.HIGHEST_PROTOCOL)) for block in columnBlocks(data, NUM_PROCESSES))
+        sent += len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    else:
+        handle = sharedArrays.SharedArray('psm_00000000', data.shape, data.dtype)
+        sent = NUM_PROCESSES*len(pickle.dumps((func, handle, handle, 0, 0), protocol=pickle.HIGHEST_PROTOCOL))
+    benchmark.extra_info['pickledBytes'] = sent
+    np.testing.assert_array_equal(result, func(data))
+
+
+def test_parallel_cosmic_ray_removal(pool, rawKinetics):
+    kinetic = KineticDataset.fromDataFrame(rawKinetics[0][0])
+    parallel = kp.removeCosmicRays(kinetic.copy(), pool=pool)
+    serial = kp.removeCosmicRays(kinetic.copy())
+    assert parallel.data.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(parallel.data, serial.data)
+
+
+def test_stage_graph_pool(rawKinetics, monkeypatch):
+    kinetic = KineticDataset.fromDataFrame(rawKinetics[0][0])
+    graph = StageGraph(processes=NUM_PROCESSES)
+    try:
+        monkeypatch.setattr(sharedArrays, 'MIN_PARALLEL_GATES', kinetic.shape[1]+1)
+        assert graph.poolFor(kinetic) is None
+        monkeypatch.setattr(sharedArrays, 'MIN_PARALLEL_GATES', 1)
+        parallel = graph._removeCosmicRays(kinetic)
+        assert graph.poolFor(kinetic) is not None
+    finally:
+        graph.close()
+    # the workers' output, not a copy of it
+    assert isinstance(parallel.data.base, sharedArrays._Mapped)
+    np.testing.assert_array_equal(parallel.data, kp.removeCosmicRays(kinetic.copy()).data)
+    assert StageGraph(processes=None).processes >= 1
+
+
+def test_worker_threads(pool):
+    # the workers between them start no more threads than there are CPUs
+    threads = str(max((os.cpu_count() or 1)//NUM_PROCESSES, 1))
+    for name in sharedArrays.THREAD_VARIABLES:
+        assert pool.apply(os.getenv, (name,)) == threads
+        # and this process is left as it was
+        assert os.environ.get(name) == ORIGINAL_ENVIRONMENT.get(name)
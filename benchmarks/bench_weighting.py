@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from kineticSplice import KineticSplice, bootstrapScalingFactor, estimateVariance
+from session import Session
+
+'''
+Scaling factor fits with every pixel counted equally, as KineticSplice has
+always done, against fits weighted by the inverse variance of each pixel,
+estimated from shot and background noise. Many noisy draws of the same
+overlap give the spread of each, which weighting must reduce without
+biasing the factor. The bootstrap interval of a weighted factor must be
+centred on it, and cover the true factor as often as it claims to.
+'''
+
+NUM_DRAWS = 40
+# read noise of the kinetic and of its background file, both subtracted
+BACKGROUND_VARIANCE = 2*5.**2
+
+
+@pytest.fixture(scope='module')
+def cleanPair(generator):
+    (startTime, gateStep, numPoints, gain), (nextStartTime, nextGateStep, nextNumPoints, nextGain) = generator.segments[:2]
+    clean = generator.cleanKinetic([nextStartTime])[:, 0]
+    return np.clip(clean*gain, 0, None), np.clip(clean*nextGain, 0, None), gain/nextGain
+
+
+def noisyPairs(cleanPair, numDraws, seed=0):
+    rng = np.random.RandomState(seed)
+    for _ in range(numDraws):
+        yield tuple(rng.poisson(clean)+rng.normal(0, np.sqrt(BACKGROUND_VARIANCE), clean.shape) for clean in cleanPair[:2])
+
+
+def variances(pair):
+    return tuple(estimateVariance(spectrum) for spectrum in pair)
+
+
+def unweighted(pair):
+    return KineticSplice(pair).calculateScalingFactor()
+
+
+def weighted(pair):
+    return KineticSplice(pair, variances(pair)).calculateScalingFactor()
+
+
+@pytest.mark.parametrize('method', [unweighted, weighted], ids=['unweighted', 'weighted'])
+def test_splice_fit(benchmark, cleanPair, method):
+    pair = next(noisyPairs(cleanPair, 1))
+    scalingFactor, error = benchmark(method, pair)
+    assert scalingFactor == pytest.approx(cleanPair[2], rel=0.05)
+
+
+def test_weighted_spread(cleanPair):
+    draws = {method: np.array([method(pair)[0] for pair in noisyPairs(cleanPair, NUM_DRAWS)])
+             for method in (unweighted, weighted)}
+    assert draws[weighted].std() < draws[unweighted].std()
+    standardError = draws[weighted].std()/np.sqrt(NUM_DRAWS)
+    assert abs(draws[weighted].mean()-cleanPair[2]) < 4*standardError
+
+
+def test_weighted_bootstrap(benchmark, cleanPair):
+    pair = next(noisyPairs(cleanPair, 1))
+    low, high = benchmark(bootstrapScalingFactor, *pair, variances=variances(pair))
+    scalingFactor = weighted(pair)[0]
+    # centred on the weighted fit, not on one biased low
+    assert abs((low+high)/2-scalingFactor) < 0.05*(high-low)
+
+
+def test_weighted_interval_coverage(cleanPair):
+    covered = 0
+    for pair in noisyPairs(cleanPair, NUM_DRAWS):
+        low, high = bootstrapScalingFactor(*pair, numResamples=400, variances=variances(pair))
+        covered += low <= cleanPair[2] <= high
+    # 95% intervals
+    assert covered >= 0.85*NUM_DRAWS
+
+
+def test_estimate_variance(cleanPair):
+    data = next(noisyPairs(cleanPair, 1))[0]
+    ratio = estimateVariance(data)/(cleanPair[0]+BACKGROUND_VARIANCE)
+    np.testing.assert_allclose(np.median(ratio), 1, rtol=0.15)
+
+
+def test_weighted_out_of_core(generator, ascFiles, tmp_path):
+    files, calibrationPath = ascFiles
+    segments = [{'kinetic': kinetic, 'background': background, 'startTime': startTime, 'gateStep': gateStep}
+                for kinetic, background, startTime, gateStep in files]
+    session = Session(segments, generator.timeZero, removeCosmicRays=True, weighted=True)
+    completeKinetic, sfs, overlappedTimes = session.run()
+    outOfCore, outOfCoreSfs, outOfCoreTimes = session.runOutOfCore(str(tmp_path), blockColumns=64)
+    np.testing.assert_allclose(outOfCoreSfs['sf'].values[1:].astype(float), sfs['sf'].values[1:].astype(float))
+    np.testing.assert_allclose(outOfCore.data, completeKinetic.data)
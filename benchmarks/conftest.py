@@ -0,0 +1,56 @@
+import os
+import sys
+import pytest
+
+# No display needed: matplotlib must not try to open a window
+os.environ.setdefault('MPLBACKEND', 'Agg')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+
+from syntheticData import SyntheticKineticGenerator
+import kineticPipeline as kp
+from kineticDataset import KineticDataset
+
+# (pixels, gates) from a small test detector up to a full kinetic series
+SIZES = [
+    pytest.param((256, 50), id='256x50'),
+    pytest.param((1024, 500), id='1024x500'),
+    pytest.param((2048, 5000), id='2048x5000', marks=pytest.mark.large),
+]
+
+
+@pytest.fixture(scope='session', params=SIZES)
+def generator(request):
+    numPixels, numGates = request.param
+    return SyntheticKineticGenerator(numPixels=numPixels, numGates=numGates)
+
+
+@pytest.fixture(scope='session')
+def rawKinetics(generator):
+    return generator.kinetics()
+
+
+@pytest.fixture(scope='session')
+def ascFiles(generator, tmp_path_factory):
+    directory = tmp_path_factory.mktemp('asc_{0}x{1}'.format(generator.numPixels, generator.numGates))
+    return generator.writeDataset(str(directory))
+
+
+@pytest.fixture(scope='session')
+def preparedKinetics(generator, rawKinetics):
+    '''
+    Time axes added, cosmic rays removed and backgrounds subtracted, ready
+    to join.
+    '''
+    kinetics = {}
+    for index, (kinetic, background, startTime, gateStep) in enumerate(rawKinetics):
+        kinetic = KineticDataset.fromDataFrame(kinetic)
+        kp.addTimeAxis(kinetic, generator.timeZero, startTime, gateStep)
+        kp.removeCosmicRays(kinetic)
+        kinetics[index+1] = kp.subtractBackground(kinetic, background.values)
+    return kinetics
+
+
+@pytest.fixture(scope='session')
+def completeKinetic(preparedKinetics):
+    return kp.joinKinetics(preparedKinetics)[0]
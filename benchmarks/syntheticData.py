@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import pandas as pd
+
+'''
+Generator for realistic synthetic iCCD kinetic stacks, written out in the same
+layout as the Andor batch conversion .asc files so that the whole pipeline,
+from parsing onwards, can be exercised without lab data.
+'''
+
+
+class SyntheticKineticGenerator(object):
+    '''
+    Builds a spliceable series of kinetics from a handful of Gaussian emission
+    bands, each decaying with its own multi-exponential kinetic.
+
+    Parameters
+    ----------
+    numPixels : int
+        Number of detector pixels (rows of each kinetic).
+    numGates : int
+        Total number of gates across all segments (columns once spliced).
+    numSegments : int
+        Number of kinetic files the acquisition is split into. Consecutive
+        segments overlap in time by overlapGates gates.
+    overlapGates : int
+        Number of gates shared by consecutive segments.
+    wavelengthRange : tuple
+        First and last wavelength (nm) of the detector.
+    seed : int
+        Seed for the random number generator, so runs are reproducible.
+    '''
+
+    def __init__(self, numPixels=1024, numGates=100, numSegments=3, overlapGates=2,
+                 wavelengthRange=(400., 800.), seed=0):
+        self.numPixels = numPixels
+        self.numGates = numGates
+        self.numSegments = numSegments
+        self.overlapGates = overlapGates
+        self.seed = seed
+        self.rng = np.random.RandomState(seed)
+        self.wavelengths = np.round(np.linspace(wavelengthRange[0], wavelengthRange[1], numPixels), 4)
+        span = wavelengthRange[1]-wavelengthRange[0]
+        # (centre, width, amplitude, [(fraction, lifetime ns), ...]) per band
+        self.bands = [
+            (wavelengthRange[0]+0.35*span, 0.05*span, 5000., [(0.7, 5.), (0.3, 80.)]),
+            (wavelengthRange[0]+0.6*span, 0.08*span, 2000., [(0.4, 20.), (0.6, 600.)]),
+            (wavelengthRange[0]+0.8*span, 0.03*span, 800., [(1.0, 3000.)]),
+        ]
+        self.darkLevel = 300.
+        self.readNoise = 5.
+        self.cosmicRayRate = 1e-4
+        self.timeZero = 10
+        self.segments = self._segmentTimings()
+
+    def _segmentTimings(self):
+        '''
+        Start time, gate step, number of gates and relative gain of each
+        segment. Later segments use coarser gate steps and more accumulations
+        (higher gain), as in the lab, so there is something for the splice to
+        recover.
+        '''
+        gatesPerSegment = int(np.ceil((self.numGates+(self.numSegments-1)*self.overlapGates)/self.numSegments))
+        segments = []
+        startTime = 0
+        gateStep = 1
+        for segment in range(self.numSegments):
+            gain = 3.**segment
+            segments.append((startTime, gateStep, gatesPerSegment, gain))
+            endTime = startTime+(gatesPerSegment-self.overlapGates)*gateStep
+            gateStep *= 4
+            # start on a multiple of the next gate step so overlaps share exact times
+            startTime = endTime-(endTime % gateStep)
+        return segments
+
+    def spectra(self, wavelengths=None):
+        '''
+        Unit-amplitude Gaussian band shapes, shape (numBands, numPixels), at
+        the detector wavelengths unless others are given.
+        '''
+        if wavelengths is None:
+            wavelengths = self.wavelengths
+        centres = np.array([band[0] for band in self.bands])[:, None]
+        widths = np.array([band[1] for band in self.bands])[:, None]
+        return np.exp(-0.5*((wavelengths[None, :]-centres)/widths)**2)
+
+    def decays(self, times):
+        '''
+        Multi-exponential decay of each band with an instantaneous rise at
+        timeZero, shape (numBands, len(times)).
+        '''
+        times = np.asarray(times, dtype=float)-self.timeZero
+        decays = np.zeros((len(self.bands), len(times)))
+        for i, band in enumerate(self.bands):
+            for fraction, lifetime in band[3]:
+                decays[i] += fraction*np.exp(-np.clip(times, 0, None)/lifetime)
+            decays[i] *= band[2]
+        decays[:, times < 0] = 0
+        return decays
+
+    def cleanKinetic(self, times, wavelengths=None):
+        '''
+        Noise free signal, shape (numPixels, len(times)).
+        '''
+        return self.spectra(wavelengths).T.dot(self.decays(times))
+
+    def _addNoiseAndSpikes(self, data):
+        data = self.rng.poisson(np.clip(data, 0, None)).astype(float)
+        data += self.darkLevel+self.rng.normal(0, self.readNoise, data.shape)
+        numSpikes = self.rng.poisson(self.cosmicRayRate*data.size)
+        rows = self.rng.randint(0, data.shape[0], numSpikes)
+        cols = self.rng.randint(0, data.shape[1], numSpikes)
+        data[rows, cols] += self.rng.uniform(5e3, 5e4, numSpikes)
+        return data
+
+    def background(self):
+        '''
+        Single-column background: dark level, a weak sloping stray light
+        contribution and read noise.
+        '''
+        stray = 20.*np.linspace(0, 1, self.numPixels)
+        return self.darkLevel+stray+self.rng.normal(0, self.readNoise, self.numPixels)
+
+    def kinetics(self, seed=None, wavelengthShifts=None):
+        '''
+        Raw segments as they would be read from file: gate numbers 1..N as
+        columns, wavelengths as the index, plus the matching background.
+        Another seed gives another acquisition of the same signal.
+        wavelengthShifts (nm, one per segment) move each segment's detector
+        axis, as a shift in the grating calibration between files would.
+
+        Returns
+        -------
+        out : list of (kinetic DataFrame, background Series, startTime, gateStep)
+        '''
+        # the same noise every call, whichever fixtures happened to run first
+        self.rng = np.random.RandomState(self.seed if seed is None else seed)
+        if wavelengthShifts is None:
+            wavelengthShifts = [0.]*len(self.segments)
+        out = []
+        for (startTime, gateStep, numPoints, gain), shift in zip(self.segments, wavelengthShifts):
+            times = startTime+gateStep*np.arange(numPoints)
+            wavelengths = np.round(self.wavelengths+shift, 4)
+            stray = 20.*np.linspace(0, 1, self.numPixels)[:, None]
+            data = self._addNoiseAndSpikes(self.cleanKinetic(times, wavelengths)*gain)+stray
+            kinetic = pd.DataFrame(data, index=wavelengths, columns=np.arange(1, numPoints+1))
+            background = pd.Series(self.background(), index=wavelengths, name=1)
+            out.append((kinetic, background, startTime, gateStep))
+        return out
+
+    def calibration(self, numPoints=200):
+        '''
+        Smooth spectral sensitivity correction covering the detector range,
+        in the format of the files in calibration_files.
+        '''
+        wavelengths = np.linspace(self.wavelengths[0]-5, self.wavelengths[-1]+5, numPoints)
+        correction = 1.+0.5*np.sin(np.linspace(0, np.pi, numPoints))
+        return pd.Series(correction, index=wavelengths)
+
+    @staticmethod
+    def writeAsc(data, filepath, delimiter=','):
+        '''
+        Write a kinetic or background in the Andor .asc layout, including the
+        trailing delimiter at the end of every line.
+        '''
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        table = np.column_stack([data.index.values, data.values])
+        fmt = ['%.4f']+['%.1f']*data.shape[1]
+        np.savetxt(filepath, table, fmt=fmt, delimiter=delimiter, newline=delimiter+'\n')
+
+    def writeDataset(self, directory, delimiter=','):
+        '''
+        Write every segment and background as .asc files, plus the calibration
+        as .csv, into directory.
+
+        Returns
+        -------
+        out : list of (kineticPath, backgroundPath, startTime, gateStep), calibrationPath
+        '''
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        files = []
+        for i, (kinetic, background, startTime, gateStep) in enumerate(self.kinetics()):
+            kineticPath = os.path.join(directory, 'kinetic_{0}.asc'.format(i+1))
+            backgroundPath = os.path.join(directory, 'background_{0}.asc'.format(i+1))
+            self.writeAsc(kinetic, kineticPath, delimiter)
+            self.writeAsc(background, backgroundPath, delimiter)
+            files.append((kineticPath, backgroundPath, startTime, gateStep))
+        calibrationPath = os.path.join(directory, 'calibration.csv')
+        self.calibration().to_csv(calibrationPath, header=False)
+        return files, calibrationPath
+
+    def writeRepeats(self, directory, numRepeats=4, delimiter=','):
+        '''
+        Write numRepeats acquisitions of every segment, each with its own
+        noise and cosmic rays, and one background per segment.
+
+        Returns
+        -------
+        out : list of (list of kineticPath, backgroundPath, startTime, gateStep)
+        '''
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        files = []
+        for repeat in range(numRepeats):
+            for i, (kinetic, background, startTime, gateStep) in enumerate(self.kinetics(seed=self.seed+repeat)):
+                kineticPath = os.path.join(directory, 'kinetic_{0}_repeat{1}.asc'.format(i+1, repeat+1))
+                self.writeAsc(kinetic, kineticPath, delimiter)
+                if repeat == 0:
+                    backgroundPath = os.path.join(directory, 'background_{0}.asc'.format(i+1))
+                    self.writeAsc(background, backgroundPath, delimiter)
+                    files.append(([], backgroundPath, startTime, gateStep))
+                files[i][0].append(kineticPath)
+        return files
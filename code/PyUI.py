@@ -2,7 +2,7 @@
 
 # Form implementation generated from reading ui file 'app.ui'
 #
-# Created by: PyQt5 UI code generator 5.15.10
+# Created by: PyQt5 UI code generator 5.15.11
 #
 # WARNING: Any manual changes made to this file will be lost when pyuic5 is
 # run again.  Do not edit this file unless you know what you are doing.
@@ -351,7 +351,7 @@ class Ui_MainWindow(object):
         self.dataCorrectionGbox.setSizePolicy(sizePolicy)
         self.dataCorrectionGbox.setObjectName("dataCorrectionGbox")
         self.layoutWidget1 = QtWidgets.QWidget(self.dataCorrectionGbox)
-        self.layoutWidget1.setGeometry(QtCore.QRect(8, 20, 521, 76))
+        self.layoutWidget1.setGeometry(QtCore.QRect(8, 20, 521, 114))
         self.layoutWidget1.setObjectName("layoutWidget1")
         self.verticalLayout_7 = QtWidgets.QVBoxLayout(self.layoutWidget1)
         self.verticalLayout_7.setContentsMargins(0, 0, 0, 0)
@@ -449,6 +449,35 @@ class Ui_MainWindow(object):
         self.saveDataButton.setObjectName("saveDataButton")
         self.horizontalLayout_5.addWidget(self.saveDataButton)
         self.verticalLayout_7.addLayout(self.horizontalLayout_5)
+        self.horizontalLayout_12 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_12.setObjectName("horizontalLayout_12")
+        self.roiCheckBox = QtWidgets.QCheckBox(self.layoutWidget1)
+        self.roiCheckBox.setObjectName("roiCheckBox")
+        self.horizontalLayout_12.addWidget(self.roiCheckBox)
+        self.roiMinSpinBox = QtWidgets.QDoubleSpinBox(self.layoutWidget1)
+        self.roiMinSpinBox.setDecimals(1)
+        self.roiMinSpinBox.setMaximum(10000.0)
+        self.roiMinSpinBox.setProperty("value", 400.0)
+        self.roiMinSpinBox.setObjectName("roiMinSpinBox")
+        self.horizontalLayout_12.addWidget(self.roiMinSpinBox)
+        self.roi_to_label = QtWidgets.QLabel(self.layoutWidget1)
+        self.roi_to_label.setObjectName("roi_to_label")
+        self.horizontalLayout_12.addWidget(self.roi_to_label)
+        self.roiMaxSpinBox = QtWidgets.QDoubleSpinBox(self.layoutWidget1)
+        self.roiMaxSpinBox.setDecimals(1)
+        self.roiMaxSpinBox.setMaximum(10000.0)
+        self.roiMaxSpinBox.setProperty("value", 600.0)
+        self.roiMaxSpinBox.setObjectName("roiMaxSpinBox")
+        self.horizontalLayout_12.addWidget(self.roiMaxSpinBox)
+        self.binning_label = QtWidgets.QLabel(self.layoutWidget1)
+        self.binning_label.setObjectName("binning_label")
+        self.horizontalLayout_12.addWidget(self.binning_label)
+        self.binningSpinBox = QtWidgets.QSpinBox(self.layoutWidget1)
+        self.binningSpinBox.setMinimum(1)
+        self.binningSpinBox.setMaximum(64)
+        self.binningSpinBox.setObjectName("binningSpinBox")
+        self.horizontalLayout_12.addWidget(self.binningSpinBox)
+        self.verticalLayout_7.addLayout(self.horizontalLayout_12)
         self.verticalLayout_16.addWidget(self.dataCorrectionGbox)
         self.kineticsGbox = QtWidgets.QGroupBox(self.centralwidget)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
@@ -540,8 +569,8 @@ class Ui_MainWindow(object):
         self.verticalLayout_4.addWidget(self.kineticDisplay)
         self.verticalLayout_4.setStretch(1, 1)
         self.verticalLayout_16.addWidget(self.kineticsGbox)
-        self.verticalLayout_16.setStretch(0, 2)
-        self.verticalLayout_16.setStretch(1, 7)
+        self.verticalLayout_16.setStretch(0, 1)
+        self.verticalLayout_16.setStretch(1, 3)
         self.horizontalLayout_11.addLayout(self.verticalLayout_16)
         self.horizontalLayout_11.setStretch(0, 1)
         self.horizontalLayout_11.setStretch(1, 1)
@@ -551,6 +580,94 @@ class Ui_MainWindow(object):
         self.statusBar = QtWidgets.QStatusBar(MainWindow)
         self.statusBar.setObjectName("statusBar")
         MainWindow.setStatusBar(self.statusBar)
+        self.menuBar = QtWidgets.QMenuBar(MainWindow)
+        self.menuBar.setGeometry(QtCore.QRect(0, 0, 1097, 21))
+        self.menuBar.setObjectName("menuBar")
+        self.menuFile = QtWidgets.QMenu(self.menuBar)
+        self.menuFile.setObjectName("menuFile")
+        self.menuLive = QtWidgets.QMenu(self.menuBar)
+        self.menuLive.setObjectName("menuLive")
+        self.menuView = QtWidgets.QMenu(self.menuBar)
+        self.menuView.setObjectName("menuView")
+        self.menuProcess = QtWidgets.QMenu(self.menuBar)
+        self.menuProcess.setObjectName("menuProcess")
+        MainWindow.setMenuBar(self.menuBar)
+        self.heatmapDock = QtWidgets.QDockWidget(MainWindow)
+        self.heatmapDock.setFeatures(QtWidgets.QDockWidget.DockWidgetFloatable|QtWidgets.QDockWidget.DockWidgetMovable)
+        self.heatmapDock.setObjectName("heatmapDock")
+        self.heatmapDockContents = QtWidgets.QWidget()
+        self.heatmapDockContents.setObjectName("heatmapDockContents")
+        self.verticalLayout_26 = QtWidgets.QVBoxLayout(self.heatmapDockContents)
+        self.verticalLayout_26.setObjectName("verticalLayout_26")
+        self.heatmapDisplay = MplWidget(self.heatmapDockContents)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.heatmapDisplay.sizePolicy().hasHeightForWidth())
+        self.heatmapDisplay.setSizePolicy(sizePolicy)
+        self.heatmapDisplay.setMinimumSize(QtCore.QSize(400, 300))
+        self.heatmapDisplay.setObjectName("heatmapDisplay")
+        self.verticalLayout_26.addWidget(self.heatmapDisplay)
+        self.heatmapDock.setWidget(self.heatmapDockContents)
+        MainWindow.addDockWidget(QtCore.Qt.DockWidgetArea(2), self.heatmapDock)
+        self.actionOpenSession = QtWidgets.QAction(MainWindow)
+        self.actionOpenSession.setObjectName("actionOpenSession")
+        self.actionSaveSession = QtWidgets.QAction(MainWindow)
+        self.actionSaveSession.setObjectName("actionSaveSession")
+        self.actionSubmitJob = QtWidgets.QAction(MainWindow)
+        self.actionSubmitJob.setObjectName("actionSubmitJob")
+        self.actionReprocess = QtWidgets.QAction(MainWindow)
+        self.actionReprocess.setObjectName("actionReprocess")
+        self.actionRebinLogTime = QtWidgets.QAction(MainWindow)
+        self.actionRebinLogTime.setEnabled(False)
+        self.actionRebinLogTime.setObjectName("actionRebinLogTime")
+        self.actionSvdDenoise = QtWidgets.QAction(MainWindow)
+        self.actionSvdDenoise.setEnabled(False)
+        self.actionSvdDenoise.setObjectName("actionSvdDenoise")
+        self.actionFitDecays = QtWidgets.QAction(MainWindow)
+        self.actionFitDecays.setEnabled(False)
+        self.actionFitDecays.setObjectName("actionFitDecays")
+        self.actionSinglePrecision = QtWidgets.QAction(MainWindow)
+        self.actionSinglePrecision.setCheckable(True)
+        self.actionSinglePrecision.setObjectName("actionSinglePrecision")
+        self.actionFindTimeZero = QtWidgets.QAction(MainWindow)
+        self.actionFindTimeZero.setEnabled(False)
+        self.actionFindTimeZero.setObjectName("actionFindTimeZero")
+        self.actionShowHeatmap = QtWidgets.QAction(MainWindow)
+        self.actionShowHeatmap.setCheckable(True)
+        self.actionShowHeatmap.setObjectName("actionShowHeatmap")
+        self.actionBootstrap = QtWidgets.QAction(MainWindow)
+        self.actionBootstrap.setCheckable(True)
+        self.actionBootstrap.setObjectName("actionBootstrap")
+        self.actionWeightedSplicing = QtWidgets.QAction(MainWindow)
+        self.actionWeightedSplicing.setCheckable(True)
+        self.actionWeightedSplicing.setObjectName("actionWeightedSplicing")
+        self.actionSnrOverlapSelection = QtWidgets.QAction(MainWindow)
+        self.actionSnrOverlapSelection.setCheckable(True)
+        self.actionSnrOverlapSelection.setObjectName("actionSnrOverlapSelection")
+        self.actionWatchFolder = QtWidgets.QAction(MainWindow)
+        self.actionWatchFolder.setCheckable(True)
+        self.actionWatchFolder.setObjectName("actionWatchFolder")
+        self.menuFile.addAction(self.actionOpenSession)
+        self.menuFile.addAction(self.actionSaveSession)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionSubmitJob)
+        self.menuLive.addAction(self.actionWatchFolder)
+        self.menuView.addAction(self.actionShowHeatmap)
+        self.menuProcess.addAction(self.actionReprocess)
+        self.menuProcess.addAction(self.actionFindTimeZero)
+        self.menuProcess.addAction(self.actionRebinLogTime)
+        self.menuProcess.addAction(self.actionSvdDenoise)
+        self.menuProcess.addAction(self.actionFitDecays)
+        self.menuProcess.addSeparator()
+        self.menuProcess.addAction(self.actionSinglePrecision)
+        self.menuProcess.addAction(self.actionBootstrap)
+        self.menuProcess.addAction(self.actionWeightedSplicing)
+        self.menuProcess.addAction(self.actionSnrOverlapSelection)
+        self.menuBar.addAction(self.menuFile.menuAction())
+        self.menuBar.addAction(self.menuProcess.menuAction())
+        self.menuBar.addAction(self.menuLive.menuAction())
+        self.menuBar.addAction(self.menuView.menuAction())
 
         self.retranslateUi(MainWindow)
         QtCore.QMetaObject.connectSlotsByName(MainWindow)
@@ -590,6 +707,11 @@ class Ui_MainWindow(object):
         self.background_end_label.setText(_translate("MainWindow", "Background data up to time:"))
         self.backgroundSubtractButton.setText(_translate("MainWindow", "Subtract Backgrounds"))
         self.saveDataButton.setText(_translate("MainWindow", "SAVE DATA"))
+        self.roiCheckBox.setToolTip(_translate("MainWindow", "Only load this wavelength range; every later step then works on the smaller array"))
+        self.roiCheckBox.setText(_translate("MainWindow", "ROI (nm):"))
+        self.roi_to_label.setText(_translate("MainWindow", "to"))
+        self.binning_label.setText(_translate("MainWindow", "Pixel binning:"))
+        self.binningSpinBox.setToolTip(_translate("MainWindow", "Sum this many adjacent pixels into one when loading"))
         self.kineticsGbox.setTitle(_translate("MainWindow", "Kinetics"))
         self.label.setText(_translate("MainWindow", "Wavelength"))
         self.label_2.setText(_translate("MainWindow", "Average +/-"))
@@ -599,4 +721,42 @@ class Ui_MainWindow(object):
         self.kineticNormalisedCheckBox.setText(_translate("MainWindow", "Normalised"))
         self.saveKineticButton.setText(_translate("MainWindow", "SAVE KINETIC"))
         self.resetButton.setText(_translate("MainWindow", "RESET"))
+        self.menuFile.setTitle(_translate("MainWindow", "File"))
+        self.menuLive.setTitle(_translate("MainWindow", "Live"))
+        self.menuView.setTitle(_translate("MainWindow", "View"))
+        self.menuProcess.setTitle(_translate("MainWindow", "Process"))
+        self.heatmapDock.setWindowTitle(_translate("MainWindow", "Heatmap"))
+        self.actionOpenSession.setText(_translate("MainWindow", "Open Session..."))
+        self.actionOpenSession.setToolTip(_translate("MainWindow", "Restore the files and settings of a saved session and process them"))
+        self.actionOpenSession.setShortcut(_translate("MainWindow", "Ctrl+O"))
+        self.actionSaveSession.setText(_translate("MainWindow", "Save Session..."))
+        self.actionSaveSession.setToolTip(_translate("MainWindow", "Save the file list and every setting, to reprocess them later in one step"))
+        self.actionSaveSession.setShortcut(_translate("MainWindow", "Ctrl+S"))
+        self.actionSubmitJob.setText(_translate("MainWindow", "Submit to Job Server"))
+        self.actionSubmitJob.setToolTip(_translate("MainWindow", "Queue the files and settings on this PC\'s job server (jobServer.py) rather than processing them here; the results are saved beside the data"))
+        self.actionReprocess.setText(_translate("MainWindow", "Reprocess"))
+        self.actionReprocess.setToolTip(_translate("MainWindow", "Rerun the whole chain with the current file order, times and settings, reusing every unchanged step"))
+        self.actionReprocess.setShortcut(_translate("MainWindow", "Ctrl+R"))
+        self.actionRebinLogTime.setText(_translate("MainWindow", "Rebin Log Time..."))
+        self.actionRebinLogTime.setToolTip(_translate("MainWindow", "Average the joined kinetic onto a log spaced time axis, with the variance of each point"))
+        self.actionSvdDenoise.setText(_translate("MainWindow", "SVD Denoise..."))
+        self.actionSvdDenoise.setToolTip(_translate("MainWindow", "Keep only the largest singular components of each kinetic (before joining) or of the joined kinetic, chosen from a scree plot"))
+        self.actionFitDecays.setText(_translate("MainWindow", "Fit Decays..."))
+        self.actionFitDecays.setToolTip(_translate("MainWindow", "Fit an exponential decay to every wavelength of the joined kinetic and save the lifetime map"))
+        self.actionSinglePrecision.setText(_translate("MainWindow", "Single Precision (float32)"))
+        self.actionSinglePrecision.setToolTip(_translate("MainWindow", "Store kinetics in single precision to halve memory use on large stacks; takes effect on the next load"))
+        self.actionFindTimeZero.setText(_translate("MainWindow", "Find Time Zero"))
+        self.actionFindTimeZero.setToolTip(_translate("MainWindow", "Set time zero to the rise of the first kinetic; time axes already added are shifted to it"))
+        self.actionFindTimeZero.setShortcut(_translate("MainWindow", "Ctrl+T"))
+        self.actionShowHeatmap.setText(_translate("MainWindow", "Heatmap"))
+        self.actionShowHeatmap.setToolTip(_translate("MainWindow", "Show the whole plotted kinetic against wavelength and log time; click or drag on it to pick the time slice and kinetic"))
+        self.actionShowHeatmap.setShortcut(_translate("MainWindow", "Ctrl+H"))
+        self.actionBootstrap.setText(_translate("MainWindow", "Bootstrap Scaling Factor Intervals"))
+        self.actionBootstrap.setToolTip(_translate("MainWindow", "Add bootstrap 95% confidence intervals of the scaling factors to scaling_factors.csv"))
+        self.actionWeightedSplicing.setText(_translate("MainWindow", "Noise-Weighted Splicing"))
+        self.actionWeightedSplicing.setToolTip(_translate("MainWindow", "Weight each pixel in the scaling factor fits by its inverse variance, so the noisy wings of the spectra hardly count"))
+        self.actionSnrOverlapSelection.setText(_translate("MainWindow", "Best Overlap Gates (SNR)"))
+        self.actionSnrOverlapSelection.setToolTip(_translate("MainWindow", "Fit each scaling factor to the overlapping gates with the best signal-to-noise rather than the earliest, recording them in scaling_factors.csv and overlappedTimes.txt"))
+        self.actionWatchFolder.setText(_translate("MainWindow", "Watch Folder..."))
+        self.actionWatchFolder.setToolTip(_translate("MainWindow", "Splice each new .asc file in a folder as soon as it is written"))
 from mplwidget import MplWidget
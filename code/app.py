@@ -2,19 +2,29 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-from matplotlib import pyplot as plt
-from scipy.interpolate import UnivariateSpline as Spline
 from PyQt5 import QtCore, QtGui, QtWidgets
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.ticker import FuncFormatter, MultipleLocator
 from PyUI import Ui_MainWindow
-from kineticSplice import KineticSplice
-from cosmicRayRemoval import CosmicRayRemoval
-import ctypes
-ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID('app')
+import kineticPipeline as kp
+from stageProfiler import StageProfiler, shapeOf
+from liveSplice import LiveSplicer, FolderWatcher, parseSegmentName
+from stageGraph import StageGraph
+from plotDecimation import decimate
+from heatmapPyramid import HeatmapPyramid
+from decayFitting import DecayFit
+from session import Session
+from chunkedStore import ChunkedStore, saveResults, RESULTS_FOLDER
+from jobServer import JobClient, JobServerError
+if sys.platform == 'win32':
+    # own taskbar icon rather than python's
+    import ctypes
+    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID('app')
 
 
 class App(QtWidgets.QMainWindow, Ui_MainWindow):
 
-    def __init__(self):
+    def __init__(self, profile=False, processes=1):
         QtWidgets.QMainWindow.__init__(self)
         Ui_MainWindow.__init__(self)
         self.setupUi(self)
@@ -24,6 +34,18 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.timeSlicePlot = self.timeSliceDisplay.canvas
         self.scaleIndividualTimeSlices = False
         self.kineticsPlot = self.kineticDisplay.canvas
+        self.heatmapPlot = self.heatmapDisplay.canvas
+        # pan and zoom for the heatmap
+        self.heatmapToolbar = NavigationToolbar(self.heatmapPlot, self.heatmapDisplay)
+        self.heatmapDisplay.vbl.insertWidget(0, self.heatmapToolbar)
+        self.heatmapDock.hide()
+        # the left button is held after a press on the heatmap
+        self.heatmapDragging = False
+        self.profileStages = profile
+        # worker processes for long kinetics, if asked for with --processes
+        self.stageGraph = StageGraph(processes=processes)
+        self.jobClient = JobClient(timeout=2.)
+        self.submittedJobs = []
         self.setConnections()
         self.initialiseDataStorage()
         self.setupDelimiters()
@@ -35,11 +57,24 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
 
     def initialiseDataStorage(self):
         self.kineticsFilepathsDict = {}
+        self.repeatFilepathsDict = {}
         self.backgroundFilepathsDict = {}
         self.kineticsDict = {}
         self.sliderKeys = {}
         self.dataToPlot = pd.DataFrame()
+        self.varianceToPlot = None
+        self.plottedKinetic = None
+        self.heatmapPyramid = None
+        self.completeKinetic = None
         self.overlappingTimesList = []
+        self.scalingFactors = None
+        self.segmentStages = {}
+        self.profiler = StageProfiler(profile=self.profileStages, traceMemory=self.profileStages)
+        self.liveSplicer = None
+        self.folderWatcher = None
+        self.cosmicRaysRemoved = False
+        self.segmentDenoiseRank = None
+        self.joinedDenoiseRank = None
 
     def setConnections(self):
         self.calibrationFileBrowseButton.clicked.connect(self.calibrationBrowse)
@@ -76,6 +111,27 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.kineticIntegratedCheckBox.clicked.connect(self.plotKinetic)
         self.saveKineticButton.clicked.connect(self.saveKineticSlice)
         self.resetButton.clicked.connect(self.resetApp)
+        self.actionReprocess.triggered.connect(self.reprocess)
+        self.actionOpenSession.triggered.connect(self.openSession)
+        self.actionSaveSession.triggered.connect(self.saveSession)
+        self.actionSubmitJob.triggered.connect(self.submitJob)
+        self.jobTimer = QtCore.QTimer(self)
+        self.jobTimer.setInterval(2000)
+        self.jobTimer.timeout.connect(self.pollJobs)
+        self.actionRebinLogTime.triggered.connect(self.rebinLogTime)
+        self.actionSvdDenoise.triggered.connect(self.svdDenoise)
+        self.actionFitDecays.triggered.connect(self.fitDecays)
+        self.actionFindTimeZero.triggered.connect(self.findTimeZero)
+        self.timeZeroSpinBox.valueChanged.connect(self.shiftTimeZero)
+        self.actionWatchFolder.toggled.connect(self.watchFolderToggled)
+        self.actionShowHeatmap.toggled.connect(self.showHeatmapToggled)
+        self.heatmapPlot.mpl_connect('button_press_event', self.heatmapClicked)
+        self.heatmapPlot.mpl_connect('motion_notify_event', self.heatmapClicked)
+        self.heatmapPlot.mpl_connect('button_release_event', self.heatmapClicked)
+        self.heatmapPlot.mpl_connect('resize_event', self.renderHeatmap)
+        self.watchTimer = QtCore.QTimer(self)
+        self.watchTimer.setInterval(2000)
+        self.watchTimer.timeout.connect(self.pollWatchFolder)
 
     def setupDelimiters(self):
         self.delimiterComboBox.addItem('tab')
@@ -93,11 +149,79 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.statusBar.setStyleSheet('QStatusBar{color:'+colour+';}')
         self.statusBar.showMessage(message, msecs=msecs)
 
+    def stageStatus(self, message, stage):
+        self.displayStatus('{0} ({1})'.format(message, self.profiler.lastSummary(stage)), 'green', msecs=8000)
+
+    def kineticShapes(self):
+        return {str(index): shapeOf(kinetic) for index, kinetic in self.kineticsDict.items()}
+
+    def saveRunLog(self):
+        try:
+            self.profiler.saveRunLog(self.directory)
+        except OSError as e:
+            print(e)
+
+    def getDtype(self):
+        return np.float32 if self.actionSinglePrecision.isChecked() else np.float64
+
+    def getTimeZero(self):
+        # whole numbers as int, so the times (and the saved files) stay whole
+        timeZero = self.timeZeroSpinBox.value()
+        return int(timeZero) if timeZero.is_integer() else timeZero
+
+    def getBootstrap(self):
+        return kp.BOOTSTRAP_RESAMPLES if self.actionBootstrap.isChecked() else 0
+
+    def getOverlapSelection(self):
+        return 'snr' if self.actionSnrOverlapSelection.isChecked() else 'earliest'
+
+    def getRoi(self):
+        '''
+        The wavelength range to load, or None for all of it. Raises
+        ValueError unless the minimum is below the maximum.
+        '''
+        if not self.roiCheckBox.isChecked():
+            return None
+        roi = (self.roiMinSpinBox.value(), self.roiMaxSpinBox.value())
+        if not roi[0] < roi[1]:
+            raise ValueError('the ROI minimum ({0} nm) must be below its maximum ({1} nm)'.format(*roi))
+        return roi
+
+    def roiValid(self):
+        '''
+        Whether getRoi gives a usable range, showing why not in the status
+        bar.
+        '''
+        try:
+            self.getRoi()
+        except ValueError as e:
+            self.displayStatus(str(e), 'red')
+            return False
+        return True
+
+    def getDelimiter(self):
+        delimiter = self.delimiterComboBox.currentText()
+        if delimiter == 'tab':
+            delimiter = '\t'
+        return delimiter
+
+    def closeEvent(self, event):
+        self.stopWatching()
+        self.stageGraph.close()
+        event.accept()
+
     def resetApp(self):
+        self.stopWatching()
+        # started again the next time it is needed
+        self.stageGraph.close()
+        # parsed files are only kept beside a session once it is saved or opened
+        self.stageGraph.cacheDir = None
         self.timeSlicePlot.ax.cla()
         self.timeSlicePlot.draw()
         self.kineticsPlot.ax.cla()
         self.kineticsPlot.draw()
+        self.heatmapPlot.ax.cla()
+        self.heatmapPlot.draw()
         self.initialiseDataStorage()
         self.kineticsFilesListWidget.clear()
         self.startTimesListWidget.clear()
@@ -123,6 +247,10 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.timeSliceWlMinSpinBox.setEnabled(False)
         self.timeSlider.setEnabled(False)
         self.calibrateButton.setEnabled(False)
+        self.actionRebinLogTime.setEnabled(False)
+        self.actionSvdDenoise.setEnabled(False)
+        self.actionFitDecays.setEnabled(False)
+        self.actionFindTimeZero.setEnabled(False)
         self.autoscaleCheckBox.setEnabled(False)
         self.scaleButton.setEnabled(False)
         self.displayStatus('application reset', 'blue', msecs=4000)
@@ -168,13 +296,16 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         item = listWidget.takeItem(row)
         del(item)
 
-    def fileLoadError(self):
+    def fileLoadError(self, error=None):
         errorDialog = QtWidgets.QMessageBox()
         errorDialog.setIcon(QtWidgets.QMessageBox.Warning)
         errorDialog.setWindowIcon(QtGui.QIcon('../icon.ico'))
         errorDialog.setWindowTitle('File Load Warning')
         errorDialog.setText('Could not load file(s). App will reset.')
-        errorDialog.setDetailedText('Files must be the original ASCII files from the iCCD. Make sure that all start times and gate steps have been entered.')
+        detail = 'Files must be the original ASCII files from the iCCD. Make sure that all start times and gate steps have been entered.'
+        if error is not None:
+            detail = '{0}\n\n{1}'.format(error, detail)
+        errorDialog.setDetailedText(detail)
         errorDialog.exec_()
         self.resetApp()
 
@@ -192,9 +323,7 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         if fname != '':
             self.calibrationFileLineEdit.setText(fname)
             try:
-                self.calibration = pd.read_csv(fname, index_col=0, header=None, sep=',', squeeze=True)
-                # self.calibration = pd.read_csv(fname, index_col=0, header=None, sep=',').squeeze('columns')
-                # @note You may want to use the 2nd here if you don't use the environment...
+                self.calibration = kp.readCalibration(fname)
             except Exception as e:
                 print(e)
                 self.fileLoadError()
@@ -202,23 +331,37 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
 
     def firstKineticBrowse(self):
         filetypes = 'ASCII (*.asc)'
-        kfname = QtWidgets.QFileDialog.getOpenFileName(self, 'load first kinetic', self.directory, filetypes)[0]
-        if kfname != '':
+        kfnames = QtWidgets.QFileDialog.getOpenFileNames(self, 'load first kinetic (select several to average repeats)', self.directory, filetypes)[0]
+        if kfnames:
+            kfname = kfnames[0]
             self.directory = os.path.dirname(kfname)
             if self.firstKineticFileListWidget.count() == 1:
                 self.firstKineticFileListWidget.clear()
                 self.firstKineticStartTimeListWidget.clear()
                 self.firstKineticGateStepListWidget.clear()
-            self.addItemToList(self.firstKineticFileListWidget, os.path.basename(kfname))
+            name = self.addKineticFiles(kfnames)
+            self.addItemToList(self.firstKineticFileListWidget, name)
             self.addItemToList(self.firstKineticStartTimeListWidget, self.placeMarker, editable=True)
             self.addItemToList(self.firstKineticGateStepListWidget, self.placeMarker, editable=True)
-            self.kineticsFilepathsDict[os.path.basename(kfname)] = kfname
             if not self.backgroundCheckBox.isChecked():
                 bfname = QtWidgets.QFileDialog.getOpenFileName(self, 'load first background', self.directory, filetypes)[0]
                 if bfname != '':
                     self.directory = os.path.dirname(bfname)
                     self.addItemToList(self.firstKineticBackgroundFileListWidget, os.path.basename(bfname))
-                    self.backgroundFilepathsDict[os.path.basename(kfname)] = bfname
+                    self.backgroundFilepathsDict[name] = bfname
+
+    def addKineticFiles(self, filepaths):
+        '''
+        Record a kinetic file and any repeats of it, returning the name it
+        is listed under.
+        '''
+        name = os.path.basename(filepaths[0])
+        if len(filepaths) > 1:
+            name += ' (+{0} repeats)'.format(len(filepaths)-1)
+        self.kineticsFilepathsDict[name] = filepaths[0]
+        if len(filepaths) > 1:
+            self.repeatFilepathsDict[name] = list(filepaths[1:])
+        return name
 
     def backgroundCheckBoxSync(self):
         '''
@@ -239,20 +382,22 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
 
     def kineticBrowse(self):
         filetypes = 'ASCII (*.asc)'
-        kfname = QtWidgets.QFileDialog.getOpenFileName(self, 'load kinetic', self.directory, filetypes)[0]
-        if kfname != '':
+        kfnames = QtWidgets.QFileDialog.getOpenFileNames(self, 'load kinetic (select several to average repeats)', self.directory, filetypes)[0]
+        if kfnames:
+            kfname = kfnames[0]
             self.directory = os.path.dirname(kfname)
-            self.addItemToList(self.kineticsFilesListWidget, os.path.basename(kfname))
+            name = self.addKineticFiles(kfnames)
+            self.addItemToList(self.kineticsFilesListWidget, name)
             self.addItemToList(self.startTimesListWidget, self.placeMarker, editable=True)
             self.addItemToList(self.gateStepListWidget, self.placeMarker, editable=True)
-            self.kineticsFilepathsDict[os.path.basename(kfname)] = kfname
             bfname = QtWidgets.QFileDialog.getOpenFileName(self, 'load background', self.directory, filetypes)[0]
             if bfname != '':
                 self.directory = os.path.dirname(bfname)
                 self.addItemToList(self.backgroundFilesListWidget, os.path.basename(bfname))
-                self.backgroundFilepathsDict[os.path.basename(kfname)] = bfname
+                self.backgroundFilepathsDict[name] = bfname
             else:
-                del(self.kineticsFilepathsDict[os.path.basename(kfname)])
+                del(self.kineticsFilepathsDict[name])
+                self.repeatFilepathsDict.pop(name, None)
                 self.removeCurrentItemFromList(self.kineticsFilesListWidget)
                 self.removeCurrentItemFromList(self.startTimesListWidget)
                 self.removeCurrentItemFromList(self.gateStepListWidget)
@@ -294,6 +439,8 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.removeCurrentItemFromList(self.backgroundFilesListWidget)
 
     def loadData(self):
+        if not self.roiValid():
+            return
         blank = False
         try:
             timesEntered = self.checkTimesEntered()
@@ -302,9 +449,14 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
             self.fileLoadError()
         if not blank:
             if timesEntered:
-                success = self.loadMethod()
-                if not success:
-                    self.fileLoadError()
+                with self.profiler.stage('load') as record:
+                    success = self.loadMethod()
+                    record['shapes'] = self.kineticShapes()
+                self.saveRunLog()
+                if success:
+                    self.stageStatus('all files loaded successfully', 'load')
+                else:
+                    self.fileLoadError(self.loadError)
             else:
                 self.timesError()
 
@@ -319,77 +471,147 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
             return True
 
     def loadMethod(self):
-        delimiter = self.delimiterComboBox.currentText()
-        if delimiter == 'tab':
-            delimiter = '\t'
+        delimiter = self.getDelimiter()
+        # why a file could not be read, for the warning
+        self.loadError = None
         try:
-            firstKineticFilePath = self.kineticsFilepathsDict[self.firstKineticFileListWidget.currentItem().text()]
+            firstKineticName = self.firstKineticFileListWidget.currentItem().text()
         except AttributeError:
             return False
         firstKineticStartTime = int(self.firstKineticStartTimeListWidget.currentItem().text())
         firstKineticGateStep = int(self.firstKineticGateStepListWidget.currentItem().text())
         try:
-            firstKinetic = pd.read_csv(firstKineticFilePath, index_col=0, header=None, nrows=1024, sep=delimiter)
-        except Exception:
+            firstKinetic = self.readKinetic(firstKineticName, delimiter)
+        except Exception as e:
+            self.loadError = e
             return False
-        firstKinetic.dropna(axis=1, inplace=True)
-        self.kineticsDict[1] = [firstKinetic, firstKineticStartTime, firstKineticGateStep, 'no separate background']
+        firstKinetic.metadata.update(startTime=firstKineticStartTime, gateStep=firstKineticGateStep)
+        self.kineticsDict[1] = firstKinetic
         if not self.backgroundCheckBox.isChecked():
             try:
                 firstKineticBackgroundFilePath = self.backgroundFilepathsDict[self.firstKineticFileListWidget.currentItem().text()]
             except AttributeError:
                 return False
             try:
-                firstKineticBackground = pd.read_csv(firstKineticBackgroundFilePath, index_col=0, header=None, nrows=1024, sep=delimiter)[1]
-            except Exception:
+                firstKineticBackground = self.stageGraph.readBackground(firstKineticBackgroundFilePath, delimiter, roi=self.getRoi(),
+                                                                        binning=self.binningSpinBox.value()).value
+            except Exception as e:
+                self.loadError = e
                 return False
-            self.kineticsDict[1] = [firstKinetic, firstKineticStartTime, firstKineticGateStep, firstKineticBackground]
+            firstKinetic.background = firstKineticBackground
         for index in range(self.kineticsFilesListWidget.count()):
-            kineticFilePath = self.kineticsFilepathsDict[self.kineticsFilesListWidget.item(index).text()]
+            kineticName = self.kineticsFilesListWidget.item(index).text()
             kineticStartTime = int(self.startTimesListWidget.item(index).text())
             kineticGateStep = int(self.gateStepListWidget.item(index).text())
-            backgroundFilePath = self.backgroundFilepathsDict[self.kineticsFilesListWidget.item(index).text()]
+            backgroundFilePath = self.backgroundFilepathsDict[kineticName]
             try:
-                kinetic = pd.read_csv(kineticFilePath, index_col=0, header=None, nrows=1024, sep=delimiter)
-            except Exception:
+                kinetic = self.readKinetic(kineticName, delimiter)
+            except Exception as e:
+                self.loadError = e
                 return False
-            kinetic.dropna(axis=1, inplace=True)
             try:
-                background = pd.read_csv(backgroundFilePath, index_col=0, header=None, nrows=1024, sep=delimiter)[1]
+                background = self.stageGraph.readBackground(backgroundFilePath, delimiter, roi=self.getRoi(),
+                                                            binning=self.binningSpinBox.value()).value
                 # @todo Kinetic backgrounds currently wasteful as only first in series used
                 # Maybe incorporate averaging or by-element-subtraction?
-            except Exception:
+            except Exception as e:
+                self.loadError = e
                 return False
-            self.kineticsDict[index+2] = [kinetic, kineticStartTime, kineticGateStep, background]
+            kinetic.metadata.update(startTime=kineticStartTime, gateStep=kineticGateStep)
+            kinetic.background = background
+            self.kineticsDict[index+2] = kinetic
         self.loadButton.setEnabled(False)
         self.addTimeAxisButton.setEnabled(True)
-        self.displayStatus('all files loaded successfully', 'green', msecs=4000)
+        self.actionFindTimeZero.setEnabled(True)
         return True
 
+    def readKinetic(self, name, delimiter):
+        '''
+        A copy of the listed kinetic, averaged with its repeats if it has any.
+        '''
+        options = dict(dtype=self.getDtype(), roi=self.getRoi(), binning=self.binningSpinBox.value())
+        filepath = self.kineticsFilepathsDict[name]
+        if name in self.repeatFilepathsDict:
+            return self.stageGraph.readRepeats([filepath]+self.repeatFilepathsDict[name], delimiter, **options).value.copy()
+        return self.stageGraph.readKinetic(filepath, delimiter, **options).value.copy()
+
 ###############################################################################
 ########################    DATA PROCESSING METHODS    ########################
 ###############################################################################
 
-    @staticmethod
-    def constructTimeAxis(timeZero, startTime, gateStep, numPoints):
-        axis = np.arange(startTime-timeZero, startTime-timeZero+(numPoints*gateStep), gateStep)
-        return axis
-
     def addTimeAxes(self):
-        timeZero = int(self.timeZeroSpinBox.value())
-        for index in self.kineticsDict.keys():
-            kinetic = self.kineticsDict[index][0]
-            startTime = self.kineticsDict[index][1]
-            gateStep = self.kineticsDict[index][2]
-            numPoints = len(kinetic.columns)
-            axis = self.constructTimeAxis(timeZero, startTime, gateStep, numPoints)
-            kinetic.columns = axis
-            background = self.kineticsDict[index][3]
-            self.kineticsDict[index] = [kinetic, background]
-        self.dataToPlot = self.kineticsDict[1][0]
+        timeZero = self.getTimeZero()
+        with self.profiler.stage('time axis') as record:
+            for kinetic in self.kineticsDict.values():
+                kp.addTimeAxis(kinetic, timeZero, kinetic.metadata['startTime'], kinetic.metadata['gateStep'])
+            record['shapes'] = self.kineticShapes()
+        self.saveRunLog()
+        self.setDataToPlot(self.kineticsDict[1])
         self.addTimeAxisButton.setEnabled(False)
         self.removeCosmicRaysButton.setEnabled(True)
         self.backgroundSubtractButton.setEnabled(True)
+        self.enablePlotting()
+        self.setupTimeSlicePlot()
+        self.plotTimeSlice()
+        self.setupKineticsPlot()
+        self.plotKinetic()
+        self.stageStatus('time axis added successfully', 'time axis')
+
+    def findTimeZero(self):
+        '''
+        Set time zero to the rise of the first kinetic, see
+        kineticPipeline.estimateTimeZero. If the time axes are already
+        added they are shifted to it.
+        '''
+        first = self.kineticsDict[1]
+        try:
+            timeZero = kp.estimateTimeZero(first, first.metadata['startTime'], first.metadata['gateStep'])
+        except ValueError as e:
+            self.displayStatus(str(e), 'red')
+            return
+        self.timeZeroSpinBox.setValue(timeZero)
+        self.displayStatus('time zero found at {0:.2f} ns'.format(timeZero), 'green', msecs=8000)
+
+    def shiftTimeZero(self):
+        '''
+        Move time zero of the kinetics already given time axes, without
+        loading them again: only their time axes are offset (on shallow
+        copies, as the Reprocess cache may hold the originals).
+        '''
+        if not self.kineticsDict or 'timeZero' not in self.kineticsDict[1].metadata:
+            return
+        timeZero = self.getTimeZero()
+        offset = timeZero-self.kineticsDict[1].metadata['timeZero']
+        if not offset:
+            return
+        shifted = {}
+
+        def shift(kinetic):
+            # each kinetic once, however many places hold it
+            if id(kinetic) not in shifted:
+                shifted[id(kinetic)] = kp.shiftTimeZero(kinetic.copy(deep=False), timeZero)
+            return shifted[id(kinetic)]
+
+        self.kineticsDict = {index: shift(kinetic) for index, kinetic in self.kineticsDict.items()}
+        if self.completeKinetic is not None:
+            self.completeKinetic = shift(self.completeKinetic)
+        if self.liveSplicer is not None:
+            self.liveSplicer.timeZero = timeZero
+            self.liveSplicer.completeKinetic = self.completeKinetic
+        self.overlappingTimesList = [str(float(time)-offset) for time in self.overlappingTimesList]
+        if self.scalingFactors is not None:
+            self.scalingFactors = self.scalingFactors.copy()
+            for column in ('time', 'fitTime'):
+                if column in self.scalingFactors:
+                    self.scalingFactors[column] = pd.to_numeric(self.scalingFactors[column])-offset
+        self.setDataToPlot(shift(self.plottedKinetic))
+        sliderValue = self.timeSlider.value()
+        self.setupSlider(self.dataToPlot.columns)
+        self.timeSlider.setValue(sliderValue)
+        self.plotTimeSlice()
+        self.plotKinetic()
+
+    def enablePlotting(self):
         self.kineticCentreWlSpinBox.setEnabled(True)
         self.kineticAveragingSpinBox.setEnabled(True)
         self.kineticLogTCheckBox.setEnabled(True)
@@ -400,41 +622,38 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.timeSlider.setEnabled(True)
         self.autoscaleCheckBox.setEnabled(True)
         self.scaleButton.setEnabled(True)
-        self.setupTimeSlicePlot()
-        self.plotTimeSlice()
-        self.setupKineticsPlot()
-        self.plotKinetic()
-        self.displayStatus('time axis added successfully', 'green', msecs=4000)
 
     def removeCosmicRays(self):
-        for index in self.kineticsDict.keys():
-            kinetic = self.kineticsDict[index][0]
-            crr = CosmicRayRemoval()
-            corrected = crr.removeCosmicRaysPandasDataFrame(kinetic)
-            self.kineticsDict[index][0] = corrected
-        self.dataToPlot = self.kineticsDict[1][0]
+        with self.profiler.stage('cosmic ray removal') as record:
+            for kinetic in self.kineticsDict.values():
+                kp.removeCosmicRays(kinetic, pool=self.stageGraph.poolFor(kinetic))
+            record['shapes'] = self.kineticShapes()
+        self.saveRunLog()
+        self.cosmicRaysRemoved = True
+        self.setDataToPlot(self.kineticsDict[1])
         self.plotTimeSlice()
         self.plotKinetic()
-        self.displayStatus('removed cosmic rays', 'green', msecs=4000)
+        self.stageStatus('removed cosmic rays', 'cosmic ray removal')
 
     def subtractBackgrounds(self):
         backgroundEndTime = int(self.backgroundEndTimeSpinBox.value())
-        for index in self.kineticsDict.keys():
-            kinetic = self.kineticsDict[index][0]
-            if index == 1 and self.backgroundCheckBox.isChecked():
-                backgroundTimes = kinetic.columns[kinetic.columns <= backgroundEndTime]
-                background = kinetic[backgroundTimes].mean(axis=1)
-            else:
-                background = self.kineticsDict[index][1]
-            kinetic = kinetic.subtract(background, axis=0)
-            self.kineticsDict[index] = kinetic
-        self.dataToPlot = self.kineticsDict[1]
+        with self.profiler.stage('background') as record:
+            for index, kinetic in self.kineticsDict.items():
+                if index == 1 and self.backgroundCheckBox.isChecked():
+                    background = kp.estimateBackground(kinetic, backgroundEndTime)
+                else:
+                    background = kinetic.background
+                kp.subtractBackground(kinetic, background)
+            record['shapes'] = self.kineticShapes()
+        self.saveRunLog()
+        self.setDataToPlot(self.kineticsDict[1])
         self.plotTimeSlice()
         self.plotKinetic()
         self.removeCosmicRaysButton.setEnabled(False)
         self.backgroundSubtractButton.setEnabled(False)
         self.joinButton.setEnabled(True)
-        self.displayStatus('backgrounds subtracted from all files', 'green', msecs=4000)
+        self.actionSvdDenoise.setEnabled(True)
+        self.stageStatus('backgrounds subtracted from all files', 'background')
 
     def performJoins(self):
         success = self.joinMethod()
@@ -442,51 +661,129 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
             self.noOverlapError()
 
     def joinMethod(self):
-        sfs = pd.DataFrame(index=self.kineticsDict.keys(), columns=['time', 'sf', 'error'])
-        for index in self.kineticsDict.keys():
-            if index == 1:
-                joinedKinetic = self.kineticsDict[index]
-            else:
-                toJoin = self.kineticsDict[index]
-                overlappedTimes = np.intersect1d(np.array(joinedKinetic.columns), np.array(toJoin.columns))
-                # print('overlappedTimes = ' + str(overlappedTimes))
-                if overlappedTimes.size == 0:
-                    return False
-                #:print('min(overlappedTimes) = ' + str(min(overlappedTimes)))
-                overlappedTime = min(overlappedTimes)
-                # @note only the earliest of the overlapped times is overlapped
-                alreadyJoinedArray = np.array(joinedKinetic[overlappedTime])
-                toJoinArray = np.array(toJoin[overlappedTime])
-                overlappedPair = (alreadyJoinedArray, toJoinArray)
-                kspl = KineticSplice(overlappedPair)
-                scalingFactor, scalingFactorError = kspl.calculateScalingFactor()
-                sfs.loc[index, 'time'] = overlappedTime
-                sfs.loc[index, 'sf'] = scalingFactor
-                sfs.loc[index, 'error'] = scalingFactorError
-                self.plot_joins(index, joinedKinetic.index.values, overlappedPair, overlappedTime, scalingFactor)
-                toJoin = toJoin*scalingFactor
-                self.overlappingTimesList.append(str(overlappedTime))
-                joinedKinetic.drop(joinedKinetic.columns[joinedKinetic.columns >= overlappedTime], axis=1, inplace=True)
-                joinedKinetic = joinedKinetic.join(toJoin)
-                sfs.index.name = 'join'
+        try:
+            with self.profiler.stage('join') as record:
+                record['shapes'] = self.kineticShapes()
+                joinedKinetic, sfs, self.overlappingTimesList = kp.joinKinetics(self.kineticsDict, onJoin=self.plot_joins, bootstrap=self.getBootstrap(),
+                                                                                weighted=self.actionWeightedSplicing.isChecked(),
+                                                                                overlapSelection=self.getOverlapSelection())
+                record['shapes']['joined'] = shapeOf(joinedKinetic)
+        except kp.NoOverlapError:
+            self.saveRunLog()
+            return False
         sfs.to_csv(os.path.join(self.directory, 'scaling_factors.csv'), header=True, index=True)
+        self.saveRunLog()
         self.completeKinetic = joinedKinetic
-        self.dataToPlot = self.completeKinetic.copy()
+        self.scalingFactors = sfs
+        # the segments were processed in place, so there are no intermediates
+        self.segmentStages = {}
+        self.showJoinedKinetic()
+        self.stageStatus('join successful', 'join')
+        return True
+
+    def showJoinedKinetic(self):
+        self.setDataToPlot(self.completeKinetic)
         self.setupTimeSlicePlot()
         self.plotTimeSlice()
         self.setupKineticsPlot()
         self.plotKinetic()
         self.joinButton.setEnabled(False)
         self.calibrateButton.setEnabled(True)
+        self.actionRebinLogTime.setEnabled(True)
+        self.actionSvdDenoise.setEnabled(True)
+        self.actionFitDecays.setEnabled(True)
         self.saveDataButton.setEnabled(True)
         self.saveKineticButton.setEnabled(True)
-        self.displayStatus('join successful', 'green', msecs=4000)
-        return True
+
+    def segmentSpecs(self):
+        '''
+        (kinetic path, background path, start time, gate step, repeat paths)
+        for every file in the current list order. The first background path
+        is None when the first background is taken from the kinetic itself.
+        '''
+        firstName = self.firstKineticFileListWidget.currentItem().text()
+        firstBackground = None
+        if not self.backgroundCheckBox.isChecked():
+            firstBackground = self.backgroundFilepathsDict[firstName]
+        specs = [(self.kineticsFilepathsDict[firstName], firstBackground,
+                  int(self.firstKineticStartTimeListWidget.currentItem().text()),
+                  int(self.firstKineticGateStepListWidget.currentItem().text()),
+                  self.repeatFilepathsDict.get(firstName, []))]
+        for index in range(self.kineticsFilesListWidget.count()):
+            name = self.kineticsFilesListWidget.item(index).text()
+            specs.append((self.kineticsFilepathsDict[name], self.backgroundFilepathsDict[name],
+                          int(self.startTimesListWidget.item(index).text()),
+                          int(self.gateStepListWidget.item(index).text()),
+                          self.repeatFilepathsDict.get(name, [])))
+        return specs
+
+    def reprocess(self):
+        '''
+        Run the whole chain, from file to joined kinetic, with the current
+        file order, times and settings. Only the steps whose inputs changed
+        since they were last run are recomputed.
+        '''
+        if not self.roiValid():
+            return
+        try:
+            specs = self.segmentSpecs()
+        except (AttributeError, KeyError, ValueError):
+            self.timesError()
+            return
+        timeZero = self.getTimeZero()
+        backgroundEndTime = int(self.backgroundEndTimeSpinBox.value())
+        delimiter = self.getDelimiter()
+        self.stageGraph.resetCounts()
+        try:
+            with self.profiler.stage('reprocess') as record:
+                segments = []
+                stages = {}
+                for index, (kineticPath, backgroundPath, startTime, gateStep, repeatPaths) in enumerate(specs, 1):
+                    stages[index] = {}
+                    segments.append(self.stageGraph.processSegment(kineticPath, backgroundPath, startTime, gateStep, timeZero, delimiter,
+                                                                   removeCosmicRays=self.cosmicRaysRemoved, backgroundEndTime=backgroundEndTime,
+                                                                   dtype=self.getDtype(), roi=self.getRoi(),
+                                                                   binning=self.binningSpinBox.value(), denoiseRank=self.segmentDenoiseRank,
+                                                                   stages=stages[index], repeatPaths=repeatPaths))
+                completeKinetic, sfs, self.overlappingTimesList = self.stageGraph.join(segments, onJoin=self.plot_joins, bootstrap=self.getBootstrap(),
+                                                                                       weighted=self.actionWeightedSplicing.isChecked(),
+                                                                                       overlapSelection=self.getOverlapSelection(),
+                                                                                       denoiseRank=self.joinedDenoiseRank)
+                record['shapes']['joined'] = shapeOf(completeKinetic)
+                record['cacheHits'] = self.stageGraph.hits
+                record['cacheMisses'] = self.stageGraph.misses
+        except kp.NoOverlapError as e:
+            self.saveRunLog()
+            self.displayStatus(str(e), 'red')
+            return
+        except Exception as e:
+            print(e)
+            self.saveRunLog()
+            self.displayStatus('could not reprocess: {0}'.format(e), 'red')
+            return
+        self.saveRunLog()
+        sfs.to_csv(os.path.join(self.directory, 'scaling_factors.csv'), header=True, index=True)
+        self.kineticsDict = {index+1: segment.value for index, segment in enumerate(segments)}
+        self.completeKinetic = completeKinetic
+        self.scalingFactors = sfs
+        self.segmentStages = stages
+        self.loadButton.setEnabled(False)
+        self.addTimeAxisButton.setEnabled(False)
+        self.removeCosmicRaysButton.setEnabled(False)
+        self.backgroundSubtractButton.setEnabled(False)
+        self.enablePlotting()
+        self.showJoinedKinetic()
+        self.stageStatus('reprocessed, {0} of {1} steps reused'.format(self.stageGraph.hits, self.stageGraph.hits+self.stageGraph.misses), 'reprocess')
     
     def plot_joins(self, index, x, overlappedPair, overlappedTime, scalingFactor):
+        with self.profiler.stage('plot_joins {0}'.format(index)):
+            self.plotJoinMethod(index, x, overlappedPair, overlappedTime, scalingFactor)
+
+    def plotJoinMethod(self, index, x, overlappedPair, overlappedTime, scalingFactor):
         savedir = os.path.join(self.directory, 'kinetic_joins')
         if not os.path.exists(savedir):
             os.makedirs(savedir)
+        from matplotlib import pyplot as plt  # only needed once joining, so not imported at startup
         fig = plt.figure()
         plt.plot(x, overlappedPair[0], 'k-', label='1st')
         plt.plot(x, scalingFactor*overlappedPair[1], 'r-', label='2nd')
@@ -495,7 +792,7 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         plt.xlabel('wavelength (nm)')
         plt.ylabel('PL (arb.)')
         fig.savefig(os.path.join(savedir, 'join_{0}.png'.format(index)), format='png', dpi=300, bbox_inches='tight')
-        plt.close(fig=fig)        
+        plt.close(fig=fig)
 
     def noOverlapError(self):
         errorDialog = QtWidgets.QMessageBox()
@@ -508,16 +805,321 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
 
     def applyCalibration(self):
         try:
-            spl = Spline(self.calibration.index, self.calibration.values, s=0)
-            reindexed_calibration = pd.Series(index=self.completeKinetic.index, data=spl(self.completeKinetic.index))
-            self.completeKinetic = self.completeKinetic.mul(reindexed_calibration, axis=0)
+            calibration = self.calibration
+            with self.profiler.stage('calibration', kinetic=self.completeKinetic, calibration=calibration):
+                # copied as the uncalibrated kinetic may be cached or still being spliced in live mode
+                self.completeKinetic = kp.applyCalibration(self.completeKinetic.copy(), calibration)
+            self.saveRunLog()
+            self.setDataToPlot(self.completeKinetic)
             self.plotTimeSlice()
             self.plotKinetic()
             self.calibrateButton.setEnabled(False)
-            self.displayStatus('calibration applied', 'green', msecs=4000)
+            self.stageStatus('calibration applied', 'calibration')
         except AttributeError:
             self.displayStatus('no calibration file loaded', 'blue', msecs=4000)
 
+    def rebinLogTime(self):
+        pointsPerDecade, ok = QtWidgets.QInputDialog.getInt(self, 'Rebin Log Time', 'Points per decade:',
+                                                            kp.LOG_POINTS_PER_DECADE, 1, 1000)
+        if not ok:
+            return
+        with self.profiler.stage('log rebin', kinetic=self.completeKinetic) as record:
+            self.completeKinetic = kp.rebinLogTime(self.completeKinetic, pointsPerDecade)
+            record['shapes']['rebinned'] = shapeOf(self.completeKinetic)
+        self.saveRunLog()
+        self.setDataToPlot(self.completeKinetic)
+        self.setupSlider(self.dataToPlot.columns)
+        self.plotTimeSlice()
+        self.plotKinetic()
+        self.actionRebinLogTime.setEnabled(False)
+        self.stageStatus('rebinned to {0} times'.format(self.completeKinetic.shape[1]), 'log rebin')
+
+    def svdDenoise(self):
+        '''
+        Keep the largest singular components of every segment if they have
+        not been joined yet, otherwise of the joined kinetic. The number to
+        keep is asked for with the scree plot of the first segment (or the
+        joined kinetic) showing in the kinetics graph; the scree table is
+        also saved to svd_scree.csv. The rank is recorded, so reprocessing
+        and saved sessions denoise the same way.
+        '''
+        joined = self.completeKinetic is not None
+        kinetic = self.completeKinetic if joined else self.kineticsDict[1]
+        with self.profiler.stage('scree', kinetic=kinetic):
+            scree = kp.singularValues(kinetic)
+        scree.to_csv(os.path.join(self.directory, 'svd_scree.csv'), header=True, index=True)
+        self.plotScree(scree)
+        rank, ok = QtWidgets.QInputDialog.getInt(self, 'SVD Denoise', 'Components to keep:',
+                                                 min(kp.SVD_RANK, len(scree)), 1, min(kinetic.shape))
+        if not ok:
+            self.plotKinetic()
+            return
+        with self.profiler.stage('svd denoise') as record:
+            if joined:
+                # copied as the joined kinetic may be cached or still being spliced in live mode
+                self.completeKinetic = kp.denoiseSVD(self.completeKinetic.copy(deep=False), rank)
+                self.joinedDenoiseRank = rank
+                self.setDataToPlot(self.completeKinetic)
+            else:
+                for segment in self.kineticsDict.values():
+                    kp.denoiseSVD(segment, rank)
+                self.segmentDenoiseRank = rank
+                self.setDataToPlot(self.kineticsDict[1])
+            record['shapes'] = self.kineticShapes()
+            if joined:
+                record['shapes']['joined'] = shapeOf(self.completeKinetic)
+        self.saveRunLog()
+        self.plotTimeSlice()
+        self.plotKinetic()
+        self.actionSvdDenoise.setEnabled(False)
+        self.stageStatus('kept {0} singular components'.format(rank), 'svd denoise')
+
+    def fitDecays(self):
+        '''
+        Fit the chosen decay model to every wavelength of the joined kinetic,
+        saving the lifetime map to lifetimes_<model>.csv, and to the kinetic
+        in the kinetics graph, whose fit is drawn over it.
+        '''
+        model, ok = QtWidgets.QInputDialog.getItem(self, 'Fit Decays', 'Model:', list(kp.DECAY_MODELS), 0, False)
+        if not ok:
+            return
+        with self.profiler.stage('decay fit', kinetic=self.completeKinetic):
+            fits = kp.fitDecays(self.completeKinetic, model)
+        fits.to_csv(os.path.join(self.directory, 'lifetimes_{0}.csv'.format(model)), header=True, index=True)
+        self.saveRunLog()
+        trace = self.getKineticSlice()
+        self.plotKinetic()
+        self.plotDecayFit(trace, kp.fitDecays(trace, model), model)
+        self.stageStatus('fitted {0} wavelengths ({1} converged)'.format(len(fits), int(fits['converged'].sum())), 'decay fit')
+
+
+###############################################################################
+###########################    SESSION METHODS    #############################
+###############################################################################
+
+    def currentSession(self):
+        '''
+        The file list and settings as a Session. Raises the same errors as
+        segmentSpecs while the list is incomplete.
+        '''
+        segments = [{'kinetic': kineticPath, 'background': backgroundPath, 'startTime': startTime, 'gateStep': gateStep,
+                     'repeats': repeatPaths}
+                    for kineticPath, backgroundPath, startTime, gateStep, repeatPaths in self.segmentSpecs()]
+        calibration = self.calibrationFileLineEdit.text() if hasattr(self, 'calibration') else None
+        return Session(segments, self.getTimeZero(), delimiter=self.getDelimiter(),
+                       backgroundEndTime=int(self.backgroundEndTimeSpinBox.value()), calibration=calibration,
+                       removeCosmicRays=self.cosmicRaysRemoved, dtype=np.dtype(self.getDtype()).name, roi=self.getRoi(),
+                       binning=self.binningSpinBox.value(), denoiseRank=self.segmentDenoiseRank, bootstrap=self.getBootstrap(),
+                       weighted=self.actionWeightedSplicing.isChecked(), overlapSelection=self.getOverlapSelection(),
+                       joinedDenoiseRank=self.joinedDenoiseRank)
+
+    def saveSession(self):
+        if not self.roiValid():
+            return
+        try:
+            session = self.currentSession()
+        except (AttributeError, KeyError, ValueError):
+            self.timesError()
+            return
+        filepath = QtWidgets.QFileDialog.getSaveFileName(self, 'save session', os.path.join(self.directory, 'session.json'), 'Session (*.json)')[0]
+        if filepath == '':
+            return
+        session.save(filepath, self.stageGraph)
+        # from now on the parsed files are also kept beside the session
+        self.stageGraph.cacheDir = session.cacheDir
+        self.stageGraph.persist()
+        self.displayStatus('session saved to {0}'.format(filepath), 'blue', msecs=4000)
+
+    def submitJob(self):
+        '''
+        Queue the current files and settings on the job server, see
+        jobServer. The results are saved in the data folder.
+        '''
+        if not self.roiValid():
+            return
+        try:
+            session = self.currentSession()
+        except (AttributeError, KeyError, ValueError):
+            self.timesError()
+            return
+        try:
+            jobId = self.jobClient.submit(session, self.directory, stageGraph=self.stageGraph)
+        except JobServerError as e:
+            self.displayStatus(str(e), 'red')
+            return
+        self.submittedJobs.append(jobId)
+        self.jobTimer.start()
+        self.displayStatus('submitted job {0} to the job server'.format(jobId), 'blue', msecs=4000)
+
+    def pollJobs(self):
+        for jobId in list(self.submittedJobs):
+            try:
+                job = self.jobClient.status(jobId)
+            except JobServerError as e:
+                self.jobTimer.stop()
+                self.displayStatus(str(e), 'red')
+                return
+            if job['state'] == 'done':
+                self.displayStatus('job {0} done, saved to {1}'.format(jobId, job['output']), 'blue', msecs=4000)
+            elif job['state'] in ('failed', 'cancelled'):
+                self.displayStatus('job {0} {1} {2}'.format(jobId, job['state'], job['error'] or ''), 'red')
+            else:
+                continue
+            self.submittedJobs.remove(jobId)
+        if not self.submittedJobs:
+            self.jobTimer.stop()
+
+    def openSession(self):
+        filepath = QtWidgets.QFileDialog.getOpenFileName(self, 'open session', self.directory, 'Session (*.json)')[0]
+        if filepath == '':
+            return
+        try:
+            session = Session.load(filepath)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.displayStatus('could not open session: {0}'.format(e), 'red')
+            return
+        self.resetApp()
+        self.directory = os.path.dirname(os.path.abspath(filepath))
+        self.showSession(session)
+        self.stageGraph.cacheDir = session.cacheDir
+        session.rememberFiles(self.stageGraph)
+        self.reprocess()
+
+    def showSession(self, session):
+        '''
+        Fill in the file lists and settings from a session.
+        '''
+        first = session.segments[0]
+        name = self.addKineticFiles([first['kinetic']]+first.get('repeats', []))
+        self.addItemToList(self.firstKineticFileListWidget, name)
+        self.addItemToList(self.firstKineticStartTimeListWidget, str(first['startTime']), editable=True)
+        self.addItemToList(self.firstKineticGateStepListWidget, str(first['gateStep']), editable=True)
+        self.backgroundCheckBox.setChecked(first['background'] is None)
+        self.backgroundCheckBoxSync()
+        if first['background'] is not None:
+            self.addItemToList(self.firstKineticBackgroundFileListWidget, os.path.basename(first['background']))
+            self.backgroundFilepathsDict[name] = first['background']
+        for segment in session.segments[1:]:
+            name = self.addKineticFiles([segment['kinetic']]+segment.get('repeats', []))
+            self.addItemToList(self.kineticsFilesListWidget, name)
+            self.addItemToList(self.startTimesListWidget, str(segment['startTime']), editable=True)
+            self.addItemToList(self.gateStepListWidget, str(segment['gateStep']), editable=True)
+            self.addItemToList(self.backgroundFilesListWidget, os.path.basename(segment['background']))
+            self.backgroundFilepathsDict[name] = segment['background']
+        self.timeZeroSpinBox.setValue(session.timeZero)
+        if session.backgroundEndTime is not None:
+            self.backgroundEndTimeSpinBox.setValue(session.backgroundEndTime)
+        self.delimiterComboBox.setCurrentText('tab' if session.delimiter == '\t' else session.delimiter)
+        self.cosmicRaysRemoved = session.removeCosmicRays
+        self.segmentDenoiseRank = session.denoiseRank
+        self.joinedDenoiseRank = session.joinedDenoiseRank
+        self.actionSinglePrecision.setChecked(session.dtype == 'float32')
+        self.actionBootstrap.setChecked(session.bootstrap > 0)
+        self.actionWeightedSplicing.setChecked(session.weighted)
+        self.actionSnrOverlapSelection.setChecked(session.overlapSelection == 'snr')
+        self.roiCheckBox.setChecked(session.roi is not None)
+        if session.roi is not None:
+            self.roiMinSpinBox.setValue(session.roi[0])
+            self.roiMaxSpinBox.setValue(session.roi[1])
+        self.binningSpinBox.setValue(session.binning)
+        if session.calibration is not None:
+            self.calibrationFileLineEdit.setText(session.calibration)
+            try:
+                self.calibration = kp.readCalibration(session.calibration)
+            except Exception as e:
+                print(e)
+                self.fileLoadError()
+
+
+###############################################################################
+##########################    LIVE MODE METHODS    ############################
+###############################################################################
+
+    def watchFolderToggled(self, checked):
+        if checked:
+            self.startWatching()
+        else:
+            self.stopWatching()
+
+    def startWatching(self):
+        if not self.roiValid():
+            self.actionWatchFolder.setChecked(False)
+            return
+        directory = QtWidgets.QFileDialog.getExistingDirectory(self, 'watch folder for new kinetics', self.directory)
+        if directory == '':
+            self.actionWatchFolder.setChecked(False)
+            return
+        self.resetApp()
+        self.directory = directory
+        backgroundEndTime = None
+        if self.backgroundCheckBox.isChecked():
+            backgroundEndTime = int(self.backgroundEndTimeSpinBox.value())
+        self.liveSplicer = LiveSplicer(self.getTimeZero(), delimiter=self.getDelimiter(),
+                                       backgroundEndTime=backgroundEndTime, onJoin=self.plot_joins, dtype=self.getDtype(),
+                                       bootstrap=self.getBootstrap(), roi=self.getRoi(), binning=self.binningSpinBox.value(),
+                                       weighted=self.actionWeightedSplicing.isChecked(),
+                                       overlapSelection=self.getOverlapSelection())
+        self.folderWatcher = FolderWatcher(directory)
+        self.loadButton.setEnabled(False)
+        self.actionWatchFolder.blockSignals(True)
+        self.actionWatchFolder.setChecked(True)
+        self.actionWatchFolder.blockSignals(False)
+        self.watchTimer.start()
+        self.displayStatus('watching {0} for new kinetics'.format(directory), 'blue')
+
+    def stopWatching(self):
+        if self.folderWatcher is None:
+            return
+        self.watchTimer.stop()
+        self.folderWatcher = None
+        self.actionWatchFolder.blockSignals(True)
+        self.actionWatchFolder.setChecked(False)
+        self.actionWatchFolder.blockSignals(False)
+        self.displayStatus('stopped watching folder', 'blue', msecs=4000)
+
+    def pollWatchFolder(self):
+        numJoined = len(self.liveSplicer.joinedStems)
+        for filepath in self.folderWatcher.poll():
+            try:
+                parseSegmentName(filepath)
+            except ValueError as e:
+                self.displayStatus(str(e), 'red')
+                continue
+            try:
+                with self.profiler.stage('live segment') as record:
+                    self.liveSplicer.addFile(filepath)
+                    record['shapes']['joined'] = shapeOf(self.liveSplicer.completeKinetic)
+            except (ValueError, kp.NoOverlapError) as e:
+                # the segment stays queued, and is read again once its files change
+                failed = self.liveSplicer.nextSegmentFiles()
+                for path in failed:
+                    self.folderWatcher.retry(path)
+                names = ', '.join(os.path.basename(path) for path in failed)
+                self.displayStatus('{0}: {1} (read again once rewritten)'.format(names, e), 'red')
+        joined = self.liveSplicer.joinedStems[numJoined:]
+        if not joined:
+            return
+        self.saveRunLog()
+        self.scalingFactors = self.liveSplicer.scalingFactors()
+        self.scalingFactors.to_csv(os.path.join(self.directory, 'scaling_factors.csv'), header=True, index=True)
+        self.overlappingTimesList = self.liveSplicer.overlappedTimes
+        self.completeKinetic = self.liveSplicer.completeKinetic
+        if self.joinedDenoiseRank is not None:
+            self.completeKinetic = kp.denoiseSVD(self.completeKinetic.copy(deep=False), self.joinedDenoiseRank)
+        self.setDataToPlot(self.completeKinetic)
+        sliderValue = self.timeSlider.value()
+        firstSegment = not self.timeSlider.isEnabled()
+        self.setupTimeSlicePlot()
+        self.timeSlider.setValue(min(sliderValue, self.timeSlider.maximum()))
+        if firstSegment:
+            self.enablePlotting()
+            self.setupKineticsPlot()
+        self.plotTimeSlice()
+        self.plotKinetic()
+        self.calibrateButton.setEnabled(True)
+        self.saveDataButton.setEnabled(True)
+        self.saveKineticButton.setEnabled(True)
+        self.stageStatus('joined {0} ({1} segments so far)'.format(', '.join(joined), self.liveSplicer.numSegments), 'live segment')
 
 ###############################################################################
 #######################    GRAPH PLOTTING METHODS    ##########################
@@ -540,17 +1142,33 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.plotTimeSlice()
         self.scaleIndividualTimeSlices = False
 
+    def setDataToPlot(self, kinetic):
+        self.plottedKinetic = kinetic
+        # rebuilt from the new kinetic when next shown
+        self.heatmapPyramid = None
+        self.dataToPlot = kinetic.toDataFrame()
+        self.varianceToPlot = None
+        if kinetic.variance is not None:
+            self.varianceToPlot = pd.DataFrame(kinetic.variance, index=kinetic.wavelengths, columns=kinetic.times)
+
+    def decimated(self, ax, x, y, xlim=None, logX=False):
+        '''
+        Only the points of a trace that show at the plot's current size, see
+        plotDecimation.decimate.
+        '''
+        return decimate(x, y, ax.get_window_extent().width, xlim=xlim, logX=logX)
+
     def plotTimeSlice(self):
         time = self.sliderKeys[int(self.timeSlider.value())]
         data = self.dataToPlot[time]
+        xmin = self.timeSliceWlMinSpinBox.value()
+        xmax = self.timeSliceWlMaxSpinBox.value()
         ax = self.timeSlicePlot.ax
         ax.cla()
-        ax.plot(data.index, data, 'r-')
+        ax.plot(*self.decimated(ax, data.index, data.values, xlim=(xmin, xmax)), 'r-')
         ax.set_title('t = {0}ns'.format(time))
         if not self.autoscaleCheckBox.isChecked() and not self.scaleIndividualTimeSlices:
             ax.set_ylim([self.dataToPlot.min().min()-10, self.dataToPlot.max().max()+10])
-        xmin = self.timeSliceWlMinSpinBox.value()
-        xmax = self.timeSliceWlMaxSpinBox.value()
         ax.set_xlim([xmin, xmax])
         ax.set_xlabel('Wavelength (nm)')
         ax.set_ylabel('Signal (counts)')
@@ -560,6 +1178,7 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
             ax.axvline(self.kineticCentreWlSpinBox.value()+self.kineticAveragingSpinBox.value(), color='0.5', linestyle=':')
         self.timeSlicePlot.tight_layout()
         self.timeSlicePlot.draw()
+        self.updateHeatmap()
 
     def setupKineticsPlot(self):
         self.kineticCentreWlSpinBox.setValue(np.round(np.mean(self.dataToPlot.index)))
@@ -568,54 +1187,197 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
         self.kineticNormalisedCheckBox.setChecked(True)
 
     def getKineticSlice(self):
-        if self.kineticIntegratedCheckBox.isChecked():
-            data = self.dataToPlot.apply(lambda x: np.trapz(x.values, x=x.index.values))
-        else:
-            centreWavelength = self.kineticCentreWlSpinBox.value()
-            plusMinus = self.kineticAveragingSpinBox.value()
-            data = self.dataToPlot[self.dataToPlot.index > centreWavelength-plusMinus]
-            data = data[data.index < centreWavelength+plusMinus]
-            data = data.mean()
-        return data
+        centreWavelength = self.kineticCentreWlSpinBox.value()
+        plusMinus = self.kineticAveragingSpinBox.value()
+        integrated = self.kineticIntegratedCheckBox.isChecked()
+        return kp.getKineticSlice(self.dataToPlot, centreWavelength, plusMinus, integrated)
 
     def plotKinetic(self):
         ms = 4
         mc = 'bo'
         data = self.getKineticSlice()
+        error = None
+        if self.varianceToPlot is not None:
+            error = kp.getKineticSliceError(self.varianceToPlot, self.kineticCentreWlSpinBox.value(),
+                                            self.kineticAveragingSpinBox.value(), self.kineticIntegratedCheckBox.isChecked())
         if self.kineticNormalisedCheckBox.isChecked():
+            if error is not None:
+                error = error/data.max()
             data = data/data.max()
             ylabel = 'Normalised Signal'
         else:
             ylabel = 'Signal (counts)'
         ax = self.kineticsPlot.ax
         ax.cla()
-        if self.kineticLogTCheckBox.isChecked() and not self.kineticLogYCheckBox.isChecked():
+        # only the plotted points are thinned, saving uses getKineticSlice
+        logT = self.kineticLogTCheckBox.isChecked()
+        if logT and not self.kineticLogYCheckBox.isChecked():
             data = data[data.index > 0]
-            ax.semilogx(data.index, data, mc, markersize=ms)
-        elif self.kineticLogYCheckBox.isChecked() and not self.kineticLogTCheckBox.isChecked():
+            x, y = self.decimated(ax, data.index, data.values, logX=logT)
+            ax.semilogx(x, y, mc, markersize=ms)
+        elif self.kineticLogYCheckBox.isChecked() and not logT:
             data = data[data > 0]
-            ax.semilogy(data.index, data, mc, markersize=ms)
-        elif self.kineticLogYCheckBox.isChecked() and self.kineticLogTCheckBox.isChecked():
+            x, y = self.decimated(ax, data.index, data.values)
+            ax.semilogy(x, y, mc, markersize=ms)
+        elif self.kineticLogYCheckBox.isChecked() and logT:
             data = data[data.index > 0]
             data = data[data > 0]
-            ax.loglog(data.index, data, mc, markersize=ms)
+            x, y = self.decimated(ax, data.index, data.values, logX=logT)
+            ax.loglog(x, y, mc, markersize=ms)
         else:
-            ax.plot(data.index, data, mc, markersize=ms)
+            x, y = self.decimated(ax, data.index, data.values)
+            ax.plot(x, y, mc, markersize=ms)
+        if error is not None:
+            # one standard error either side, from the spread of the repeats,
+            # at the plotted points only (the decimated points are a subset)
+            error = error[x].values
+            ax.fill_between(x, y-error, y+error, color='b', alpha=0.2, linewidth=0)
         ax.set_xlabel('Time (ns)')
         ax.set_ylabel(ylabel)
         self.kineticsPlot.tight_layout()
         self.kineticsPlot.draw()
 
+    def showHeatmapToggled(self, checked):
+        self.heatmapDock.setVisible(checked)
+        if checked and self.sliderKeys:
+            self.updateHeatmap()
+
+    def setupHeatmap(self):
+        '''
+        Build the image pyramid of the plotted kinetic (see heatmapPyramid)
+        and set up the heatmap axes on it, showing all of it.
+        '''
+        kinetic = self.plottedKinetic
+        try:
+            with self.profiler.stage('heatmap', kinetic=kinetic):
+                self.heatmapPyramid = HeatmapPyramid(kinetic.data, kinetic.wavelengths, kinetic.times)
+        except ValueError as e:
+            self.displayStatus('no heatmap: {0}'.format(e), 'red', msecs=4000)
+            return False
+        extent = self.heatmapPyramid.extent()
+        ax = self.heatmapPlot.ax
+        ax.cla()
+        self.heatmapImage = ax.imshow(np.zeros((1, 1)), extent=extent, origin='lower', aspect='auto',
+                                      interpolation='nearest', vmin=self.heatmapPyramid.limits[0],
+                                      vmax=self.heatmapPyramid.limits[1])
+        ax.set_xlim(extent[:2])
+        ax.set_ylim(sorted(extent[2:]))
+        # the time axis is log10(t), labelled in ns a decade apart
+        ax.xaxis.set_major_locator(MultipleLocator(1))
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda x, pos: '{0:g}'.format(10**x)))
+        ax.set_xlabel('Time (ns)')
+        ax.set_ylabel('Wavelength (nm)')
+        self.heatmapTimeLine = ax.axvline(extent[0], color='w', linewidth=0.8)
+        self.heatmapWavelengthLine = ax.axhline(extent[2], color='w', linewidth=0.8)
+        # cla clears these
+        ax.callbacks.connect('xlim_changed', self.renderHeatmap)
+        ax.callbacks.connect('ylim_changed', self.renderHeatmap)
+        self.heatmapPlot.tight_layout()
+        self.heatmapToolbar.update()
+        self.renderHeatmap()
+        return True
+
+    def renderHeatmap(self, *args):
+        '''
+        Draw the part of the pyramid in view, at the plot's current size.
+        Only called when the view changes (pan, zoom, resize).
+        '''
+        if self.heatmapPyramid is None:
+            return
+        ax = self.heatmapPlot.ax
+        size = ax.get_window_extent()
+        image, extent = self.heatmapPyramid.view(ax.get_xlim(), ax.get_ylim(), size.width, size.height)
+        self.heatmapImage.set_data(image)
+        self.heatmapImage.set_extent(extent)
+        self.heatmapPlot.draw_idle()
+
+    def updateHeatmap(self):
+        '''
+        Move the heatmap crosshairs to the plotted time slice and kinetic,
+        first building the heatmap if the plotted kinetic has changed.
+        '''
+        if not self.heatmapDock.isVisible() or self.plottedKinetic is None:
+            return
+        if self.heatmapPyramid is None and not self.setupHeatmap():
+            return
+        time = float(self.sliderKeys[int(self.timeSlider.value())])
+        self.heatmapTimeLine.set_visible(time > 0)
+        if time > 0:
+            self.heatmapTimeLine.set_xdata([np.log10(time)]*2)
+        self.heatmapWavelengthLine.set_visible(not self.kineticIntegratedCheckBox.isChecked())
+        self.heatmapWavelengthLine.set_ydata([self.kineticCentreWlSpinBox.value()]*2)
+        self.heatmapPlot.draw_idle()
+
+    def heatmapClicked(self, event):
+        '''
+        Clicking or dragging on the heatmap picks the time slice (the nearest
+        gate) and the kinetic's centre wavelength, unless panning or zooming.
+        '''
+        # moves do not say which buttons are held before matplotlib 3.7, so a
+        # drag is followed from the left (1) button's press to its release
+        if event.name == 'button_release_event':
+            if event.button == 1:
+                self.heatmapDragging = False
+            return
+        if self.heatmapPyramid is None or event.inaxes is not self.heatmapPlot.ax or self.heatmapToolbar.mode:
+            return
+        if event.name == 'button_press_event':
+            self.heatmapDragging = event.button == 1
+        if not self.heatmapDragging:
+            return
+        times = np.array([float(self.sliderKeys[index]) for index in range(self.timeSlider.maximum()+1)])
+        positive = np.flatnonzero(times > 0)
+        self.timeSlider.setValue(int(positive[np.argmin(np.abs(np.log10(times[positive])-event.xdata))]))
+        self.kineticCentreWlSpinBox.setValue(event.ydata)
+
+    def plotDecayFit(self, trace, fit, model):
+        times = trace.index.values[trace.index.values > 0].astype(float)
+        decayFit = DecayFit(model)
+        names = decayFit.parameterNames
+        curve = decayFit.evaluate(times, fit[names].values, fit[decayFit.amplitudeNames].values)[0]
+        if self.kineticNormalisedCheckBox.isChecked():
+            curve = curve/trace.max()
+        label = ', '.join('{0} = {1:.3g}'.format(name, fit[name].iloc[0]) for name in names)
+        ax = self.kineticsPlot.ax
+        ax.plot(times, curve, 'r-', label=label)
+        ax.legend()
+        self.kineticsPlot.draw()
+
+    def plotScree(self, scree):
+        ax = self.kineticsPlot.ax
+        ax.cla()
+        ax.semilogy(scree.index, scree['singularValue'], 'bo-', markersize=4)
+        ax.set_xlabel('Component')
+        ax.set_ylabel('Singular value')
+        self.kineticsPlot.tight_layout()
+        self.kineticsPlot.draw()
+
 ###############################################################################
 ##########################    SAVING METHODS    ###############################
 ###############################################################################
 
     def saveCompleteKinetic(self):
-        self.completeKinetic.to_csv(os.path.join(self.directory, 'completeKinetic.csv'))
-        savedir = os.path.join(self.directory, 'kinetic_joins')
-        if not os.path.exists(savedir):
-            os.makedirs(savedir)
-        np.savetxt(os.path.join(savedir, 'overlappedTimes.txt'), self.overlappingTimesList, fmt='%s')
+        with self.profiler.stage('save', kinetic=self.completeKinetic):
+            self.completeKinetic.toDataFrame().to_csv(os.path.join(self.directory, 'completeKinetic.csv'))
+            if self.completeKinetic.variance is not None:
+                variance = pd.DataFrame(self.completeKinetic.variance, index=self.completeKinetic.wavelengths, columns=self.completeKinetic.times)
+                variance.to_csv(os.path.join(self.directory, 'completeKineticVariance.csv'))
+            savedir = os.path.join(self.directory, 'kinetic_joins')
+            if not os.path.exists(savedir):
+                os.makedirs(savedir)
+            np.savetxt(os.path.join(savedir, 'overlappedTimes.txt'),
+                       kp.overlappedTimesTable(self.overlappingTimesList, self.scalingFactors), fmt='%s')
+            # the same, plus the segments and their intermediates, for
+            # opening from notebooks without parsing (see chunkedStore)
+            try:
+                saveResults(ChunkedStore(os.path.join(self.directory, RESULTS_FOLDER)), self.completeKinetic,
+                            self.scalingFactors, self.overlappingTimesList, self.kineticsDict, self.segmentStages)
+            except OSError as e:
+                # on Windows files another program has open cannot be replaced
+                self.saveRunLog()
+                self.displayStatus('saved completeKinetic.csv, but not {0}: {1}'.format(RESULTS_FOLDER, e), 'red')
+                return
+        self.saveRunLog()
         self.displayStatus('data saved to {0}'.format(os.path.join(self.directory, 'completeKinetic.csv')), 'blue', msecs=4000)
 
     def saveKineticSlice(self):
@@ -631,7 +1393,15 @@ class App(QtWidgets.QMainWindow, Ui_MainWindow):
 
 
 if __name__ == "__main__":
+    profile = '--profile' in sys.argv
+    if profile:
+        sys.argv.remove('--profile')
+    processes = 1
+    if '--processes' in sys.argv:
+        index = sys.argv.index('--processes')
+        processes = int(sys.argv[index+1])
+        del sys.argv[index:index+2]
     app = QtWidgets.QApplication(sys.argv)
-    window = App()
+    window = App(profile=profile, processes=processes)
     window.showMaximized()
     sys.exit(app.exec_())
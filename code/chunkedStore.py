@@ -0,0 +1,268 @@
+import os
+import json
+import numpy as np
+from kineticDataset import KineticDataset, _toJson
+
+'''
+On-disk store for arrays too large to hold in memory, and for results to be
+opened by other programs. A store is a folder holding each array as a raw
+binary file (C order, no header) and an index.json giving every array's
+file, dtype and shape, plus any attributes. Arrays are opened as numpy
+memmaps, so only the parts actually touched are read, and an array can be
+grown a block of rows at a time when its final size is not known in advance
+(e.g. while parsing a file).
+
+A KineticDataset is kept as a group of arrays under one name,
+'<name>/data', '<name>/wavelengths', '<name>/times' and optionally
+'<name>/background' and '<name>/variance', with its metadata and history as
+the group's attributes.
+
+Save Data in the app writes its results to a store (see saveResults), which
+a notebook or script opens with no parsing and without the app:
+
+    from chunkedStore import ChunkedStore
+    store = ChunkedStore('path/to/results_store', mode='r')
+    kinetic = store.dataset('completeKinetic')
+    sfs = store.table('scalingFactors')
+
+The data are read only memmaps, so any number of processes can open the
+same store at once and share one copy of it in the page cache. Without this
+module, np.memmap(file, dtype, 'r', shape=shape) with the entry of
+index.json reads any array.
+'''
+
+INDEX_FILE = 'index.json'
+RESULTS_FOLDER = 'results_store'
+
+
+class ChunkedStore(object):
+    '''
+    Parameters
+    ----------
+    directory : str
+        Folder of the store, created if it does not exist.
+    mode : {'r', 'a'}, optional
+        Read only, or read and write (the default).
+    '''
+
+    def __init__(self, directory, mode='a'):
+        self.directory = directory
+        self.mode = mode
+        if os.path.exists(os.path.join(directory, INDEX_FILE)):
+            self.reload()
+        elif mode == 'r':
+            raise OSError('no chunked store in {0}'.format(directory))
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self._arrays, self.attrs = {}, {}
+            self.flush()
+
+    def reload(self):
+        '''
+        Read the index again, to see what another process has written since
+        the store was opened.
+        '''
+        with open(os.path.join(self.directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self._arrays, self.attrs = index['arrays'], index['attrs']
+
+    def names(self):
+        return list(self._arrays)
+
+    def datasets(self):
+        '''
+        Names of the KineticDatasets in the store.
+        '''
+        return [name[:-len('/data')] for name in self._arrays if name.endswith('/data')]
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def _path(self, name):
+        return os.path.join(self.directory, self._arrays[name]['file'])
+
+    def _checkWritable(self):
+        if self.mode == 'r':
+            raise OSError('store {0} is open read only'.format(self.directory))
+
+    def _add(self, name, shape, dtype):
+        self._checkWritable()
+        if name in self._arrays:
+            self.delete(name)
+        filename = name.replace('/', '.')+'.bin'
+        self._arrays[name] = {'file': filename, 'dtype': np.dtype(dtype).str, 'shape': list(shape)}
+        return os.path.join(self.directory, filename)
+
+    def create(self, name, shape, dtype=np.float64):
+        '''
+        New array of zeros, returned as a writable memmap. The file is
+        extended rather than written, so this takes no time.
+        '''
+        path = self._add(name, shape, dtype)
+        with open(path, 'wb') as f:
+            f.truncate(int(np.prod(shape))*np.dtype(dtype).itemsize)
+        self.flush()
+        return self.array(name, writable=True)
+
+    def write(self, name, array):
+        '''
+        Store an in-memory array, replacing any of the same name. A process
+        that already has the old array open keeps reading the old one.
+        '''
+        array = np.ascontiguousarray(array)
+        self._checkWritable()
+        filename = name.replace('/', '.')+'.bin'
+        path = os.path.join(self.directory, filename)
+        array.tofile(path+'.tmp')
+        os.replace(path+'.tmp', path)
+        self._arrays[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        self.flush()
+
+    def append(self, name, rows, dtype=None):
+        '''
+        Add rows to the end of an array, creating it from the first block.
+        The index is not rewritten for every block, so call flush once all
+        of them are in.
+        '''
+        rows = np.asarray(rows, dtype=dtype)
+        if name not in self._arrays:
+            self._add(name, (0,)+rows.shape[1:], rows.dtype)
+            open(self._path(name), 'wb').close()
+        entry = self._arrays[name]
+        if list(rows.shape[1:]) != entry['shape'][1:]:
+            raise ValueError('rows of shape {0} do not fit {1} of shape {2}'.format(rows.shape[1:], name, entry['shape']))
+        with open(self._path(name), 'ab') as f:
+            np.ascontiguousarray(rows, dtype=entry['dtype']).tofile(f)
+        entry['shape'][0] += rows.shape[0]
+
+    def array(self, name, writable=False):
+        '''
+        The array as a memmap, read only unless writable is True.
+        '''
+        entry = self._arrays[name]
+        shape = tuple(entry['shape'])
+        if int(np.prod(shape)) == 0:
+            # mmap cannot map an empty file
+            return np.empty(shape, dtype=entry['dtype'])
+        if writable:
+            self._checkWritable()
+        return np.memmap(self._path(name), dtype=entry['dtype'], mode='r+' if writable else 'r', shape=shape)
+
+    def delete(self, name):
+        self._checkWritable()
+        path = self._path(name)
+        del self._arrays[name]
+        if os.path.exists(path):
+            os.remove(path)
+        self.flush()
+
+    def deleteDataset(self, name):
+        for arrayName in self.names():
+            if arrayName.startswith(name+'/'):
+                self.delete(arrayName)
+        self.attrs.pop(name, None)
+        self.flush()
+
+    def clear(self):
+        for name in self.names():
+            self.delete(name)
+        self.attrs = {}
+        self.flush()
+
+    def flush(self):
+        '''
+        Write the index. Done after every change except append.
+        '''
+        if self.mode == 'r':
+            return
+        indexPath = os.path.join(self.directory, INDEX_FILE)
+        with open(indexPath+'.tmp', 'w') as f:
+            json.dump({'arrays': self._arrays, 'attrs': self.attrs}, f, indent=1, default=_toJson)
+        os.replace(indexPath+'.tmp', indexPath)
+
+    def saveTable(self, name, table):
+        '''
+        Store a small DataFrame, such as the scaling factors, in the index.
+        '''
+        split = json.loads(table.to_json(orient='split'))
+        split['indexName'] = table.index.name
+        self.attrs[name] = {'table': split}
+        self.flush()
+
+    def table(self, name):
+        import pandas as pd
+        split = self.attrs[name]['table']
+        table = pd.DataFrame(split['data'], index=split['index'], columns=split['columns'])
+        table.index.name = split['indexName']
+        return table
+
+    def saveDataset(self, name, dataset):
+        '''
+        Store an in-memory KineticDataset under name.
+        '''
+        self.write(name+'/data', dataset.data)
+        if dataset.variance is not None:
+            self.write(name+'/variance', dataset.variance)
+        self.saveAxes(name, dataset)
+
+    def saveAxes(self, name, dataset, times=None):
+        '''
+        Store everything of a dataset except its data, e.g. once the data
+        has been written block by block into '<name>/data'.
+        '''
+        self.write(name+'/wavelengths', dataset.wavelengths)
+        self.write(name+'/times', dataset.times if times is None else times)
+        if dataset.background is not None:
+            self.write(name+'/background', dataset.background)
+        self.attrs[name] = {'metadata': dataset.metadata, 'history': dataset.history}
+        self.flush()
+
+    def dataset(self, name, writable=False):
+        '''
+        The KineticDataset stored under name, its data a memmap of the
+        stored array rather than a copy.
+        '''
+        attrs = self.attrs.get(name, {})
+        optional = {key: self.array(name+'/'+key) if name+'/'+key in self else None for key in ('background', 'variance')}
+        return KineticDataset(self.array(name+'/data', writable=writable), np.array(self.array(name+'/wavelengths')),
+                              np.array(self.array(name+'/times')), metadata=attrs.get('metadata'),
+                              history=[tuple(step) for step in attrs.get('history', [])], **optional)
+
+
+def saveResults(store, completeKinetic, sfs=None, overlappedTimes=None, segments=None, stages=None):
+    '''
+    Write a processing run to store: the joined kinetic as 'completeKinetic',
+    the scaling factors as the table 'scalingFactors' and the time of each
+    join as the attribute 'overlappedTimes'.
+
+    Parameters
+    ----------
+    segments : dict, optional
+        Join index to the background subtracted segment, each saved as
+        'segment<index>'.
+    stages : dict, optional
+        Join index to {stage name: result} (see StageGraph.processSegment),
+        each intermediate saved as 'segment<index>_<stage>', e.g.
+        'segment2_cosmic_rays'. Results that are arrays rather than
+        datasets (backgrounds) are saved as plain arrays.
+    '''
+    # nothing left over from an earlier run with more segments or stages
+    store.clear()
+    store.saveDataset('completeKinetic', completeKinetic)
+    if sfs is not None:
+        store.saveTable('scalingFactors', sfs)
+    if overlappedTimes is not None:
+        store.attrs['overlappedTimes'] = list(overlappedTimes)
+    for index, segment in (segments or {}).items():
+        store.saveDataset('segment{0}'.format(index), segment)
+    for index, results in (stages or {}).items():
+        final = (segments or {}).get(index)
+        for stage, value in results.items():
+            name = 'segment{0}_{1}'.format(index, stage.replace(' ', '_'))
+            if value is final:
+                continue
+            if isinstance(value, KineticDataset):
+                store.saveDataset(name, value)
+            else:
+                store.write(name, value)
+    store.flush()
@@ -1,3 +1,4 @@
+import importlib.util
 import numpy as np
 import pandas as pd
 
@@ -5,48 +6,57 @@ import pandas as pd
 Thanks to Francesco Rossetto for the algorithm.
 '''
 
+# numba is optional and slow to import, so only check that it is there;
+# numbaKernels is imported the first time a kernel is used
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+
+def resolveNumba(useNumba=None):
+    '''
+    Whether to use the numba kernels: useNumba=None means whenever numba is
+    installed. Raises ImportError if they are asked for without numba.
+    '''
+    if useNumba is None:
+        return NUMBA_AVAILABLE
+    if useNumba and not NUMBA_AVAILABLE:
+        raise ImportError('useNumba=True but numba is not installed')
+    return bool(useNumba)
+
+
 class CosmicRayRemoval(object):
-    
-    def __init__(self):
-        pass
+
+    def __init__(self, blockColumns=512, useNumba=None):
+        # spectra are independent, so they are cleaned in blocks of columns to
+        # keep the float64 temporaries small for large single precision stacks
+        self.blockColumns = blockColumns
+        self.useNumba = resolveNumba(useNumba)
 
     @staticmethod
-    def _movavg1d(a, *arg):
-        '''
-        Moving average for 1-d numpy arrays, called by movavg().
-        '''
+    def _windowSizes(arg):
         if len(arg) == 0: raise TypeError('movavg expected 1 argument, got 0')
         elif len(arg) == 1: l = r = arg[0]
         elif len(arg) == 2: l, r = arg
         else: raise TypeError('movavg expected at most 2 arguments, got {}'.format(len(arg)))
-        N = len(a)
-        b = np.array([None]*N)
-        for i in range(N):
-            n_i = i - l if i-l > 0 else 0
-            n_f = i + r if i+r < N else N
-            b[i] = np.mean(a[n_i:n_f+1])
-        return b
-    
+        return l, r
+
+    def _movavg1d(self, a, *arg):
+        '''
+        Moving average for 1-d numpy arrays.
+        '''
+        return self._movavg(a, *arg)
+
     def _crremove1d(self, a, **kwarg):
         '''
-        Cosmic rays removal for 1-d numpy arrays, called by crremove()
+        Cosmic rays removal for 1-d numpy arrays.
         '''
-        n = kwarg.pop('n', 10)
-        thr = kwarg.pop('threshold', 10.)
-        if kwarg: raise TypeError('crremove() got an unexpected keyword argument \'{}\''.format(kwarg.popitem()[0]))
-        smooth = self._movavg(a, n)
-        res = (a - smooth)**2
-        res /= np.mean(res)
-        ind = np.where(res > thr)
-        b = np.empty_like(a)
-        for i in range(len(a)):
-            b[i] = smooth[i] if i in tuple(map(tuple, ind))[0] else a[i]
-        return b
-    
+        return self._crremove(a, **kwarg)
+
     def _movavg(self, inarr, *arg, **kwarg):
         '''
-        Moving average for numpy arrays.
-        
+        Moving average for numpy arrays, computed from a cumulative sum along
+        the axis so the whole array is averaged at once. The window is
+        truncated at the ends of the axis.
+
         Parameters
         ----------
         inarr : ndarray
@@ -57,12 +67,12 @@ class CosmicRayRemoval(object):
             it's going to be the size of the left and right span respectively.
         axis : int, optional
             Axis on which the function is applied.
-        
+
         Returns
         -------
-        out : ndarray
+        out : float64 ndarray
             Moving average of the input array.
-            
+
         Examples
         --------
         >>> import numpy as np
@@ -71,18 +81,28 @@ class CosmicRayRemoval(object):
         array([ 0.32998439,  0.67953025,  0.48393839, ...,  0.14899097,
             0.69393512,  0.49948959])
         >>> movavg(rnd,10)
-        array([0.61760506276997718, 0.62464670813790357, 0.62971175629157217, ...,
-           0.45550012798103856, 0.4483887547214726, 0.40823090604608248], dtype=object)
+        array([0.61760506, 0.62464671, 0.62971176, ..., 0.45550013,
+            0.44838875, 0.40823091])
         '''
         ax = kwarg.pop('axis', 0)
         if kwarg: raise TypeError('movavg() got an unexpected keyword argument \'{}\''.format(kwarg.popitem()[0]))
-        b = np.apply_along_axis(self._movavg1d, ax,inarr, *arg, **kwarg)
-        return b
-    
+        l, r = self._windowSizes(arg)
+        a = np.moveaxis(np.asarray(inarr), ax, 0)
+        N = a.shape[0]
+        # accumulate in float64 whatever the input precision
+        c = np.zeros((N+1,)+a.shape[1:])
+        np.cumsum(a, axis=0, dtype=np.float64, out=c[1:])
+        i = np.arange(N)
+        n_i = np.clip(i-l, 0, None)
+        n_f = np.clip(i+r+1, None, N)
+        shape = (N,)+(1,)*(a.ndim-1)
+        b = (c[n_f]-c[n_i])/(n_f-n_i).reshape(shape)
+        return np.moveaxis(b, 0, ax)
+
     def _crremove(self, inarr, **kwarg):
         '''
         Simple cosmic rays removal algorithm.
-        
+
         Parameters
         ----------
         inarr : ndarray
@@ -94,34 +114,63 @@ class CosmicRayRemoval(object):
         threshold : float, optional
             Threshold at which the average quadratic deviation is high enough to
             be considered a cosmic ray. Default is 10.0.
-        
+
         Returns
         -------
         out : ndarray
-            Cleaned spectra.
+            Cleaned spectra, in the precision of the input.
         '''
         ax = kwarg.pop('axis', 0)
-        b = np.apply_along_axis(self._crremove1d, ax, inarr, **kwarg)
-        return b
-    
+        n = kwarg.pop('n', 10)
+        thr = kwarg.pop('threshold', 10.)
+        if kwarg: raise TypeError('crremove() got an unexpected keyword argument \'{}\''.format(kwarg.popitem()[0]))
+        smooth = self._movavg(inarr, n, axis=ax)
+        res = (inarr - smooth)**2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            res /= np.mean(res, axis=ax, keepdims=True)
+        b = np.where(res > thr, smooth, inarr)
+        return b.astype(np.result_type(inarr, np.float32), copy=False)
+
+    def removeCosmicRays(self, inarr, iterations=2):
+        '''
+        Cosmic ray removal on a 2-d numpy array, one spectrum per column.
+
+        Parameters
+        ----------
+        inarr : ndarray with wavelength along axis 0, times along axis 1
+        iterations : int, optional
+            Number of passes of the algorithm. Default is 2.
+
+        Returns
+        -------
+        out : float ndarray of the same shape and precision with cosmic rays removed
+        '''
+        correctedArray = np.empty(inarr.shape, dtype=np.result_type(inarr, np.float32))
+        if self.useNumba:
+            import numbaKernels
+            # the window and threshold are the _crremove defaults
+            return numbaKernels.removeCosmicRays(inarr, correctedArray, 10, 10., iterations)
+        for start in range(0, inarr.shape[1], self.blockColumns):
+            block = slice(start, start+self.blockColumns)
+            corrected = self._crremove(inarr[:, block])
+            for i in range(iterations-1):
+                corrected = self._crremove(corrected)
+            correctedArray[:, block] = corrected
+        return correctedArray
+
     def removeCosmicRaysPandasDataFrame(self, df, iterations=2):
         '''
         Wraps the numpy methods from Francesco around a Pandas DataFrame
         Allows for direct integration with Kinetic Joining app
-        
+
         Parameters
         ----------
         df : pandas dataframe with index as wavelength, columns as times
-        
+
         Returns
         -------
         out : the same dataframe but with cosmic rays removed
         '''
-        numpyArray = df.values
-        correctedArray = self._crremove(numpyArray)
-        if iterations > 1:
-            for i in range(iterations-1):
-                correctedArray = self._crremove(correctedArray)
+        correctedArray = self.removeCosmicRays(df.values, iterations=iterations)
         correctedDF = pd.DataFrame(index=df.index, columns=df.columns, data=correctedArray)
         return correctedDF
-        
\ No newline at end of file
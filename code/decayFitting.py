@@ -0,0 +1,228 @@
+import numpy as np
+
+'''
+Exponential decay fits to every row of a kinetic at once. Each model is a sum
+of decay shapes that depend non-linearly on a few parameters (the lifetimes,
+and the stretching exponent), each with a linear amplitude:
+
+    mono        a exp(-t/tau)
+    bi          a1 exp(-t/tau1) + a2 exp(-t/tau2)
+    stretched   a exp(-(t/tau)**beta)
+
+The amplitudes are solved in closed form for any choice of the non-linear
+parameters (variable projection, Golub and Pereyra), so Levenberg-Marquardt
+only searches over the lifetimes, using Kaufman's approximation to the
+Jacobian of the projected residual. Every row of a block is stepped together
+with stacked linear algebra, each with its own damping, and rows stop once
+they have converged.
+
+On noisy rows the residual is large and the Gauss-Newton curvature can be
+half the true one, so an undamped step overshoots the minimum to the far
+side of it. The damping therefore follows how much of the predicted drop in
+the sum of squares each step achieves (Nielsen's update), not just whether
+the step lowered it.
+'''
+
+MODELS = {
+    'mono': (['tau'], ['amplitude']),
+    'bi': (['tau1', 'tau2'], ['amplitude1', 'amplitude2']),
+    'stretched': (['tau', 'beta'], ['amplitude']),
+}
+
+
+class DecayFit(object):
+    '''
+    Parameters
+    ----------
+    model : {'mono', 'bi', 'stretched'}
+    maxIterations : int, optional
+        Most Levenberg-Marquardt steps for any row.
+    tolerance : float, optional
+        A row has converged once a step lowers its sum of squares by less
+        than this fraction, or moves none of its parameters by more than
+        this (relative to the lifetimes, which are fitted as logarithms).
+    blockRows : int, optional
+        Rows fitted together, which bounds the memory used for long
+        kinetics.
+    '''
+
+    def __init__(self, model='mono', maxIterations=100, tolerance=1e-8, blockRows=256):
+        if model not in MODELS:
+            raise ValueError('model must be one of {0}, got {1!r}'.format(', '.join(MODELS), model))
+        self.model = model
+        self.maxIterations = maxIterations
+        self.tolerance = tolerance
+        self.blockRows = blockRows
+
+    @property
+    def parameterNames(self):
+        return MODELS[self.model][0]
+
+    @property
+    def amplitudeNames(self):
+        return MODELS[self.model][1]
+
+    def fit(self, times, data):
+        '''
+        Fit every row of data.
+
+        Parameters
+        ----------
+        times : 1-d array_like
+            Times after time zero, all positive.
+        data : 2-d array_like
+            One decay per row, one column per time.
+
+        Returns
+        -------
+        parameters : ndarray, shape (rows, len(parameterNames))
+            Lifetimes in the units of times (for 'bi' the shorter first),
+            and beta for 'stretched'.
+        amplitudes : ndarray, shape (rows, len(amplitudeNames))
+        rms : ndarray
+            Root mean square residual of each row.
+        converged : bool ndarray
+        '''
+        times = np.asarray(times, dtype=np.float64)
+        data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+        numParameters, numAmplitudes = len(self.parameterNames), len(self.amplitudeNames)
+        parameters = np.empty((data.shape[0], numParameters))
+        amplitudes = np.empty((data.shape[0], numAmplitudes))
+        cost = np.empty(data.shape[0])
+        converged = np.zeros(data.shape[0], dtype=bool)
+        for start in range(0, data.shape[0], self.blockRows):
+            rows = slice(start, start+self.blockRows)
+            parameters[rows], amplitudes[rows], cost[rows], converged[rows] = self._fitBlock(times, data[rows])
+        parameters, amplitudes = self._toNatural(parameters, amplitudes)
+        return parameters, amplitudes, np.sqrt(cost/times.size), converged
+
+    def evaluate(self, times, parameters, amplitudes):
+        '''
+        The fitted decays, one row per row of parameters.
+        '''
+        p = np.atleast_2d(np.asarray(parameters, dtype=np.float64)).copy()
+        if self.model != 'stretched':
+            p = np.log(p)
+        else:
+            p[:, 0] = np.log(p[:, 0])
+        basis = self._basis(np.asarray(times, dtype=np.float64), p)[0]
+        return np.einsum('rtm,rm->rt', basis, np.atleast_2d(amplitudes))
+
+    def _basis(self, t, p):
+        '''
+        Decay shapes, shape (rows, times, amplitudes), and their derivatives
+        with respect to each fitted parameter. Lifetimes are fitted as their
+        logarithm, which keeps them positive and the steps scale free.
+        '''
+        if self.model == 'stretched':
+            x = t[None, :]/np.exp(p[:, :1])
+            beta = p[:, 1:]
+            u = x**beta
+            f = np.exp(-u)
+            with np.errstate(divide='ignore'):
+                logX = np.where(x > 0, np.log(x), 0.)
+            return f[..., None], [(beta*u*f)[..., None], (-u*logX*f)[..., None]]
+        decays = np.exp(-t[None, :, None]/np.exp(p)[:, None, :])
+        derivatives = []
+        for k in range(p.shape[1]):
+            d = np.zeros_like(decays)
+            d[..., k] = t[None, :]/np.exp(p[:, k:k+1])*decays[..., k]
+            derivatives.append(d)
+        return decays, derivatives
+
+    def _project(self, t, y, p):
+        '''
+        Best amplitudes for parameters p, the residuals they leave and
+        Kaufman's Jacobian of those residuals, shape (rows, times, parameters).
+        '''
+        basis, derivatives = self._basis(t, p)
+        gram = np.einsum('rtm,rtn->rmn', basis, basis)
+        # a little ridge keeps coincident lifetimes from making it singular
+        gram += 1e-12*np.trace(gram, axis1=1, axis2=2)[:, None, None]*np.eye(gram.shape[-1])+np.finfo(float).tiny
+
+        def residual(v):
+            coef = np.linalg.solve(gram, np.einsum('rtm,rt->rm', basis, v)[..., None])[..., 0]
+            return coef, v-np.einsum('rtm,rm->rt', basis, coef)
+
+        amplitudes, r = residual(y)
+        jacobian = np.stack([-residual(np.einsum('rtm,rm->rt', d, amplitudes))[1] for d in derivatives], axis=-1)
+        return amplitudes, r, jacobian
+
+    def _initialParameters(self, t, y):
+        # the area under a single exponential over its peak is its lifetime
+        peak = np.maximum(y.max(axis=1), np.finfo(float).tiny)
+        widths = np.diff(np.r_[0., t])
+        tau = np.clip((np.clip(y, 0, None)*widths).sum(axis=1)/peak, t.min(), t.max())
+        logTau = np.log(tau)[:, None]
+        if self.model == 'mono':
+            return logTau
+        if self.model == 'bi':
+            return np.hstack([logTau-np.log(3.), logTau+np.log(3.)])
+        return np.hstack([logTau, np.full_like(logTau, 0.7)])
+
+    def _bounds(self, t, numParameters):
+        # lifetimes far outside the measured times are not determined by it
+        lower = np.full(numParameters, np.log(t.min())-3.)
+        upper = np.full(numParameters, np.log(t.max())+3.)
+        if self.model == 'stretched':
+            lower[1], upper[1] = 0.05, 1.
+        return lower, upper
+
+    def _fitBlock(self, t, y):
+        p = self._initialParameters(t, y)
+        amplitudes, r, jacobian = self._project(t, y, p)
+        cost = np.einsum('rt,rt->r', r, r)
+        damping = np.full(y.shape[0], 1e-3)
+        converged = np.zeros(y.shape[0], dtype=bool)
+        lower, upper = self._bounds(t, p.shape[1])
+        identity = np.eye(p.shape[1])
+        for _ in range(self.maxIterations):
+            active = np.flatnonzero(~converged)
+            if active.size == 0:
+                break
+            J, ra = jacobian[active], r[active]
+            jtj = np.einsum('rtk,rtl->rkl', J, J)
+            diagonal = np.maximum(np.diagonal(jtj, axis1=1, axis2=2), np.finfo(float).tiny)
+            lhs = jtj+damping[active, None, None]*diagonal[:, :, None]*identity
+            gradient = np.einsum('rtk,rt->rk', J, ra)
+            step = -np.linalg.solve(lhs, gradient[..., None])[..., 0]
+            pinned = ((p[active] <= lower) & (step < 0)) | ((p[active] >= upper) & (step > 0))
+            if pinned.any():
+                # hold parameters at a bound the step would take them past,
+                # and step the others alone
+                free = ~pinned
+                lhs = lhs*free[:, :, None]*free[:, None, :]+pinned[:, :, None]*identity
+                step = -np.linalg.solve(lhs, (gradient*free)[..., None])[..., 0]
+            trial = np.clip(p[active]+step, lower, upper)
+            step = trial-p[active]
+            # drop in the sum of squares the linearised residual predicts
+            predicted = -np.einsum('rk,rk->r', step, 2*gradient+np.einsum('rkl,rl->rk', jtj, step))
+            trialAmplitudes, trialR, trialJacobian = self._project(t, y[active], trial)
+            trialCost = np.einsum('rt,rt->r', trialR, trialR)
+            better = trialCost < cost[active]
+            accepted = active[better]
+            gain = (cost[accepted]-trialCost[better])
+            converged[accepted] = ((gain <= self.tolerance*cost[accepted]) |
+                                   (np.abs(step[better]).max(axis=1) <= self.tolerance))
+            p[accepted], amplitudes[accepted] = trial[better], trialAmplitudes[better]
+            r[accepted], jacobian[accepted], cost[accepted] = trialR[better], trialJacobian[better], trialCost[better]
+            with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+                ratio = np.where(predicted[better] > 0, gain/predicted[better], 1.)
+            damping[accepted] *= np.maximum(1/3., 1-(2*np.minimum(ratio, 1.)-1)**3)
+            rejected = active[~better]
+            damping[rejected] *= 4.
+            # no step lowers the cost even when tiny: already at the minimum
+            converged[rejected[damping[rejected] > 1e12]] = True
+        return p, amplitudes, cost, converged
+
+    def _toNatural(self, p, amplitudes):
+        parameters = p.copy()
+        if self.model == 'stretched':
+            parameters[:, 0] = np.exp(p[:, 0])
+            return parameters, amplitudes
+        parameters = np.exp(p)
+        if self.model == 'bi':
+            order = np.argsort(parameters, axis=1)
+            parameters = np.take_along_axis(parameters, order, axis=1)
+            amplitudes = np.take_along_axis(amplitudes, order, axis=1)
+        return parameters, amplitudes
@@ -0,0 +1,149 @@
+import numpy as np
+
+'''
+Display-side image of a whole kinetic for the heatmap panel. The kinetic is
+resampled once onto columns evenly spaced in log time, then halved in both
+directions level by level, so that any view of it can be drawn from the
+coarsest level that still has a cell per screen pixel, cropped to what is
+visible. Panning or zooming then draws an image the size of the axes
+whatever the size of the kinetic. Only the displayed copy is resampled;
+saved data always has every point.
+'''
+
+# columns of the finest level, at most
+MAX_COLUMNS = 2048
+# levels stop halving once both sides are this small
+MIN_SIZE = 64
+
+
+class HeatmapPyramid(object):
+    '''
+    Image pyramid of a kinetic on a log10 time axis. Only gates after time
+    zero are shown, as on the log time kinetic plot.
+
+    Parameters
+    ----------
+    data : ndarray
+        Kinetic, shape (wavelengths, times).
+    wavelengths, times : array_like
+        Its axes. The wavelengths are taken as evenly spaced, as they are
+        across a detector.
+    maxColumns : int, optional
+        Columns of the finest level, at most. There are fewer if the gates
+        are sparser than that in log time.
+    minSize : int, optional
+        Size below which no coarser level is made.
+
+    Raises
+    ------
+    ValueError
+        If no gate is after time zero.
+    '''
+
+    def __init__(self, data, wavelengths, times, maxColumns=MAX_COLUMNS, minSize=MIN_SIZE):
+        wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        gates = np.flatnonzero(times > 0)
+        if gates.size == 0:
+            raise ValueError('no gates after time zero to show on a log time axis')
+        logTimes = np.log10(times[gates])
+        order = np.argsort(logTimes, kind='stable')
+        gates, logTimes = gates[order], logTimes[order]
+        low, high = logTimes[0], logTimes[-1]
+        steps = np.diff(logTimes)
+        steps = steps[steps > 0]
+        numColumns = 1 if steps.size == 0 else int(min(np.ceil((high-low)/steps.min())+1, maxColumns))
+        # the first and last gates in the middle of the end columns, or half
+        # a decade either side of a single time
+        self.columnWidth = 1. if numColumns == 1 else (high-low)/(numColumns-1)
+        self.timeOrigin = low-self.columnWidth/2
+        numRows = len(wavelengths)
+        self.rowHeight = (wavelengths[-1]-wavelengths[0])/(numRows-1) if numRows > 1 else 1.
+        self.wavelengthOrigin = wavelengths[0]-self.rowHeight/2
+        image = _resampleMatrix(logTimes, gates, len(times), self.timeOrigin, self.columnWidth, numColumns).dot(
+            np.asarray(data, dtype=np.float64).T).T.astype(np.float32)
+        self.levels = [image]
+        while max(image.shape) > minSize and min(image.shape) >= 2:
+            rows, columns = image.shape[0]//2*2, image.shape[1]//2*2
+            image = image[:rows, :columns].reshape(rows//2, 2, columns//2, 2).mean(axis=(1, 3))
+            self.levels.append(image)
+        finite = self.levels[0][np.isfinite(self.levels[0])]
+        # colour limits robust to a few hot pixels
+        self.limits = tuple(np.percentile(finite, [1, 99.5])) if finite.size else (0., 1.)
+
+    def extent(self):
+        '''
+        (left, right, bottom, top) of the whole image, time in log10.
+        '''
+        return self._extent(0, 0, self.levels[0].shape[1], 0, self.levels[0].shape[0])
+
+    def _extent(self, level, firstColumn, lastColumn, firstRow, lastRow):
+        scale = 2**level
+        return (self.timeOrigin+firstColumn*scale*self.columnWidth, self.timeOrigin+lastColumn*scale*self.columnWidth,
+                self.wavelengthOrigin+firstRow*scale*self.rowHeight, self.wavelengthOrigin+lastRow*scale*self.rowHeight)
+
+    def view(self, xlim, ylim, width, height):
+        '''
+        The image to draw for the visible range.
+
+        Parameters
+        ----------
+        xlim : (float, float)
+            Visible log10 time range.
+        ylim : (float, float)
+            Visible wavelength range.
+        width, height : float
+            Size of the axes in screen pixels.
+
+        Returns
+        -------
+        image : ndarray
+            Cells of the coarsest level with at least one per pixel across
+            the visible range in both directions (or of the finest level,
+            zoomed in further than that), cropped to the visible range plus
+            a cell either side.
+        extent : tuple
+            (left, right, bottom, top) of image, as for imshow.
+        '''
+        xlim, ylim = sorted(xlim), sorted(ylim)
+        level = 0
+        for candidate in range(1, len(self.levels)):
+            scale = 2**candidate
+            if ((xlim[1]-xlim[0])/(scale*self.columnWidth) < width or
+                    (ylim[1]-ylim[0])/(scale*abs(self.rowHeight)) < height):
+                break
+            level = candidate
+        image = self.levels[level]
+        scale = 2**level
+        columns = _visibleCells(xlim, self.timeOrigin, scale*self.columnWidth, image.shape[1])
+        rows = _visibleCells(ylim, self.wavelengthOrigin, scale*self.rowHeight, image.shape[0])
+        return image[rows[0]:rows[1], columns[0]:columns[1]], self._extent(level, columns[0], columns[1], rows[0], rows[1])
+
+
+def _visibleCells(limits, origin, size, numCells):
+    # cells overlapping limits, with a margin of one; size may be negative
+    # for an axis running backwards
+    edges = sorted(((limits[0]-origin)/size, (limits[1]-origin)/size))
+    first = int(np.clip(np.floor(edges[0])-1, 0, numCells-1))
+    last = int(np.clip(np.ceil(edges[1])+1, first+1, numCells))
+    return first, last
+
+
+def _resampleMatrix(logTimes, gates, numGates, origin, columnWidth, numColumns):
+    '''
+    Sparse (numColumns, numGates) matrix averaging the gates (sorted by log
+    time) falling in each column; a column with none takes the nearest gate.
+    '''
+    from scipy.sparse import csr_matrix
+    bins = np.clip(((logTimes-origin)/columnWidth).astype(np.int64), 0, numColumns-1)
+    counts = np.bincount(bins, minlength=numColumns)
+    empty = np.flatnonzero(counts == 0)
+    centres = origin+(empty+0.5)*columnWidth
+    # (with a single gate there is a single column, so none is empty)
+    after = np.clip(np.searchsorted(logTimes, centres), 1, len(logTimes)-1)
+    before = after-1
+    nearest = np.where(centres-logTimes[before] < logTimes[after]-centres, before, after)
+    rows = np.concatenate([bins, empty])
+    columns = np.concatenate([gates, gates[nearest]])
+    weights = np.concatenate([1/counts[bins], np.ones(empty.size)])
+    return csr_matrix((weights, (rows, columns)), shape=(numColumns, numGates))
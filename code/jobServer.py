@@ -0,0 +1,677 @@
+import os
+import sys
+import hmac
+import json
+import time
+import queue
+import socket
+import struct
+import secrets
+import tempfile
+import argparse
+import itertools
+import threading
+import socketserver
+import http.client
+import multiprocessing
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from session import Session, CACHE_FOLDER
+from stageGraph import StageGraph
+
+'''
+A job queue for a processing PC shared by several people. Rather than each
+app instance holding every kinetic in memory, sessions are submitted to a
+server, which runs them a few at a time, each in a fresh process so its
+memory is given back when it finishes, with one parsed file cache shared by
+all the jobs (see StageGraph).
+
+One server is shared by everyone on the PC. It listens on a Unix socket in
+a shared folder, and asks the system which user is at the other end of each
+connection (SO_PEERCRED, or LOCAL_PEERCRED on macOS). A job is only taken if
+that user can read every file of the session and write to its output
+folder, judged by the files' permissions for them rather than for the
+server. A server started as root runs each job as its submitter, so the
+system enforces the same; otherwise jobs run as the server's user. The
+parsed file cache is in the shared folder too, group writable, so files are
+parsed once whoever submits them.
+
+Where there are no Unix sockets (Windows) the server listens on a localhost
+port instead and serves only the user who started it, answering requests
+carrying the token it wrote to a file in their home folder.
+
+    python jobServer.py serve --workers 2
+    python jobServer.py submit mySession.json
+    python jobServer.py status
+
+A job is a session as saved (see Session.toContent) plus the folder its
+relative paths are from and the folder to save the results in, as
+session.py would. The app's File > Submit to Job Server does the same for
+the files and settings it has.
+
+The HTTP interface is JSON throughout:
+
+    POST   /jobs       submit a job, returns its id
+    GET    /jobs       every job
+    GET    /jobs/<id>  one job
+    DELETE /jobs/<id>  cancel a job, stopping it if it is running
+'''
+
+STATE_DIR = os.path.join(os.path.expanduser('~'), '.iccd-kinetics')
+# the socket and cache of the server shared by every user
+SHARED_DIR = '/var/tmp/iccd-kinetics' if hasattr(socket, 'AF_UNIX') else STATE_DIR
+DEFAULT_SOCKET = os.path.join(SHARED_DIR, 'jobServer.sock')
+DEFAULT_PORT = 8765
+# a socket path (str) or a localhost port (int)
+DEFAULT_ADDRESS = DEFAULT_SOCKET if hasattr(socket, 'AF_UNIX') else DEFAULT_PORT
+# the token a server on a port expects, readable only by its user
+TOKEN_FILE = os.path.join(STATE_DIR, 'jobServer.token')
+TOKEN_HEADER = 'X-Job-Token'
+DEFAULT_WORKERS = 2
+# shared by every job, wherever its data is
+DEFAULT_CACHE = os.path.join(SHARED_DIR, CACHE_FOLDER)
+# a shared folder: group writable, and its files take the folder's group
+SHARED_MODE = 0o2775
+# finished jobs remembered, the oldest are forgotten beyond this
+MAX_FINISHED = 100
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobServerError(Exception):
+    pass
+
+
+class JobQueue(object):
+    '''
+    Jobs in the order they were submitted, run at most workers at a time,
+    each in a new process, so a job's memory is given back as it finishes
+    and a job that crashes (or runs out of memory) takes nothing else with
+    it.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Jobs run at once. Default is 2.
+    cacheDir : str, optional
+        Parsed file cache shared by the jobs, made a shared folder (see
+        SHARED_MODE). Default is DEFAULT_CACHE. Jobs run as a user who cannot
+        write to it parse their files without it.
+    maxFinished : int, optional
+        Finished jobs kept for status, the oldest are dropped beyond it.
+    '''
+
+    def __init__(self, workers=DEFAULT_WORKERS, cacheDir=DEFAULT_CACHE, maxFinished=MAX_FINISHED):
+        self.workers = workers
+        self.cacheDir = cacheDir
+        _makeShared(cacheDir)
+        self.maxFinished = maxFinished
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._processes = {}
+        self._threads = [threading.Thread(target=self._dispatch, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, content, directory, output=None, onDisk=False, calibrate=True, user=None):
+        '''
+        Queue a session (toContent's dict, relative paths from directory),
+        its results to be saved in output (default directory), for user,
+        (uid, gid), or None for the server's own user.
+
+        Raises
+        ------
+        ValueError
+            If the session is not one, or user cannot read its files or
+            write to output, so a bad job is refused at once.
+
+        Returns
+        -------
+        str
+            The job id.
+        '''
+        try:
+            session = Session.fromContent(content, directory)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError('not a session: {0!r}'.format(e))
+        if user is not None:
+            uid, gid = user
+            user = (uid, gid, _groups(uid, gid))
+        unreadable = [path for path in session.paths() if not _readable(path, user)]
+        if unreadable:
+            raise ValueError('cannot read {0}'.format(', '.join(unreadable)))
+        if not _writable(output or directory, user):
+            raise ValueError('cannot write to {0}'.format(output or directory))
+        with self._lock:
+            self._prune()
+            jobId = str(next(self._ids))
+            self._jobs[jobId] = {
+                'id': jobId,
+                'state': 'queued',
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+                'numSegments': len(session.segments),
+                'uid': None if user is None else user[0],
+                'user': _userName(user),
+                'output': output or directory,
+                'error': None,
+                'shape': None,
+            }
+        self._queue.put((jobId, content, directory, output or directory, onDisk, calibrate, user))
+        return jobId
+
+    def status(self, jobId=None):
+        '''
+        A copy of one job's record, or of every job's.
+
+        Raises
+        ------
+        KeyError
+            For an unknown job.
+        '''
+        with self._lock:
+            if jobId is None:
+                return [dict(job) for job in self._jobs.values()]
+            return dict(self._jobs[jobId])
+
+    def cancel(self, jobId, user=None):
+        '''
+        Cancel a job, stopping it if it is running. Returns False if it has
+        already finished.
+
+        Raises
+        ------
+        PermissionError
+            If user, (uid, gid), is neither root nor the job's submitter.
+        '''
+        with self._lock:
+            job = self._jobs[jobId]
+            if user is not None and user[0] not in (0, job['uid']):
+                raise PermissionError('job {0} was submitted by {1}'.format(jobId, job['user']))
+            if job['state'] in FINISHED:
+                return False
+            job['state'] = 'cancelled'
+            job['finished'] = time.time()
+            process = self._processes.get(jobId)
+        if process is not None:
+            process.terminate()
+        return True
+
+    def _prune(self):
+        # with the lock held
+        finished = [jobId for jobId, job in self._jobs.items() if job['state'] in FINISHED]
+        for jobId in finished[:max(len(finished)-self.maxFinished, 0)]:
+            del self._jobs[jobId]
+
+    def _dispatch(self):
+        # one of these per worker, so a job is only marked running once it
+        # has a worker to itself
+        context = multiprocessing.get_context('spawn')
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            jobId = task[0]
+            with self._lock:
+                # started under the lock, so a cancel either finds it queued
+                # or finds its process
+                # (a job cancelled while queued may be forgotten already)
+                if jobId not in self._jobs or self._jobs[jobId]['state'] != 'queued':
+                    continue
+                receiver, sender = context.Pipe(duplex=False)
+                # spawned, as in sharedArrays
+                process = context.Process(target=_runJob, args=(sender,)+task[1:]+(self.cacheDir,))
+                self._jobs[jobId].update(state='running', started=time.time())
+                self._processes[jobId] = process
+                process.start()
+            sender.close()
+            try:
+                state, value = receiver.recv()
+            except EOFError:
+                # the process ended without a word: killed, or cancelled
+                process.join()
+                state, value = 'failed', 'the job process exited with code {0}'.format(process.exitcode)
+            process.join()
+            receiver.close()
+            with self._lock:
+                del self._processes[jobId]
+                job = self._jobs.get(jobId)
+                if job is not None and job['state'] == 'running':
+                    job.update({'state': state, 'finished': time.time(), 'shape' if state == 'done' else 'error': value})
+
+    def close(self):
+        '''
+        Stop taking jobs off the queue and stop any job still running.
+        '''
+        for _ in self._threads:
+            self._queue.put(None)
+        with self._lock:
+            processes = list(self._processes.values())
+        for process in processes:
+            process.terminate()
+        for thread in self._threads:
+            thread.join()
+
+
+def _makeShared(folder):
+    os.makedirs(folder, exist_ok=True)
+    try:
+        os.chmod(folder, SHARED_MODE)
+    except PermissionError:
+        # made by another user, who has shared it already
+        pass
+
+
+def _groups(uid, gid):
+    # every group of a user, as the system counts them for permissions
+    try:
+        import pwd
+        return set(os.getgrouplist(pwd.getpwuid(uid).pw_name, gid))
+    except (ImportError, KeyError):
+        return {gid}
+
+
+def _userName(user):
+    if user is None:
+        return None
+    try:
+        import pwd
+        return pwd.getpwuid(user[0]).pw_name
+    except (ImportError, KeyError):
+        return str(user[0])
+
+
+def _permitted(path, user, bits):
+    # whether user, (uid, gid, groups), has the permission bits (4 read, 2
+    # write, 1 search) on path, from its mode as the system would judge it
+    # (ACLs aside); root may do anything
+    uid, gid, groups = user
+    if uid == 0:
+        return True
+    stat = os.stat(path)
+    if stat.st_uid == uid:
+        shift = 6
+    elif stat.st_gid in groups:
+        shift = 3
+    else:
+        shift = 0
+    return (stat.st_mode >> shift) & bits == bits
+
+
+def _reachable(path, user):
+    # every folder above path can be searched by user
+    folder = os.path.dirname(os.path.abspath(path))
+    while True:
+        if not _permitted(folder, user, 1):
+            return False
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return True
+        folder = parent
+
+
+def _readable(path, user=None):
+    # by user, (uid, gid, groups), or with None by this process
+    if not os.path.isfile(path):
+        return False
+    if user is None:
+        return os.access(path, os.R_OK)
+    return _reachable(path, user) and _permitted(path, user, 4)
+
+
+def _writable(folder, user=None):
+    # folder, or the nearest folder above it that exists (it is made with
+    # makedirs), is writable by user, or with None by this process
+    folder = os.path.abspath(folder)
+    while not os.path.exists(folder):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return False
+        folder = parent
+    if not os.path.isdir(folder):
+        return False
+    if user is None:
+        return os.access(folder, os.W_OK)
+    return _reachable(folder, user) and _permitted(folder, user, 3)
+
+
+def _peerUser(connection):
+    # (uid, gid) of the process at the other end of a Unix socket, or None
+    # where the system cannot say
+    if hasattr(socket, 'SO_PEERCRED'):
+        # Linux: struct ucred {pid, uid, gid}
+        pid, uid, gid = struct.unpack('3i', connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                                   struct.calcsize('3i')))
+        return uid, gid
+    if sys.platform == 'darwin':
+        # struct xucred {cr_version, cr_uid, cr_ngroups, cr_groups[16]}, at
+        # level SOL_LOCAL (0)
+        credentials = connection.getsockopt(0, getattr(socket, 'LOCAL_PEERCRED', 1), struct.calcsize('IIh16I'))
+        version, uid, numGroups, gid = struct.unpack_from('IIhI', credentials)
+        return uid, gid
+    return None
+
+
+def _runJob(sender, content, directory, output, onDisk, calibrate, user, cacheDir):
+    # in the job's own process; the outcome is sent back as (state, value)
+    try:
+        if user is not None and os.geteuid() == 0 and user[0] != 0:
+            # the system checks every file as it would for the submitter
+            uid, gid, groups = user
+            os.setgroups(list(groups))
+            os.setgid(gid)
+            os.setuid(uid)
+        # new files shared with the group, as the cache folder is
+        os.umask(0o002)
+        if not os.access(cacheDir, os.W_OK | os.X_OK):
+            cacheDir = None
+        if user is not None and os.getuid() == user[0]:
+            # numba keeps compiled kernels beside the code, which the
+            # submitter may not be able to write to (numbaKernels is only
+            # imported once a kernel is used)
+            os.environ['NUMBA_CACHE_DIR'] = tempfile.mkdtemp() if cacheDir is None else os.path.join(cacheDir, 'numba')
+        session = Session.fromContent(content, directory)
+        session.cacheDir = cacheDir
+        os.makedirs(output, exist_ok=True)
+        completeKinetic, sfs = session.runToFolder(output, onDisk=onDisk, calibrate=calibrate)
+        sender.send(('done', list(completeKinetic.shape)))
+    except Exception as e:
+        sender.send(('failed', '{0}: {1}'.format(type(e).__name__, e)))
+    finally:
+        sender.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # the JobQueue (and token, if any) are set on the server, see makeServer
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        token = self.server.token
+        if token is None:
+            # on the shared socket every request is from the user the
+            # system says it is
+            self.user = _peerUser(self.connection)
+            if self.user is None:
+                self._reply(403, {'error': 'cannot tell which user is asking on this system'})
+                return False
+        else:
+            # a server on a port answers only its own user, who can read its token
+            if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), token):
+                self._reply(403, {'error': 'wrong or missing job server token'})
+                return False
+            self.user = None
+        return True
+
+    def _reply(self, code, value):
+        body = json.dumps(value).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _jobId(self):
+        parts = self.path.strip('/').split('/')
+        if parts[0] != 'jobs' or len(parts) > 2:
+            return None, False
+        return (parts[1] if len(parts) == 2 else None), True
+
+    def do_GET(self):
+        jobId, valid = self._jobId()
+        if not valid:
+            return self._reply(404, {'error': 'no such path'})
+        try:
+            self._reply(200, self.server.jobs.status(jobId))
+        except KeyError:
+            self._reply(404, {'error': 'no job {0}'.format(jobId)})
+
+    def do_POST(self):
+        jobId, valid = self._jobId()
+        if not valid or jobId is not None:
+            return self._reply(404, {'error': 'no such path'})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            jobId = self.server.jobs.submit(request['session'], request['directory'], request.get('output'),
+                                            bool(request.get('onDisk', False)), bool(request.get('calibrate', True)),
+                                            self.user)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._reply(400, {'error': str(e)})
+        self._reply(201, {'id': jobId})
+
+    def do_DELETE(self):
+        jobId, valid = self._jobId()
+        if not valid or jobId is None:
+            return self._reply(404, {'error': 'no such path'})
+        try:
+            cancelled = self.server.jobs.cancel(jobId, self.user)
+        except KeyError:
+            return self._reply(404, {'error': 'no job {0}'.format(jobId)})
+        except PermissionError as e:
+            return self._reply(403, {'error': str(e)})
+        if not cancelled:
+            return self._reply(409, {'error': 'job {0} has already finished'.format(jobId)})
+        self._reply(200, self.server.jobs.status(jobId))
+
+    def log_message(self, format, *args):
+        # quiet, the jobs are what matter
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def makeServer(address=DEFAULT_ADDRESS, workers=DEFAULT_WORKERS, cacheDir=DEFAULT_CACHE, tokenFile=TOKEN_FILE):
+    '''
+    The HTTP server, not yet serving (call serve_forever, and server_close
+    then server.jobs.close to stop).
+
+    Parameters
+    ----------
+    address : str or int, optional
+        Path of a Unix socket, which every user may connect to, in a shared
+        folder (see SHARED_MODE). Or a localhost port, 0 for any free one
+        (found afterwards from server.server_address), for this user alone:
+        the server then writes a new token to tokenFile and refuses requests
+        without it.
+
+    Raises
+    ------
+    JobServerError
+        If a server is already listening on the socket.
+    '''
+    if isinstance(address, str):
+        _makeShared(os.path.dirname(os.path.abspath(address)))
+        if os.path.exists(address):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(address)
+            except OSError:
+                # left by a server that did not shut down
+                os.remove(address)
+            else:
+                raise JobServerError('a job server is already running on {0}'.format(address))
+        server = _UnixHTTPServer(address, _Handler)
+        # open to all: each request is checked as the user who sent it
+        os.chmod(address, 0o666)
+        server.token = None
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', address), _Handler)
+        server.token = secrets.token_hex(16)
+        os.makedirs(os.path.dirname(os.path.abspath(tokenFile)), mode=0o700, exist_ok=True)
+        # written readable by this user alone
+        if os.path.exists(tokenFile):
+            os.remove(tokenFile)
+        with os.fdopen(os.open(tokenFile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+            f.write(server.token)
+    server.jobs = JobQueue(workers, cacheDir)
+    return server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, socketPath, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socketPath)
+
+
+class JobClient(object):
+    '''
+    Submits jobs to, and polls, the shared job server at a socket path, or
+    this user's at a localhost port (see makeServer).
+
+    Raises JobServerError if the server cannot be reached or refuses a
+    request.
+    '''
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=10., tokenFile=TOKEN_FILE):
+        self.address = address
+        self.timeout = timeout
+        self.tokenFile = tokenFile
+
+    def _connection(self):
+        if isinstance(self.address, str):
+            return _UnixConnection(self.address, self.timeout), {}
+        try:
+            with open(self.tokenFile) as f:
+                headers = {TOKEN_HEADER: f.read().strip()}
+        except OSError:
+            # no server has run here; the request will say so
+            headers = {}
+        return http.client.HTTPConnection('127.0.0.1', self.address, timeout=self.timeout), headers
+
+    def _request(self, method, path='', value=None):
+        body = None if value is None else json.dumps(value).encode()
+        connection, headers = self._connection()
+        headers['Content-Type'] = 'application/json'
+        try:
+            connection.request(method, '/jobs'+path, body=body, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+        except OSError as e:
+            raise JobServerError('no job server at {0}: {1}'.format(self.address, e))
+        finally:
+            connection.close()
+        try:
+            reply = json.loads(content)
+        except ValueError:
+            raise JobServerError('unexpected reply from {0}: {1}'.format(self.address, response.reason))
+        if response.status >= 400:
+            raise JobServerError(reply.get('error', response.reason))
+        return reply
+
+    def submit(self, session, directory, output=None, onDisk=False, calibrate=True, stageGraph=None):
+        '''
+        Submit a Session, its paths saved relative to directory. Pass the
+        app's stageGraph to reuse the file hashes it has, otherwise those
+        recorded in the session are. Returns the job id.
+        '''
+        if stageGraph is None:
+            stageGraph = StageGraph()
+            session.rememberFiles(stageGraph)
+        content = session.toContent(directory, stageGraph)
+        return self._request('POST', value={'session': content, 'directory': directory, 'output': output,
+                                            'onDisk': onDisk, 'calibrate': calibrate})['id']
+
+    def status(self, jobId=None):
+        return self._request('GET', '' if jobId is None else '/'+jobId)
+
+    def cancel(self, jobId):
+        return self._request('DELETE', '/'+jobId)
+
+    def wait(self, jobId, interval=1., timeout=None):
+        '''
+        Poll a job until it is done, failed or cancelled, and return its
+        record.
+        '''
+        started = time.time()
+        while True:
+            job = self.status(jobId)
+            if job['state'] in ('done', 'failed', 'cancelled'):
+                return job
+            if timeout is not None and time.time()-started > timeout:
+                raise JobServerError('job {0} still {1} after {2} s'.format(jobId, job['state'], timeout))
+            time.sleep(interval)
+
+
+def _describe(job):
+    line = '{0}: {1}, {2} segments -> {3}'.format(job['id'], job['state'], job['numSegments'], job['output'])
+    if job['user'] is not None:
+        line = '{0} ({1})'.format(line, job['user'])
+    if job['error']:
+        line += ' ({0})'.format(job['error'])
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Queue sessions on the job server shared by this PC.')
+    parser.add_argument('--port', type=int, help='use a localhost port (with a token) instead of {0}'.format(
+        DEFAULT_ADDRESS if isinstance(DEFAULT_ADDRESS, str) else 'a Unix socket'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run the server')
+    serve.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='jobs run at once')
+    serve.add_argument('--cache', default=DEFAULT_CACHE, help='parsed file cache shared by the jobs and users')
+    submit = commands.add_parser('submit', help='queue a saved session')
+    submit.add_argument('session', help='session .json file saved from the app')
+    submit.add_argument('--output', help='folder to save the results in, default the session folder')
+    submit.add_argument('--no-calibration', action='store_true', help='do not apply the calibration')
+    submit.add_argument('--out-of-core', action='store_true', help='process on disk, see session.py')
+    submit.add_argument('--wait', action='store_true', help='wait for the job to finish')
+    status = commands.add_parser('status', help='list the jobs, or show one')
+    status.add_argument('job', nargs='?')
+    cancel = commands.add_parser('cancel', help='cancel a job, stopping it if it is running')
+    cancel.add_argument('job')
+    args = parser.parse_args(argv)
+
+    address = DEFAULT_ADDRESS if args.port is None else args.port
+    if args.command == 'serve':
+        try:
+            server = makeServer(address, args.workers, args.cache)
+        except JobServerError as e:
+            print(e, file=sys.stderr)
+            return 1
+        listening = server.server_address if isinstance(address, str) else 'port {0}'.format(server.server_address[1])
+        print('job server on {0}, {1} workers, cache in {2}'.format(listening, args.workers, args.cache))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.jobs.close()
+            if isinstance(address, str) and os.path.exists(address):
+                os.remove(address)
+        return 0
+    client = JobClient(address)
+    try:
+        if args.command == 'submit':
+            directory = os.path.dirname(os.path.abspath(args.session))
+            jobId = client.submit(Session.load(args.session), directory, args.output and os.path.abspath(args.output),
+                                  args.out_of_core, not args.no_calibration)
+            print('submitted job {0}'.format(jobId))
+            if args.wait:
+                job = client.wait(jobId)
+                print(_describe(job))
+                return 0 if job['state'] == 'done' else 1
+        elif args.command == 'status':
+            jobs = client.status(args.job)
+            for job in (jobs if args.job is None else [jobs]):
+                print(_describe(job))
+        else:
+            print(_describe(client.cancel(args.job)))
+    except JobServerError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import json
+import numpy as np
+import pandas as pd
+
+
+class KineticDataset(object):
+    '''
+    One kinetic (or the spliced result) as a contiguous 2-d float array with
+    its axes held separately.
+
+    Parameters
+    ----------
+    data : ndarray
+        Signal, shape (len(wavelengths), len(times)).
+    wavelengths : ndarray
+        Wavelength (nm) of each row.
+    times : ndarray, optional
+        Time (ns) of each column, or the gate numbers 1..N until a time axis
+        has been added. Defaults to the gate numbers.
+    background : ndarray, optional
+        Background spectrum belonging to this kinetic, if one was recorded.
+    variance : ndarray, optional
+        Variance of each data point, same shape as data, once a step has
+        estimated it.
+    metadata : dict, optional
+        Anything else worth keeping, e.g. file path, start time, gate step.
+    history : list, optional
+        (stage, parameters) for every processing step applied so far.
+    dtype : dtype, optional
+        Precision to store the data in. By default float32 data is kept as
+        float32 and anything else is stored as float64.
+    '''
+
+    __slots__ = ('data', 'wavelengths', 'times', 'background', 'variance', 'metadata', 'history')
+
+    def __init__(self, data, wavelengths, times=None, background=None, metadata=None, history=None, dtype=None,
+                 variance=None):
+        data = np.asarray(data)
+        if dtype is None:
+            dtype = data.dtype if data.dtype in (np.float32, np.float64) else np.float64
+        self.data = np.ascontiguousarray(data, dtype=dtype)
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        if times is None:
+            times = np.arange(1, self.data.shape[1]+1)
+        self.times = np.asarray(times)
+        self.background = None if background is None else np.asarray(background, dtype=float)
+        self.variance = None if variance is None else np.ascontiguousarray(variance, dtype=self.data.dtype)
+        self.metadata = {} if metadata is None else dict(metadata)
+        self.history = [] if history is None else list(history)
+
+    @classmethod
+    def fromDataFrame(cls, df, background=None, dtype=None, **metadata):
+        '''
+        Wrap a DataFrame with wavelength as the index and time (or gate
+        number) as the columns. The values are not copied if they are
+        already a contiguous array of the requested precision.
+        '''
+        if isinstance(background, pd.Series):
+            background = background.values
+        return cls(df.values, df.index.values, df.columns.values, background=background, metadata=metadata, dtype=dtype)
+
+    @classmethod
+    def load(cls, filepath):
+        '''
+        Read a dataset written by save.
+        '''
+        with np.load(filepath) as arrays:
+            info = json.loads(str(arrays['info']))
+            optional = {name: arrays[name] if name in arrays else None for name in ('background', 'variance')}
+            return cls(arrays['data'], arrays['wavelengths'], arrays['times'], metadata=info['metadata'],
+                       history=[tuple(step) for step in info['history']], **optional)
+
+    def save(self, file):
+        '''
+        Write the dataset to a .npz file (a path or an open binary file),
+        which load reads back without any parsing. Metadata and history
+        are kept as JSON.
+        '''
+        arrays = {'data': self.data, 'wavelengths': self.wavelengths, 'times': self.times}
+        for name in ('background', 'variance'):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        info = {'metadata': self.metadata, 'history': self.history}
+        arrays['info'] = np.array(json.dumps(info, default=_toJson))
+        np.savez(file, **arrays)
+
+    def toDataFrame(self, copy=False):
+        '''
+        DataFrame view of the data (wavelength index, time columns), sharing
+        memory with the dataset unless copy is True.
+        '''
+        return pd.DataFrame(self.data, index=self.wavelengths, columns=self.times, copy=copy)
+
+    def copy(self, deep=True):
+        '''
+        Copy of the dataset. A shallow copy shares the data array but can
+        have its axes, metadata and history changed independently.
+        '''
+        data = self.data.copy() if deep else self.data
+        variance = self.variance
+        if deep and variance is not None:
+            variance = variance.copy()
+        return KineticDataset(data, self.wavelengths.copy(), self.times.copy(), self.background,
+                              self.metadata, self.history, variance=variance)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def addHistory(self, stage, **params):
+        self.history.append((stage, params))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        nbytes = self.data.nbytes+self.wavelengths.nbytes+self.times.nbytes
+        if self.background is not None:
+            nbytes += self.background.nbytes
+        if self.variance is not None:
+            nbytes += self.variance.nbytes
+        return nbytes
+
+    def spectrum(self, time):
+        '''
+        Spectrum at the given time (exact match).
+        '''
+        column = np.flatnonzero(self.times == time)[0]
+        return self.data[:, column]
+
+    def spectrumVariance(self, time):
+        '''
+        Variance of the spectrum at the given time, None without a variance.
+        '''
+        if self.variance is None:
+            return None
+        column = np.flatnonzero(self.times == time)[0]
+        return self.variance[:, column]
+
+    def __repr__(self):
+        return 'KineticDataset({0} wavelengths x {1} times, {2} steps)'.format(self.shape[0], self.shape[1], len(self.history))
+
+
+def _toJson(value):
+    # numpy scalars and arrays in metadata or history parameters
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
@@ -0,0 +1,730 @@
+import os
+import numpy as np
+import pandas as pd
+from kineticSplice import KineticSplice, bootstrapScalingFactor, estimateVariance, overlapScores, selectOverlapGates
+from cosmicRayRemoval import CosmicRayRemoval, resolveNumba
+from kineticDataset import KineticDataset
+from svdDenoise import SVDDenoise, screeTable
+from decayFitting import DecayFit, MODELS as DECAY_MODELS
+from repeatAverage import RepeatAverage
+from wavelengthGrid import sameWavelengths, commonGrid, interpolationMatrix
+
+'''
+The processing steps behind the app buttons, free of any GUI state, so that
+they can be driven headlessly (scripts, benchmarks) as well as by the app.
+'''
+
+NUM_PIXELS = 1024
+BOOTSTRAP_RESAMPLES = 2000
+LOG_POINTS_PER_DECADE = 20
+SVD_RANK = 10
+SCREE_COMPONENTS = 30
+# gates the scaling factor is fitted to: the earliest overlapped one, or the
+# best by signal-to-noise (see matchOverlap)
+OVERLAP_SELECTIONS = ('earliest', 'snr')
+# recorded for each join with 'snr' selection
+OVERLAP_COLUMNS = ['fitTime', 'fitGates', 'snr']
+
+# np.trapz was renamed in numpy 2
+trapezoid = getattr(np, 'trapezoid', None) or getattr(np, 'trapz')
+
+
+class NoOverlapError(Exception):
+    '''
+    Raised when two consecutive kinetics share no time point to join on.
+    '''
+    pass
+
+
+###############################################################################
+###########################    FILE READING    ################################
+###############################################################################
+
+def readKinetic(filepath, delimiter, nrows=NUM_PIXELS, dtype=np.float64, roi=None, binning=1):
+    '''
+    Read an Andor .asc kinetic series into a KineticDataset, with the gate
+    numbers as the time axis until one is added. The trailing delimiter on
+    each line gives an all-NaN column, which is dropped; any other missing
+    value means a short row, e.g. a file not yet fully written, and raises
+    ValueError. Pass
+    dtype=np.float32 to store the counts in single precision, and roi
+    and/or binning to keep only part of the spectrum (see cropAndBin).
+    '''
+    kinetic = pd.read_csv(filepath, index_col=0, header=None, nrows=nrows, sep=delimiter)
+    kinetic.dropna(axis=1, how='all', inplace=True)
+    if kinetic.isnull().values.any():
+        raise ValueError('{0} has incomplete rows'.format(os.path.basename(filepath)))
+    if roi is None and binning == 1:
+        dataset = KineticDataset.fromDataFrame(kinetic, dtype=dtype, filepath=filepath)
+    else:
+        wavelengths, data = cropAndBin(kinetic.index.values, kinetic.values, roi, binning)
+        _checkRows(wavelengths, filepath)
+        dataset = KineticDataset(data, wavelengths, kinetic.columns.values, metadata={'filepath': filepath}, dtype=dtype)
+    dataset.addHistory('read', filepath=filepath, delimiter=delimiter, roi=roi, binning=binning)
+    return dataset
+
+
+def readRepeats(filepaths, delimiter, nrows=NUM_PIXELS, dtype=np.float64, roi=None, binning=1):
+    '''
+    Read repeated acquisitions of one kinetic and average them, reading one
+    file at a time into a running average (see repeatAverage). The variance
+    of each averaged point, from the spread of the repeats, becomes the
+    dataset's variance; a single file has none. The repeats must have the
+    same wavelengths and number of gates.
+    '''
+    average = RepeatAverage()
+    wavelengths = times = None
+    for filepath in filepaths:
+        repeat = readKinetic(filepath, delimiter, nrows=nrows, roi=roi, binning=binning)
+        if wavelengths is None:
+            wavelengths, times = repeat.wavelengths, repeat.times
+        elif not np.array_equal(repeat.wavelengths, wavelengths):
+            raise ValueError('{0} has different wavelengths to {1}'.format(filepath, filepaths[0]))
+        average.add(repeat.data)
+        del repeat
+    dataset = KineticDataset(average.mean, wavelengths, times, metadata={'filepath': filepaths[0]},
+                             dtype=dtype, variance=average.varianceOfMean)
+    dataset.metadata['repeats'] = list(filepaths)
+    dataset.addHistory('read repeats', filepaths=list(filepaths), delimiter=delimiter, roi=roi, binning=binning)
+    return dataset
+
+
+def readBackground(filepath, delimiter, nrows=NUM_PIXELS, roi=None, binning=1):
+    '''
+    Read a background .asc file, keeping only the first column, as an array.
+    roi and binning must match those of the kinetic it belongs to.
+    '''
+    background = pd.read_csv(filepath, index_col=0, header=None, nrows=nrows, sep=delimiter)[1]
+    wavelengths, background = cropAndBin(background.index.values, background.values.astype(float), roi, binning)
+    _checkRows(wavelengths, filepath)
+    return background
+
+
+def _checkRows(wavelengths, filepath):
+    # an empty array would only fail much later, e.g. in the join
+    if len(wavelengths) == 0:
+        raise ValueError('no rows of {0} are inside the region of interest'.format(os.path.basename(filepath)))
+
+
+def cropAndBin(wavelengths, values, roi=None, binning=1):
+    '''
+    Keep only the rows with wavelengths inside roi = (min, max) nm, then sum
+    each run of binning adjacent rows into one, as on-chip binning would,
+    dropping any incomplete run at the end. Each binned row's wavelength is
+    the mean of the rows it is made from. Raises ValueError if roi does not
+    run from a lower to a higher wavelength; the readers raise it if no rows
+    are left.
+
+    Returns
+    -------
+    wavelengths, values : ndarray
+    '''
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    if roi is not None:
+        if not roi[0] < roi[1]:
+            raise ValueError('the region of interest must run from a lower to a higher wavelength, not {0} to {1} nm'.format(*roi))
+        keep = (wavelengths >= roi[0]) & (wavelengths <= roi[1])
+        wavelengths, values = wavelengths[keep], values[keep]
+    if binning > 1:
+        numRows = len(wavelengths)//binning*binning
+        wavelengths = wavelengths[:numRows].reshape(-1, binning).mean(axis=1)
+        values = values[:numRows].reshape((-1, binning)+values.shape[1:]).sum(axis=1)
+    return wavelengths, values
+
+
+def readCalibration(filepath):
+    '''
+    Read a two column (wavelength, correction) calibration file into a Series.
+    '''
+    calibration = pd.read_csv(filepath, index_col=0, header=None, sep=',').iloc[:, 0]
+    return calibration
+
+
+###############################################################################
+##########################    PROCESSING STEPS    #############################
+###############################################################################
+
+# Steps taking a KineticDataset modify it in place and return it for
+# convenience; copy first if the input must be kept.
+
+def constructTimeAxis(timeZero, startTime, gateStep, numPoints):
+    # time zero is taken off last, so a time shared by two segments comes out
+    # exactly the same in both even when time zero is not a whole number
+    axis = startTime+gateStep*np.arange(numPoints)-timeZero
+    return axis
+
+
+def addTimeAxis(kinetic, timeZero, startTime, gateStep):
+    '''
+    Replace the gate numbers with times relative to time zero.
+    '''
+    kinetic.times = constructTimeAxis(timeZero, startTime, gateStep, kinetic.shape[1])
+    kinetic.metadata.update(timeZero=timeZero, startTime=startTime, gateStep=gateStep)
+    kinetic.addHistory('time axis', timeZero=timeZero, startTime=startTime, gateStep=gateStep)
+    return kinetic
+
+
+def shiftTimeZero(kinetic, timeZero):
+    '''
+    Move the time zero of a kinetic that already has a time axis (see
+    addTimeAxis) to timeZero. Only the times are offset; the data and
+    everything else are left as they are.
+    '''
+    if 'timeZero' not in kinetic.metadata:
+        raise ValueError('the kinetic has no time axis to shift')
+    offset = timeZero-kinetic.metadata['timeZero']
+    if offset:
+        kinetic.times = kinetic.times-offset
+        kinetic.addHistory('time zero', timeZero=timeZero)
+    kinetic.metadata['timeZero'] = timeZero
+    return kinetic
+
+
+def estimateTimeZero(kinetic, startTime, gateStep, fraction=0.5, gateWidth=None):
+    '''
+    Time zero from the rise of the signal summed over all wavelengths: the
+    delay at which it first climbs fraction of the way from its level before
+    the rise to its peak, interpolated linearly between gates. Each gate
+    collects the signal for gateWidth after its delay, so it is that far up
+    when it opens (1-fraction) gate widths before a sharp rise; time zero is
+    that much later. A running median of three gates is taken first so a
+    cosmic ray cannot pass for the peak; it keeps the edge of the rise where
+    it is.
+
+    Parameters
+    ----------
+    kinetic : KineticDataset
+        A kinetic whose gates include some before time zero, normally the
+        first kinetic as read (a background only shifts the baseline).
+    startTime, gateStep : float
+        Delay of its first gate and between gates, in the same units as
+        time zero.
+    fraction : float, optional
+        Point of the rise taken as time zero. Default is 0.5.
+    gateWidth : float, optional
+        How long each gate is open. Default is gateStep, i.e. gates back to
+        back.
+
+    Returns
+    -------
+    float
+
+    Raises
+    ------
+    ValueError
+        If there is no rise clear of the noise before the peak.
+    '''
+    trace = kinetic.data.sum(axis=0, dtype=np.float64)
+    if trace.size >= 3:
+        trace[1:-1] = np.median(np.stack([trace[:-2], trace[1:-1], trace[2:]]), axis=0)
+    peak = int(np.argmax(trace))
+    if peak == 0:
+        raise ValueError('the signal peaks in the first gate, so there is no rise to find time zero from')
+    # the first half of the gates up to the peak are taken as the baseline
+    before = trace[:max(peak//2, 1)]
+    baseline = np.median(before)
+    noise = 1.4826*np.median(np.abs(before-baseline))
+    if trace[peak]-baseline <= 5*noise:
+        raise ValueError('no rise clear of the noise to find time zero from')
+    level = baseline+fraction*(trace[peak]-baseline)
+    crossing = int(np.argmax(trace[:peak+1] >= level))
+    gate = float(crossing)
+    if crossing > 0:
+        gate = crossing-1+(level-trace[crossing-1])/(trace[crossing]-trace[crossing-1])
+    if gateWidth is None:
+        gateWidth = gateStep
+    return startTime+gateStep*gate+(1-fraction)*gateWidth
+
+
+def removeCosmicRays(kinetic, pool=None):
+    '''
+    Cosmic ray removal on every gate. Given a pool (see sharedArrays.makePool)
+    the gates are split between its worker processes, which read and write
+    the stack through shared memory rather than having it pickled to them.
+    '''
+    if pool is None:
+        kinetic.data = np.ascontiguousarray(CosmicRayRemoval().removeCosmicRays(kinetic.data))
+    else:
+        import sharedArrays
+        kinetic.data = sharedArrays.mapColumnBlocks(_removeCosmicRaysBlock, kinetic.data, pool,
+                                                    dtype=np.result_type(kinetic.data, np.float32))
+    kinetic.addHistory('cosmic rays')
+    return kinetic
+
+
+def _removeCosmicRaysBlock(block):
+    return CosmicRayRemoval().removeCosmicRays(block)
+
+
+def estimateBackground(kinetic, backgroundEndTime):
+    '''
+    Background taken as the mean of all gates up to backgroundEndTime, for
+    when no separate background file was recorded.
+    '''
+    return kinetic.data[:, kinetic.times <= backgroundEndTime].mean(axis=1, dtype=np.float64)
+
+
+def subtractBackground(kinetic, background):
+    kinetic.data -= background[:, None]
+    kinetic.background = background
+    kinetic.addHistory('background')
+    return kinetic
+
+
+def resampleWavelengths(kinetic, wavelengths):
+    '''
+    Linearly interpolate kinetic (its data, variance and background) onto
+    wavelengths, which must lie within its own wavelength range. All the
+    gates are resampled by one sparse matrix product, see
+    wavelengthGrid.interpolationMatrix.
+    '''
+    matrix = interpolationMatrix(kinetic.wavelengths, wavelengths)
+    kinetic.data = matrix.dot(kinetic.data).astype(kinetic.dtype, copy=False)
+    if kinetic.variance is not None:
+        # the pixels are independent, so their weights add in quadrature
+        kinetic.variance = matrix.multiply(matrix).dot(kinetic.variance).astype(kinetic.dtype, copy=False)
+    if kinetic.background is not None:
+        kinetic.background = matrix.dot(kinetic.background)
+    kinetic.addHistory('resample wavelengths', first=wavelengths[0], last=wavelengths[-1], numPixels=len(wavelengths))
+    kinetic.wavelengths = np.array(wavelengths, dtype=np.float64)
+    return kinetic
+
+
+def alignWavelengths(kinetics):
+    '''
+    Put every kinetic of the ordered mapping on one wavelength grid, as
+    joining needs. If the grating calibration shifted between files their
+    axes differ slightly; the grid is then the first kinetic's wavelengths
+    within the range all of them cover, and the others are interpolated on
+    to it with resampleWavelengths. Kinetics already on the grid are passed
+    through as they are. None of the inputs is modified.
+
+    Returns
+    -------
+    dict
+        Join index to kinetic on the common grid, in the same order.
+    '''
+    if len(kinetics) < 2:
+        return dict(kinetics)
+    grid = commonGrid([kinetic.wavelengths for kinetic in kinetics.values()])
+    aligned = {}
+    for index, kinetic in kinetics.items():
+        if not sameWavelengths(kinetic.wavelengths, grid):
+            kinetic = resampleWavelengths(kinetic.copy(deep=False), grid)
+        aligned[index] = kinetic
+    return aligned
+
+
+def joinPair(joinedKinetic, toJoin, bootstrap=0, weighted=False, overlapSelection='earliest'):
+    '''
+    Scale toJoin onto joinedKinetic at their earliest common time and splice
+    it on, replacing the joined data from that time onwards. Neither input
+    is modified. The variances are spliced too if both kinetics have one.
+
+    With bootstrap > 0 a 95% confidence interval for the scaling factor is
+    also found from that many resamples of the pixels, and of the gates if
+    it is fitted to more than one (see kineticSplice.bootstrapScalingFactor).
+
+    With weighted the pixels are weighted in the fit by their inverse
+    variance, taken from the kinetics' variances (from repeats) or, for a
+    kinetic without one, estimated from shot and background noise by
+    kineticSplice.estimateVariance. The noisy wings of the spectra then
+    hardly move the scaling factor.
+
+    With overlapSelection 'snr' the scaling factor is fitted to the
+    overlapped gates with the best signal-to-noise rather than the earliest
+    (see matchOverlap); the splice is still made at the earliest.
+
+    Returns
+    -------
+    joined : KineticDataset
+        The spliced kinetic.
+    overlappedTime : float
+        Time the two were spliced at.
+    scalingFactor, scalingFactorError : float
+        Factor toJoin was multiplied by, and its error.
+    overlappedPair : tuple of ndarray
+        The two spectra at overlappedTime, before scaling.
+    interval : tuple of float or None
+        Bootstrap confidence interval of the scaling factor, if asked for.
+    selection : dict or None
+        The gates fitted with 'snr' selection, see matchOverlap.
+    '''
+    overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection = matchOverlap(
+        joinedKinetic, toJoin, bootstrap, weighted, overlapSelection)
+    keep = joinedKinetic.times < overlappedTime
+    numKept = np.count_nonzero(keep)
+    data = np.empty((joinedKinetic.shape[0], numKept+toJoin.shape[1]), dtype=np.result_type(joinedKinetic.data, toJoin.data))
+    data[:, :numKept] = joinedKinetic.data[:, keep]
+    np.multiply(toJoin.data, scalingFactor, out=data[:, numKept:])
+    variance = None
+    if joinedKinetic.variance is not None and toJoin.variance is not None:
+        # the scaling factor is taken as exact
+        variance = np.empty_like(data)
+        variance[:, :numKept] = joinedKinetic.variance[:, keep]
+        np.multiply(toJoin.variance, scalingFactor**2, out=variance[:, numKept:])
+    times = np.concatenate([joinedKinetic.times[keep], toJoin.times])
+    joined = KineticDataset(data, joinedKinetic.wavelengths, times, metadata=joinedKinetic.metadata, history=joinedKinetic.history,
+                            variance=variance)
+    joined.addHistory('join', overlappedTime=overlappedTime, scalingFactor=scalingFactor, weighted=weighted,
+                      **(selection or {}))
+    return joined, overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection
+
+
+def matchOverlap(joinedKinetic, toJoin, bootstrap=0, weighted=False, overlapSelection='earliest'):
+    '''
+    The scaling factor half of joinPair. Only the spectra at the overlapped
+    times are read, through each kinetic's spectrum (and spectrumVariance)
+    method, so the kinetics may be anything that has times and spectrum (see
+    outOfCore).
+
+    With overlapSelection 'earliest' the scaling factor is fitted to the
+    earliest overlapped gate alone. With 'snr' every overlapped gate is
+    scored together (kineticSplice.overlapScores) and the factor is fitted
+    to the best gate and any scoring nearly as well
+    (kineticSplice.selectOverlapGates) at once, so a late join whose
+    earliest common gate is mostly noise is matched where there is signal.
+    Either way the bootstrap resamples the gates fitted, and only those,
+    so the interval is that of the scaling factor returned.
+
+    Returns
+    -------
+    overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval
+        As for joinPair.
+    selection : dict or None
+        With 'snr', fitTime (the best gate), fitGates (the number of gates
+        fitted) and snr (their combined score). None with 'earliest'.
+    '''
+    if overlapSelection not in OVERLAP_SELECTIONS:
+        raise ValueError('overlapSelection must be one of {0}'.format(', '.join(OVERLAP_SELECTIONS)))
+    if not sameWavelengths(joinedKinetic.wavelengths, toJoin.wavelengths):
+        raise ValueError('the kinetics have different wavelength axes, align them first with alignWavelengths')
+    overlappedTimes = np.intersect1d(joinedKinetic.times, toJoin.times)
+    if overlappedTimes.size == 0:
+        raise NoOverlapError('no overlapping time points')
+    overlappedTime = overlappedTimes[0]
+    joinedSpectra = [joinedKinetic.spectrum(overlappedTime)]
+    toJoinSpectra = [toJoin.spectrum(overlappedTime)]
+    overlappedPair = (joinedSpectra[0], toJoinSpectra[0])
+    fitTimes = overlappedTimes[:1]
+    selection = None
+    if overlapSelection == 'snr':
+        joinedSpectra = [joinedKinetic.spectrum(t) for t in overlappedTimes]
+        toJoinSpectra = [toJoin.spectrum(t) for t in overlappedTimes]
+        scores = overlapScores(joinedSpectra, toJoinSpectra)
+        chosen = selectOverlapGates(scores)
+        fitTimes = overlappedTimes[chosen]
+        joinedSpectra = [joinedSpectra[i] for i in chosen]
+        toJoinSpectra = [toJoinSpectra[i] for i in chosen]
+        selection = {'fitTime': float(overlappedTimes[chosen[np.argmax(scores[chosen])]]), 'fitGates': len(chosen),
+                     'snr': float(np.sqrt((scores[chosen]**2).sum()))}
+    # the gates fitted are stacked into one pair of spectra
+    variances = None
+    if weighted:
+        variances = (np.concatenate([_spectrumVariance(joinedKinetic, t) for t in fitTimes]),
+                     np.concatenate([_spectrumVariance(toJoin, t) for t in fitTimes]))
+    kspl = KineticSplice((np.concatenate(joinedSpectra), np.concatenate(toJoinSpectra)), variances)
+    scalingFactor, scalingFactorError = kspl.calculateScalingFactor()
+    interval = None
+    if bootstrap:
+        interval = bootstrapScalingFactor(joinedSpectra, toJoinSpectra, numResamples=bootstrap, variances=variances)
+    return overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection
+
+
+def _spectrumVariance(kinetic, time):
+    variance = kinetic.spectrumVariance(time)
+    if variance is None:
+        variance = estimateVariance(kinetic.spectrum(time))
+    return variance
+
+
+def joinKinetics(kinetics, onJoin=None, bootstrap=0, weighted=False, overlapSelection='earliest'):
+    '''
+    Splice a sequence of time-axis kinetics together in order, after
+    putting them on a common wavelength grid (see alignWavelengths).
+
+    Parameters
+    ----------
+    kinetics : dict
+        Ordered mapping of join index to background subtracted
+        KineticDataset. The first kinetic sets the absolute scale.
+    onJoin : callable, optional
+        Called after each join as onJoin(index, wavelengths, overlappedPair,
+        overlappedTime, scalingFactor), e.g. to plot the join.
+    bootstrap : int, optional
+        Number of bootstrap resamples for the scaling factor confidence
+        intervals, or 0 (the default) for none.
+    weighted : bool, optional
+        Weight the scaling factor fits by the pixel variances, see joinPair.
+        Default is False.
+    overlapSelection : str, optional
+        'earliest' (the default) to fit each scaling factor to the earliest
+        overlapped gate, or 'snr' to fit it to the gates with the best
+        signal-to-noise, see matchOverlap.
+
+    Returns
+    -------
+    completeKinetic : KineticDataset
+        The spliced kinetic.
+    sfs : DataFrame
+        Overlapped time, scaling factor and error for each join, plus the
+        confidence interval if bootstrapped and the gates fitted with 'snr'
+        selection.
+    overlappedTimes : list of str
+        The time used for each join.
+    '''
+    joins = []
+    joinedKinetic = None
+    kinetics = alignWavelengths(kinetics)
+    for index, toJoin in kinetics.items():
+        if joinedKinetic is None:
+            joinedKinetic = toJoin
+            continue
+        try:
+            joined, overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection = joinPair(
+                joinedKinetic, toJoin, bootstrap, weighted, overlapSelection)
+        except NoOverlapError:
+            raise NoOverlapError('no overlapping time points for join {0}'.format(index))
+        joins.append((overlappedTime, scalingFactor, scalingFactorError, interval, selection))
+        if onJoin is not None:
+            onJoin(index, joinedKinetic.wavelengths, overlappedPair, overlappedTime, scalingFactor)
+        joinedKinetic = joined
+    sfs = scalingFactorTable(list(kinetics.keys()), joins)
+    overlappedTimesList = [str(join[0]) for join in joins]
+    return joinedKinetic, sfs, overlappedTimesList
+
+
+def scalingFactorTable(keys, joins):
+    '''
+    The scaling_factors.csv table: one row per kinetic, the first left empty
+    as it is not scaled, then (time, sf, error) for each join, the
+    bootstrap interval (ciLow, ciHigh) if any join has one, and the gates
+    fitted (fitTime, fitGates, snr) if any was selected by signal-to-noise
+    (see matchOverlap).
+    '''
+    columns = ['time', 'sf', 'error']
+    bootstrapped = any(len(join) > 3 and join[3] is not None for join in joins)
+    if bootstrapped:
+        columns += ['ciLow', 'ciHigh']
+    selected = any(len(join) > 4 and join[4] is not None for join in joins)
+    if selected:
+        columns += OVERLAP_COLUMNS
+    sfs = pd.DataFrame(index=keys, columns=columns)
+    sfs.index.name = 'join'
+    for key, join in zip(keys[1:], joins):
+        sfs.loc[key, 'time'] = join[0]
+        sfs.loc[key, 'sf'] = join[1]
+        sfs.loc[key, 'error'] = join[2]
+        if bootstrapped and join[3] is not None:
+            sfs.loc[key, 'ciLow'], sfs.loc[key, 'ciHigh'] = join[3]
+        if selected and join[4] is not None:
+            for column in OVERLAP_COLUMNS:
+                sfs.loc[key, column] = join[4][column]
+    return sfs
+
+
+def overlappedTimesTable(overlappedTimes, sfs):
+    '''
+    The lines of overlappedTimes.txt: the time of each join, followed by the
+    gates its scaling factor was fitted to (fitTime, fitGates, snr) if the
+    scaling factor table has them.
+    '''
+    if not set(OVERLAP_COLUMNS).issubset(sfs.columns):
+        return list(overlappedTimes)
+    lines = []
+    for time, (key, row) in zip(overlappedTimes, sfs.iloc[1:].iterrows()):
+        lines.append(' '.join([str(time)]+[str(row[column]) for column in OVERLAP_COLUMNS]))
+    return lines
+
+
+def rebinLogTime(kinetic, pointsPerDecade=LOG_POINTS_PER_DECADE):
+    '''
+    Average the gates of a (spliced) kinetic into bins evenly spaced in
+    log time, pointsPerDecade to a decade. Gates at or before time zero and
+    bins holding a single gate are passed through unchanged, so the early,
+    finely stepped part of the kinetic keeps its resolution. Each bin is the
+    mean of its gates, at the mean of their times.
+
+    The variance of each binned point is propagated from kinetic.variance
+    if the kinetic has one (sum of the variances over n**2), and otherwise
+    estimated from the scatter of the gates in the bin about their mean
+    (sample variance over n), which leaves it NaN for single gate bins.
+
+    Returns a new KineticDataset; the input is not modified.
+    '''
+    times = np.asarray(kinetic.times, dtype=np.float64)
+    data, variance = kinetic.data, kinetic.variance
+    if np.any(np.diff(times) < 0):
+        order = np.argsort(times, kind='stable')
+        times, data = times[order], data[:, order]
+        if variance is not None:
+            variance = variance[:, order]
+    positive = times > 0
+    numEarly = np.count_nonzero(~positive)
+    # every gate up to time zero is a bin of its own, after that one bin per
+    # log step
+    logBins = np.floor(np.log10(times[positive])*pointsPerDecade).astype(np.int64)
+    bins = np.concatenate([np.arange(numEarly), numEarly+logBins-(logBins[0] if logBins.size else 0)])
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    counts = np.diff(np.r_[starts, times.size])
+    binOf = np.repeat(np.arange(starts.size), counts)
+    binnedTimes = np.add.reduceat(times, starts)/counts
+    mean = np.add.reduceat(data, starts, axis=1, dtype=np.float64)/counts
+    if variance is not None:
+        variance = np.add.reduceat(variance, starts, axis=1, dtype=np.float64)/counts**2
+    else:
+        squares = np.add.reduceat((data-mean[:, binOf])**2, starts, axis=1, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = squares/(counts*(counts-1))
+        variance[:, counts == 1] = np.nan
+    binned = KineticDataset(mean, kinetic.wavelengths, binnedTimes, background=kinetic.background,
+                            metadata=kinetic.metadata, history=kinetic.history, dtype=kinetic.dtype, variance=variance)
+    binned.addHistory('log rebin', pointsPerDecade=pointsPerDecade)
+    return binned
+
+
+def denoiseSVD(kinetic, rank=SVD_RANK, seed=0):
+    '''
+    Replace the data with its rank-k approximation from a randomized
+    truncated SVD (see svdDenoise), keeping the largest rank components.
+    Works on a single segment before joining as well as on the joined
+    kinetic. The data must have no NaNs. Any variance is dropped, as it no
+    longer describes the denoised data.
+    '''
+    kinetic.data = np.ascontiguousarray(SVDDenoise(rank, seed=seed).denoise(kinetic.data))
+    kinetic.variance = None
+    kinetic.addHistory('svd denoise', rank=rank)
+    return kinetic
+
+
+def singularValues(kinetic, numComponents=SCREE_COMPONENTS, seed=0):
+    '''
+    The scree table for choosing the rank of denoiseSVD: the leading singular
+    values of the data and the fraction of its total sum of squares each
+    explains, indexed by component number from 1.
+    '''
+    s, explained = screeTable(kinetic.data, numComponents, seed=seed)
+    scree = pd.DataFrame({'singularValue': s, 'explained': explained}, index=np.arange(1, len(s)+1))
+    scree.index.name = 'component'
+    return scree
+
+
+def fitDecays(data, model='mono', minTime=0.):
+    '''
+    Fit a mono-, bi- or stretched exponential decay (see decayFitting) to
+    every wavelength of a kinetic at once, using the gates after minTime
+    (which must be at least 0, as the decays start at time zero). data may
+    be a KineticDataset, a DataFrame with wavelength as the index, or a
+    single kinetic trace such as one from getKineticSlice.
+
+    Returns
+    -------
+    fits : DataFrame
+        The lifetime map: one row per wavelength (a single row for a trace)
+        with the fitted lifetimes (and beta), amplitudes, the rms residual
+        and whether the fit converged.
+    '''
+    if isinstance(data, pd.Series):
+        times, values, index = data.index.values, data.values[None, :], pd.Index([data.name])
+    else:
+        if isinstance(data, pd.DataFrame):
+            data = KineticDataset.fromDataFrame(data)
+        times, values, index = data.times, data.data, pd.Index(data.wavelengths, name='wavelength')
+    times = np.asarray(times, dtype=np.float64)
+    after = times > minTime
+    decayFit = DecayFit(model)
+    parameters, amplitudes, rms, converged = decayFit.fit(times[after], values[:, after])
+    fits = pd.DataFrame(np.hstack([parameters, amplitudes]), index=index,
+                        columns=decayFit.parameterNames+decayFit.amplitudeNames)
+    fits['rms'] = rms
+    fits['converged'] = converged
+    return fits
+
+
+def applyCalibration(kinetic, calibration):
+    '''
+    Multiply every gate by the spectral sensitivity correction, interpolated
+    onto the kinetic's wavelength axis.
+    '''
+    correction = calibrationCorrection(kinetic.wavelengths, calibration)[:, None]
+    kinetic.data *= correction
+    if kinetic.variance is not None:
+        kinetic.variance *= correction**2
+    kinetic.addHistory('calibration')
+    return kinetic
+
+
+def calibrationCorrection(wavelengths, calibration):
+    '''
+    The spectral sensitivity correction at each of wavelengths.
+    '''
+    from scipy.interpolate import UnivariateSpline as Spline
+    spl = Spline(calibration.index, calibration.values, s=0)
+    return spl(wavelengths)
+
+
+def getKineticSlice(data, centreWavelength, plusMinus, integrated=False, useNumba=None):
+    '''
+    Kinetic trace, as a Series indexed by time, either integrated over all
+    wavelengths or averaged over centreWavelength +/- plusMinus. data may be
+    a KineticDataset or a DataFrame with wavelength as the index. The band
+    average uses the numba kernel if installed, unless useNumba is False.
+    '''
+    if isinstance(data, pd.DataFrame):
+        data = KineticDataset.fromDataFrame(data)
+    if integrated:
+        # BLAS already does this in one pass, faster than the numba kernel
+        values = weightedColumnSum(data.data, trapezoidWeights(data.wavelengths))
+    else:
+        band = (data.wavelengths > centreWavelength-plusMinus) & (data.wavelengths < centreWavelength+plusMinus)
+        if resolveNumba(useNumba):
+            import numbaKernels
+            rows = np.flatnonzero(band)
+            values = numbaKernels.weightedRowSum(data.data, rows, np.ones(rows.size))/rows.size
+        else:
+            values = data.data[band].mean(axis=0, dtype=np.float64)
+    return pd.Series(values, index=data.times)
+
+
+def getKineticSliceError(data, centreWavelength, plusMinus, integrated=False):
+    '''
+    Standard error of each point of getKineticSlice with the same arguments,
+    as a Series indexed by time, taking the pixels as independent. data may
+    be a KineticDataset with a variance, or a DataFrame of variances with
+    wavelength as the index.
+    '''
+    if isinstance(data, pd.DataFrame):
+        wavelengths, times, variance = data.index.values.astype(float), data.columns.values, data.values
+    else:
+        wavelengths, times, variance = data.wavelengths, data.times, data.variance
+    if integrated:
+        values = weightedColumnSum(variance, trapezoidWeights(wavelengths)**2)
+    else:
+        band = (wavelengths > centreWavelength-plusMinus) & (wavelengths < centreWavelength+plusMinus)
+        values = variance[band].sum(axis=0, dtype=np.float64)/np.count_nonzero(band)**2
+    return pd.Series(np.sqrt(values), index=times)
+
+
+def trapezoidWeights(x):
+    '''
+    Weights w such that w.dot(y) is the trapezoidal integral of y over x.
+    '''
+    dx = np.diff(np.asarray(x, dtype=np.float64))
+    weights = np.zeros(len(x))
+    weights[:-1] += dx/2
+    weights[1:] += dx/2
+    return weights
+
+
+def weightedColumnSum(data, weights, blockRows=256):
+    '''
+    weights.dot(data) accumulated in float64. Single precision data is
+    converted a block of rows at a time rather than all at once.
+    '''
+    if data.dtype == np.float64:
+        return weights.dot(data)
+    total = np.zeros(data.shape[1])
+    for start in range(0, data.shape[0], blockRows):
+        block = slice(start, start+blockRows)
+        total += weights[block].dot(data[block].astype(np.float64))
+    return total
@@ -1,33 +1,310 @@
 import numpy as np
-from scipy.optimize import curve_fit
-from scipy.interpolate import UnivariateSpline
+
+# scipy is imported where it is used, so it is only loaded once something is joined
 
 class KineticSplice(object):
     
-    def __init__(self, overlappedPair):
+    def __init__(self, overlappedPair, variances=None):
         self._overlappedPair = overlappedPair
+        # per-pixel variances of the pair, to weight the fit by
+        self._variances = variances
             
     def _calculateInitialGuess(self):
         initialGuess = self._overlappedPair[0].max()/self._overlappedPair[1].max()
         return initialGuess
     
     def _constructDataAndFittingVector(self):
-        data = self._overlappedPair[0]
-        vector = self._overlappedPair[1]
+        # always fit in double precision, whatever the data is stored in
+        data = np.asarray(self._overlappedPair[0], dtype=np.float64)
+        vector = np.asarray(self._overlappedPair[1], dtype=np.float64)
         return data, vector
     
     @staticmethod
     def _splineFittingFunction(x, vector, scalingFactor):
+        from scipy.interpolate import UnivariateSpline
         xvector = range(len(vector))
         spl = UnivariateSpline(xvector, vector, s=0)
         value = spl(x)*scalingFactor
         return value
         
     def calculateScalingFactor(self):
+        if self._variances is not None:
+            return self._calculateWeightedScalingFactor()
+        from scipy.optimize import curve_fit
         data, vector = self._constructDataAndFittingVector()
         x = range(len(data))
         initialGuess = self._calculateInitialGuess()
         popt, pcov = curve_fit(lambda x, scalingFactor: self._splineFittingFunction(x, vector, scalingFactor), x, data, p0=[initialGuess], bounds=(0, np.inf))
         scalingFactor = popt[0]
         error = np.sqrt(pcov[0, 0])
-        return scalingFactor, error
\ No newline at end of file
+        return scalingFactor, error
+
+    def _calculateWeightedScalingFactor(self, iterations=8):
+        # the factor minimising sum((d-sf*v)**2/var(d-sf*v)), see
+        # _weightedFactors
+        data, vector = self._constructDataAndFittingVector()
+        dataVariance, vectorVariance = self._variances
+        scalingFactor = _weightedFactors(data, vector, dataVariance, vectorVariance, np.ones((1, data.size)),
+                                         iterations)[0]
+        weights = spliceWeights(dataVariance, vectorVariance, scalingFactor)
+        residual = data-scalingFactor*vector
+        # scaled by the reduced chi squared, as curve_fit does
+        reducedChiSquared = (weights*residual**2).sum()/max(len(data)-1, 1)
+        error = np.sqrt(reducedChiSquared/(weights*vector*vector).sum())
+        return scalingFactor, error
+
+
+def _weightedFactors(data, vector, dataVariance, vectorVariance, counts, iterations=8, tol=1e-10):
+    '''
+    The weighted fit of KineticSplice, with each pixel counted as many
+    times as in each row of counts, for all the rows at once: the factor
+    minimising sum(count*(d-sf*v)**2/var(d-sf*v)), found by holding the
+    weights and residuals at the last factor and solving for the next,
+    starting from the unweighted least squares factor, until no factor
+    changes by more than tol of itself (or for at most iterations steps).
+
+    Parameters
+    ----------
+    data, vector, dataVariance, vectorVariance : ndarray
+        The pair of spectra and their variances, shape (pixels,).
+    counts : ndarray
+        Shape (fits, pixels).
+
+    Returns
+    -------
+    ndarray
+        Scaling factor of each fit.
+    '''
+    vectorVariance = np.asarray(vectorVariance, dtype=np.float64)
+    scalingFactors = _boundedRatio(counts.dot(vector*data), counts.dot(vector*vector))
+    for _ in range(iterations):
+        factors = scalingFactors[:, None]
+        weights = spliceWeights(dataVariance, vectorVariance, factors)
+        residual = data-factors*vector
+        # the variance of d-sf*v grows with sf, so the factor is not the
+        # plain weighted least squares one: that would leave out the noise in
+        # v and bias the factor low
+        previous, scalingFactors = scalingFactors, _boundedRatio(
+            (counts*weights*vector*data).sum(axis=1),
+            (counts*weights*(vector*vector-weights*vectorVariance*residual**2)).sum(axis=1))
+        if np.all(np.abs(scalingFactors-previous) <= tol*scalingFactors):
+            break
+    return scalingFactors
+
+
+def _boundedRatio(numerator, denominator):
+    # same bound as the fit, and 0 where the fit is undefined
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, np.clip(numerator/denominator, 0, None), 0.)
+
+
+def spliceWeights(dataVariance, vectorVariance, scalingFactor):
+    '''
+    Inverse variance weights of the pixels in the fit of d by sf*v, from the
+    variances of d and v. Pixels of zero variance are given the weight of
+    one with a millionth of the largest, so they cannot take over the fit.
+    An array of scaling factors, shape (fits, 1), gives the weights of each
+    fit along the first axis.
+    '''
+    variance = np.asarray(dataVariance, dtype=np.float64)+np.square(scalingFactor)*np.asarray(vectorVariance, dtype=np.float64)
+    largest = variance.max(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore'):
+        weights = 1/np.maximum(variance, 1e-6*largest)
+    return np.where(largest > 0, weights, 1.)
+
+
+# median of a squared normal deviate, as a fraction of its variance
+MEDIAN_OF_SQUARES = 0.4549
+
+
+def _neighbourScatter(spectra):
+    '''
+    Squared difference of each pixel (bar two at either end) from the cubic
+    through the two neighbours either side, along the last axis, scaled to
+    average to the variance of a pixel (the difference has 70/36 of it). The
+    cubic follows narrow bands, so this is noise, bar the odd spike.
+    '''
+    spectra = np.asarray(spectra, dtype=np.float64)
+    residual = spectra[..., 2:-2]-(4*(spectra[..., 1:-3]+spectra[..., 3:-1])-spectra[..., :-4]-spectra[..., 4:])/6
+    return residual**2*36/70
+
+
+def estimateVariance(spectrum, numBins=16, smoothing=9):
+    '''
+    Per-pixel variance of a single spectrum, for when there are no repeats to
+    measure it from. The noise is taken as the background (read and dark)
+    variance plus shot noise in proportion to the signal, both found from
+    the scatter of each pixel about its neighbours: the pixels are grouped by
+    signal level and the mean squared scatter of each group, less any stray
+    spikes, gives its variance. The quietest quarter of the pixels gives the
+    background variance and the rise of the variance with signal above them
+    the gain.
+
+    Parameters
+    ----------
+    spectrum : ndarray
+        Background subtracted spectrum, shape (pixels,).
+    numBins : int, optional
+        Number of signal levels the pixels are grouped into. Default is 16.
+    smoothing : int, optional
+        Width in pixels of the moving average of the neighbouring pixels
+        the signal level is taken from. Default is 9.
+
+    Returns
+    -------
+    ndarray
+        Variance of each pixel.
+    '''
+    spectrum = np.asarray(spectrum, dtype=np.float64)
+    # leaving the pixel itself out, so its variance does not follow its own
+    # noise
+    kernel = np.ones(smoothing)
+    kernel[smoothing//2] = 0
+    signal = np.convolve(spectrum, kernel/kernel.sum(), mode='same')
+    scatter = _neighbourScatter(spectrum)
+    numBins = max(min(numBins, scatter.size//8), 1)
+    perBin = scatter.size//numBins
+    if perBin == 0:
+        return np.full(spectrum.shape, scatter.mean() if scatter.size else 0.)
+    groups = np.argsort(signal[2:-2])[:numBins*perBin].reshape(numBins, perBin)
+    level = signal[2:-2][groups].mean(axis=1)
+    # mean of each group, leaving out stray spikes beyond five sigma
+    squares = scatter[groups]
+    kept = squares <= 25*np.median(squares, axis=1, keepdims=True)/MEDIAN_OF_SQUARES
+    scatter = (squares*kept).sum(axis=1)/np.maximum(kept.sum(axis=1), 1)
+    quiet = max(numBins//4, 1)
+    background = scatter[:quiet].mean()
+    quietLevel = level[:quiet].mean()
+    if not background > 0:
+        return np.zeros(spectrum.shape)
+    rise = level[quiet:]-quietLevel
+    excess = scatter[quiet:]-background
+    gain = 0.
+    for _ in range(3):
+        # each group's scatter is uncertain in proportion to its variance,
+        # taken from the line rather than the scatter so as not to bias it
+        weights = 1/(background+gain*rise)**2
+        denominator = (weights*rise*rise).sum()
+        gain = max((weights*rise*excess).sum()/denominator, 0.) if denominator > 0 else 0.
+    return background+gain*np.clip(signal-quietLevel, 0, None)
+
+
+def overlapScores(joinedSpectra, toJoinSpectra):
+    '''
+    Signal-to-noise of the scaling factor each overlapped gate would give,
+    for all the gates at once. Each spectrum's noise is the median scatter
+    of its pixels about their neighbours (see _neighbourScatter) and its
+    signal-to-noise comes from its power above that noise; the ratio of the
+    two spectra is then as uncertain as both together.
+
+    Parameters
+    ----------
+    joinedSpectra, toJoinSpectra : ndarray
+        Spectra of the two kinetics at the overlapped gates, shape (gates,
+        pixels) as for bootstrapScalingFactor.
+
+    Returns
+    -------
+    ndarray
+        Score of each gate, 0 where either spectrum is lost in its noise.
+    '''
+    snrs = []
+    for spectra in (joinedSpectra, toJoinSpectra):
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+        # robust to spikes
+        noise = np.median(_neighbourScatter(spectra), axis=-1)/MEDIAN_OF_SQUARES
+        power = (spectra**2).sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            snr = np.sqrt(np.clip(power/noise-spectra.shape[-1], 0, None))
+        # noiseless spectra
+        snr[noise == 0] = np.where(power[noise == 0] > 0, np.inf, 0.)
+        snrs.append(snr)
+    with np.errstate(divide='ignore'):
+        return 1/np.sqrt(1/snrs[0]**2+1/snrs[1]**2)
+
+
+def selectOverlapGates(scores, fraction=0.7):
+    '''
+    Indices of the gates to fit the scaling factor to: the best scored gate
+    and any others scoring at least fraction of it, in time order. If none
+    has any signal the first (earliest) gate is used.
+    '''
+    scores = np.asarray(scores, dtype=np.float64)
+    best = scores.max()
+    if not best > 0:
+        return np.array([0])
+    if np.isinf(best):
+        return np.flatnonzero(np.isinf(scores))
+    return np.flatnonzero(scores >= fraction*best)
+
+
+def bootstrapScalingFactor(joinedSpectra, toJoinSpectra, numResamples=2000, confidence=0.95, seed=0,
+                           variances=None):
+    '''
+    Bootstrap confidence interval for the scaling factor. The spline in
+    KineticSplice passes through every pixel, so the fit is the linear least
+    squares factor sum(v*d)/sum(v*v). Each resample reweights the pixels (and
+    the gates, if several overlap) by how often they were drawn, so all the
+    resampled factors come from two matrix products instead of a fit each.
+    Given the variances, each resample is instead fitted as KineticSplice
+    fits noise weighted pixels, a block of resamples at a time.
+
+    Parameters
+    ----------
+    joinedSpectra, toJoinSpectra : ndarray
+        The overlapped spectra (d and v), shape (pixels,) for one overlapped
+        gate or (gates, pixels) for several.
+    numResamples : int, optional
+        Number of bootstrap resamples. Default is 2000.
+    confidence : float, optional
+        Width of the interval. Default is 0.95.
+    seed : int, optional
+        Seed of the resampling, so the same data always gives the same
+        interval. Default is 0.
+    variances : tuple of ndarray, optional
+        Variances of the joined and toJoin spectra, of the same size as
+        the spectra, to weight the fit by (see spliceWeights). Default is
+        all pixels equal.
+
+    Returns
+    -------
+    low, high : float
+        Percentile confidence interval of the scaling factor.
+    '''
+    data = np.atleast_2d(np.asarray(joinedSpectra, dtype=np.float64))
+    vector = np.atleast_2d(np.asarray(toJoinSpectra, dtype=np.float64))
+    numGates, numPixels = data.shape
+    rng = np.random.RandomState(seed)
+    pixelCounts = _resampleCounts(rng, numPixels, numResamples)
+    gateCounts = _resampleCounts(rng, numGates, numResamples)
+    if variances is None:
+        numerator = (gateCounts.dot(vector*data)*pixelCounts).sum(axis=1)
+        denominator = (gateCounts.dot(vector*vector)*pixelCounts).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # same bound as the fit
+            scalingFactors = np.clip(numerator/denominator, 0, None)
+    else:
+        # the gates fitted are stacked into one spectrum, as in the fit
+        dataVariance, vectorVariance = (np.ravel(np.asarray(variance, dtype=np.float64)) for variance in variances)
+        scalingFactors = np.empty(numResamples)
+        # resamples per block, so each takes about as much memory as 256
+        # spectra of 2048 pixels
+        blockSize = max(2**19//data.size, 1)
+        for start in range(0, numResamples, blockSize):
+            stop = min(start+blockSize, numResamples)
+            counts = (gateCounts[start:stop, :, None]*pixelCounts[start:stop, None, :]).reshape(stop-start, -1)
+            scalingFactors[start:stop] = _weightedFactors(data.ravel(), vector.ravel(), dataVariance, vectorVariance,
+                                                          counts)
+    tail = 50.*(1-confidence)
+    low, high = np.nanpercentile(scalingFactors, [tail, 100-tail])
+    return low, high
+
+
+def _resampleCounts(rng, size, numResamples):
+    '''
+    How many times each of size items is drawn in each of numResamples
+    draws of size items with replacement, shape (numResamples, size).
+    '''
+    draws = rng.randint(0, size, (numResamples, size))
+    draws += size*np.arange(numResamples)[:, None]
+    return np.bincount(draws.ravel(), minlength=numResamples*size).reshape(numResamples, size)
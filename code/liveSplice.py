@@ -0,0 +1,272 @@
+import os
+import re
+import numpy as np
+import kineticPipeline as kp
+
+'''
+Live splicing during an acquisition. A FolderWatcher polls a directory for
+new .asc files and a LiveSplicer processes each segment as soon as it (and
+its background) has been written, joining it on to the existing spliced
+kinetic without touching the segments already joined.
+
+The start time and gate step of each segment are taken from its file name,
+which must contain 'start<ns>' and 'step<ns>', e.g. PL_start100_step10.asc.
+The background for a segment has the same name with a '_bg' or
+'_background' suffix, e.g. PL_start100_step10_bg.asc.
+'''
+
+SEGMENT_PATTERN = re.compile(r'start(?P<start>-?\d+).*?step(?P<step>\d+)', re.IGNORECASE)
+BACKGROUND_PATTERN = re.compile(r'[_\- ](bg|background)$', re.IGNORECASE)
+
+
+def parseSegmentName(filepath):
+    '''
+    Returns
+    -------
+    stem : str
+        File name without extension or background suffix, shared by a
+        segment and its background.
+    isBackground : bool
+    startTime, gateStep : int
+
+    Raises ValueError if the name does not contain the start time and step.
+    '''
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    isBackground = BACKGROUND_PATTERN.search(stem) is not None
+    stem = BACKGROUND_PATTERN.sub('', stem)
+    match = SEGMENT_PATTERN.search(stem)
+    if match is None:
+        raise ValueError('cannot find start time and gate step in {0}'.format(os.path.basename(filepath)))
+    return stem, isBackground, int(match.group('start')), int(match.group('step'))
+
+
+class FolderWatcher(object):
+    '''
+    Polling watcher for new files in a directory. A file is only reported
+    once its size has stopped changing between two polls, so files still
+    being written by the acquisition software are not read half finished.
+    '''
+
+    def __init__(self, directory, extension='.asc', ignoreExisting=False):
+        self.directory = directory
+        self.extension = extension.lower()
+        self._reported = set()
+        self._sizes = {}
+        self._failed = {}
+        if ignoreExisting:
+            self._reported.update(self._listFiles())
+
+    def _listFiles(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.lower().endswith(self.extension)]
+
+    def poll(self):
+        '''
+        Returns
+        -------
+        out : list of str
+            Paths of files completed since the last poll, oldest first.
+        '''
+        ready = []
+        for filepath in self._listFiles():
+            if filepath in self._reported:
+                continue
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            size = (stat.st_size, stat.st_mtime)
+            if self._failed.get(filepath) == size:
+                continue
+            self._failed.pop(filepath, None)
+            if self._sizes.get(filepath) == size and stat.st_size > 0:
+                ready.append((stat.st_mtime, filepath))
+                self._reported.add(filepath)
+                del self._sizes[filepath]
+            else:
+                self._sizes[filepath] = size
+        return [filepath for mtime, filepath in sorted(ready)]
+
+    def retry(self, filepath):
+        '''
+        Report a file again once it has been written to since it was
+        reported, e.g. after it could not be read because the acquisition
+        software had not finished writing it.
+        '''
+        self._reported.discard(filepath)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return
+        self._failed[filepath] = (stat.st_size, stat.st_mtime)
+
+
+class LiveSplicer(object):
+    '''
+    Incrementally builds the spliced kinetic one segment at a time.
+
+    Parameters
+    ----------
+    timeZero : float
+        Time zero subtracted from every segment's time axis.
+    delimiter : str, optional
+        Delimiter of the .asc files. Default is ','.
+    backgroundEndTime : float, optional
+        If given, the first segment's background is the mean of its own gates
+        up to this time and no background file is waited for, as with the
+        app's first background check box.
+    removeCosmicRays : bool, optional
+        Run cosmic ray removal on each segment. Default is True.
+    onJoin : callable, optional
+        Passed on to each join, see kineticPipeline.joinKinetics.
+    bootstrap : int, optional
+        Bootstrap resamples for the scaling factor confidence intervals, or
+        0 (the default) for none.
+    weighted : bool, optional
+        Weight the scaling factor fits by the pixel variances, see
+        kineticPipeline.joinPair. Default is False.
+    overlapSelection : str, optional
+        Overlapped gates the scaling factors are fitted to, 'earliest' (the
+        default) or 'snr', see kineticPipeline.matchOverlap.
+    dtype : dtype, optional
+        Precision the kinetics are stored in. Default is float64.
+    roi, binning : optional
+        Wavelength range and pixel binning applied as each file is read,
+        see kineticPipeline.cropAndBin.
+    '''
+
+    def __init__(self, timeZero, delimiter=',', backgroundEndTime=None, removeCosmicRays=True, onJoin=None,
+                 nrows=kp.NUM_PIXELS, dtype=np.float64, bootstrap=0, roi=None, binning=1,
+                 weighted=False, overlapSelection='earliest'):
+        self.timeZero = timeZero
+        self.delimiter = delimiter
+        self.backgroundEndTime = backgroundEndTime
+        self.removeCosmicRays = removeCosmicRays
+        self.onJoin = onJoin
+        self.nrows = nrows
+        self.dtype = dtype
+        self.bootstrap = bootstrap
+        self.weighted = weighted
+        self.overlapSelection = overlapSelection
+        self.roi = roi
+        self.binning = binning
+        self.completeKinetic = None
+        self.numSegments = 0
+        self.joinedStems = []
+        self.overlappedTimes = []
+        self._joins = []
+        self._queue = []
+        self._pending = {}
+
+    def addFile(self, filepath):
+        '''
+        Register a newly written segment or background file, then process
+        every segment that is now complete, in the order the segments
+        arrived, see processQueue.
+
+        Returns
+        -------
+        out : list of str
+            Stems of the segments joined by this call.
+        '''
+        stem, isBackground, startTime, gateStep = parseSegmentName(filepath)
+        if stem not in self._pending:
+            self._pending[stem] = {}
+        entry = self._pending[stem]
+        if isBackground:
+            entry['background'] = filepath
+        else:
+            if 'kinetic' not in entry:
+                self._queue.append(stem)
+            entry.update(kinetic=filepath, startTime=startTime, gateStep=gateStep)
+        return self.processQueue()
+
+    def processQueue(self):
+        '''
+        Process and join the segments at the front of the queue that have
+        all their files. A segment only leaves the queue once it is joined:
+        if it cannot be read (e.g. a file still being written) or joined,
+        the error is raised and the segment, and every one after it, waits
+        for the next call, see nextSegmentFiles.
+
+        Returns
+        -------
+        out : list of str
+            Stems of the segments joined by this call.
+        '''
+        processed = []
+        while self._queue and self._isReady(self._pending[self._queue[0]]):
+            stem = self._queue[0]
+            entry = self._pending[stem]
+            kinetic = kp.readKinetic(entry['kinetic'], self.delimiter, nrows=self.nrows, dtype=self.dtype,
+                                     roi=self.roi, binning=self.binning)
+            if 'background' in entry and not self._estimateBackground():
+                background = kp.readBackground(entry['background'], self.delimiter, nrows=self.nrows,
+                                               roi=self.roi, binning=self.binning)
+            else:
+                background = None
+            self.addSegment(kinetic, background, entry['startTime'], entry['gateStep'])
+            del self._queue[0], self._pending[stem]
+            self.joinedStems.append(stem)
+            processed.append(stem)
+        return processed
+
+    def _estimateBackground(self):
+        return self.numSegments == 0 and self.backgroundEndTime is not None
+
+    def _isReady(self, entry):
+        return 'kinetic' in entry and ('background' in entry or self._estimateBackground())
+
+    def addSegment(self, kinetic, background, startTime, gateStep):
+        '''
+        Process one raw KineticDataset (gate numbers as times) and join it on
+        to the spliced kinetic. Only this segment is processed; earlier segments
+        are already part of completeKinetic and are left alone.
+        '''
+        kinetic = kp.addTimeAxis(kinetic, self.timeZero, startTime, gateStep)
+        if self.removeCosmicRays:
+            kinetic = kp.removeCosmicRays(kinetic)
+        if background is None:
+            background = kp.estimateBackground(kinetic, self.backgroundEndTime)
+        kinetic = kp.subtractBackground(kinetic, background)
+        index = self.numSegments+1
+        if self.completeKinetic is None:
+            self.completeKinetic = kinetic
+            self.numSegments = index
+            return
+        # the joined kinetic is cropped too if this one covers less of it
+        previous, kinetic = kp.alignWavelengths({index-1: self.completeKinetic, index: kinetic}).values()
+        joined, overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection = kp.joinPair(
+            previous, kinetic, self.bootstrap, self.weighted, self.overlapSelection)
+        self.completeKinetic = joined
+        self.numSegments = index
+        self._joins.append((overlappedTime, scalingFactor, scalingFactorError, interval, selection))
+        self.overlappedTimes.append(str(overlappedTime))
+        if self.onJoin is not None:
+            self.onJoin(index, previous.wavelengths, overlappedPair, overlappedTime, scalingFactor)
+
+    def pendingFiles(self):
+        '''
+        Stems of segments still waiting for a file (normally a background),
+        or for the segment before them.
+        '''
+        return list(self._queue)
+
+    def nextSegmentFiles(self):
+        '''
+        Files of the segment at the front of the queue, the one that failed
+        if processQueue raised.
+        '''
+        if not self._queue:
+            return []
+        entry = self._pending[self._queue[0]]
+        return [entry[key] for key in ('kinetic', 'background') if key in entry]
+
+    def scalingFactors(self):
+        '''
+        Scaling factors so far, in the same layout as scaling_factors.csv.
+        '''
+        return kp.scalingFactorTable(list(range(1, self.numSegments+1)), self._joins)
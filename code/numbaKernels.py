@@ -0,0 +1,82 @@
+import numpy as np
+import numba
+
+'''
+Numba versions of the two hot loops: cosmic ray removal and the per-gate
+reductions behind getKineticSlice. numba is optional, so this module is only
+imported once one of the kernels is used (see cosmicRayRemoval.resolveNumba);
+the NumPy code paths give the same results without it.
+
+Both kernels run in parallel over gates. The first call compiles them, and
+the compiled code is cached next to this file for later sessions.
+'''
+
+# columns summed together by weightedRowSum, so its inner loop runs along
+# contiguous memory
+BLOCK_COLUMNS = 256
+
+
+@numba.njit(parallel=True, cache=True)
+def removeCosmicRays(inarr, out, n, threshold, iterations):
+    '''
+    Same algorithm as CosmicRayRemoval._crremove applied iterations times,
+    with the moving average, residual, threshold and replacement done in one
+    pass over each spectrum (column) held in a float64 buffer.
+
+    Parameters
+    ----------
+    inarr : 2-d ndarray, wavelength along axis 0, times along axis 1
+    out : 2-d float ndarray of the same shape
+        Filled with the cleaned spectra. Each pass is rounded to the
+        precision of out, as the NumPy version does.
+    n : int
+        Half width of the moving average window.
+    threshold : float
+        Squared deviation, relative to its mean over the spectrum, above
+        which a point is replaced by the moving average.
+    iterations : int
+    '''
+    numRows, numColumns = inarr.shape
+    for j in numba.prange(numColumns):
+        column = np.empty(numRows)
+        cumsum = np.zeros(numRows+1)
+        smooth = np.empty(numRows)
+        for i in range(numRows):
+            column[i] = inarr[i, j]
+        for iteration in range(iterations):
+            for i in range(numRows):
+                cumsum[i+1] = cumsum[i]+column[i]
+            total = 0.
+            for i in range(numRows):
+                low = max(i-n, 0)
+                high = min(i+n+1, numRows)
+                smooth[i] = (cumsum[high]-cumsum[low])/(high-low)
+                total += (column[i]-smooth[i])**2
+            meanResidual = total/numRows
+            for i in range(numRows):
+                if meanResidual > 0 and (column[i]-smooth[i])**2/meanResidual > threshold:
+                    out[i, j] = smooth[i]
+                else:
+                    out[i, j] = column[i]
+                column[i] = out[i, j]
+    return out
+
+
+@numba.njit(parallel=True, cache=True)
+def weightedRowSum(data, rows, weights):
+    '''
+    sum(weights[k]*data[rows[k]]) over k, accumulated in float64 without
+    copying the selected rows out of data.
+    '''
+    numColumns = data.shape[1]
+    out = np.zeros(numColumns)
+    numBlocks = (numColumns+BLOCK_COLUMNS-1)//BLOCK_COLUMNS
+    for block in numba.prange(numBlocks):
+        start = block*BLOCK_COLUMNS
+        stop = min(start+BLOCK_COLUMNS, numColumns)
+        for k in range(rows.size):
+            row = rows[k]
+            weight = weights[k]
+            for j in range(start, stop):
+                out[j] += weight*data[row, j]
+    return out
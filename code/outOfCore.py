@@ -0,0 +1,301 @@
+import numpy as np
+import pandas as pd
+import kineticPipeline as kp
+from cosmicRayRemoval import CosmicRayRemoval
+from repeatAverage import welfordUpdate
+from wavelengthGrid import commonGrid, interpolationMatrix, sameWavelengths
+
+'''
+The processing chain for kinetics too large to hold in memory, e.g. series of
+thousands of gates. Each file is parsed a few rows at a time straight into a
+ChunkedStore, and every later step (cosmic rays, background, scaling and
+calibration) reads and writes the stored arrays a block of gates at a time,
+so the memory used depends on CHUNK_ROWS and BLOCK_COLUMNS rather than on the
+length of the acquisition. The results are the same as the in-memory chain
+of kineticPipeline.
+
+The .asc files hold one wavelength per line, so they are parsed in blocks of
+rows; the steps working on whole spectra then take blocks of columns from
+the stored array.
+'''
+
+CHUNK_ROWS = 128
+BLOCK_COLUMNS = 256
+
+
+def iterColumnBlocks(numColumns, blockColumns=BLOCK_COLUMNS):
+    '''
+    Slices covering numColumns columns, blockColumns at a time.
+    '''
+    for start in range(0, numColumns, blockColumns):
+        yield slice(start, min(start+blockColumns, numColumns))
+
+
+def readKineticToStore(store, name, filepath, delimiter, nrows=kp.NUM_PIXELS, dtype=np.float64, roi=None, binning=1,
+                       chunkRows=CHUNK_ROWS):
+    '''
+    kineticPipeline.readKinetic, writing the kinetic into store under name
+    chunkRows lines at a time.
+
+    Returns
+    -------
+    kinetic : KineticDataset
+        Its data a writable memmap of the stored array.
+    '''
+    store.deleteDataset(name)
+    columns = None
+    wavelengths = []
+    carried = (np.empty(0), None)
+    for chunk in pd.read_csv(filepath, index_col=0, header=None, nrows=nrows, sep=delimiter, chunksize=chunkRows):
+        if columns is None:
+            # the all-NaN column of the trailing delimiter
+            keep = chunk.notna().all().values
+            columns = chunk.columns[keep]
+        chunkWavelengths, values = kp.cropAndBin(chunk.index.values, chunk.values[:, keep], roi)
+        if carried[1] is not None:
+            chunkWavelengths = np.concatenate([carried[0], chunkWavelengths])
+            values = np.vstack([carried[1], values])
+        # bins must not straddle two chunks, so rows short of a whole bin
+        # wait for the next chunk
+        numRows = len(chunkWavelengths)//binning*binning
+        binnedWavelengths, binned = kp.cropAndBin(chunkWavelengths[:numRows], values[:numRows], binning=binning)
+        if len(binned):
+            store.append(name+'/data', binned, dtype=dtype)
+            wavelengths.append(binnedWavelengths)
+        carried = (chunkWavelengths[numRows:], values[numRows:])
+    if not wavelengths:
+        raise ValueError('no rows of {0} are inside the region of interest'.format(filepath))
+    kinetic = kp.KineticDataset(store.array(name+'/data', writable=True), np.concatenate(wavelengths),
+                                columns.values, metadata={'filepath': filepath})
+    kinetic.addHistory('read', filepath=filepath, delimiter=delimiter, roi=roi, binning=binning)
+    store.saveAxes(name, kinetic)
+    return kinetic
+
+
+def readRepeatsToStore(store, name, filepaths, delimiter, nrows=kp.NUM_PIXELS, dtype=np.float64, roi=None, binning=1,
+                       blockColumns=BLOCK_COLUMNS):
+    '''
+    kineticPipeline.readRepeats, the running mean and sum of squares kept in
+    store under name and updated from each repeat blockColumns gates at a
+    time, so no more than a block of any of them is in memory.
+    '''
+    kinetic = readKineticToStore(store, name, filepaths[0], delimiter, nrows, dtype, roi, binning)
+    if len(filepaths) > 1:
+        m2 = store.create(name+'/variance', kinetic.shape, dtype=kinetic.dtype)
+        for count, filepath in enumerate(filepaths[1:], 2):
+            repeat = readKineticToStore(store, name+'_repeat', filepath, delimiter, nrows, dtype, roi, binning)
+            if repeat.shape != kinetic.shape or not np.array_equal(repeat.wavelengths, kinetic.wavelengths):
+                raise ValueError('{0} does not match the wavelengths and gates of {1}'.format(filepath, filepaths[0]))
+            for block in iterColumnBlocks(kinetic.shape[1], blockColumns):
+                welfordUpdate(kinetic.data[:, block], m2[:, block], repeat.data[:, block], count)
+        store.deleteDataset(name+'_repeat')
+        for block in iterColumnBlocks(kinetic.shape[1], blockColumns):
+            m2[:, block] /= len(filepaths)*(len(filepaths)-1)
+        kinetic.variance = m2
+    kinetic.history = [('read repeats', dict(filepaths=list(filepaths), delimiter=delimiter, roi=roi, binning=binning))]
+    kinetic.metadata['repeats'] = list(filepaths)
+    store.saveAxes(name, kinetic)
+    return kinetic
+
+
+def processSegment(store, name, kineticPath, backgroundPath, startTime, gateStep, timeZero, delimiter,
+                   removeCosmicRays=False, backgroundEndTime=None, nrows=kp.NUM_PIXELS, dtype=np.float64, roi=None,
+                   binning=1, blockColumns=BLOCK_COLUMNS, repeatPaths=None):
+    '''
+    StageGraph.processSegment out of core: the segment is read into store
+    under name, averaging any repeatPaths with it, then its cosmic rays are
+    removed and its background subtracted in place, blockColumns gates at a
+    time.
+    '''
+    if repeatPaths:
+        kinetic = readRepeatsToStore(store, name, [kineticPath]+list(repeatPaths), delimiter, nrows, dtype, roi, binning,
+                                     blockColumns)
+    else:
+        kinetic = readKineticToStore(store, name, kineticPath, delimiter, nrows, dtype, roi, binning)
+    kp.addTimeAxis(kinetic, timeZero, startTime, gateStep)
+    cosmicRayRemoval = CosmicRayRemoval() if removeCosmicRays else None
+    if backgroundPath is None:
+        # the background is the mean of the segment's own early gates, after
+        # their cosmic rays are removed, so it takes a pass of its own
+        backgroundGates = kinetic.times <= backgroundEndTime
+        total = np.zeros(kinetic.shape[0])
+        for block in iterColumnBlocks(kinetic.shape[1], blockColumns):
+            if cosmicRayRemoval is not None:
+                kinetic.data[:, block] = cosmicRayRemoval.removeCosmicRays(kinetic.data[:, block])
+            total += kinetic.data[:, block][:, backgroundGates[block]].sum(axis=1, dtype=np.float64)
+        background = total/np.count_nonzero(backgroundGates)
+        cosmicRayRemoval = None
+    else:
+        background = kp.readBackground(backgroundPath, delimiter, nrows, roi, binning)
+    for block in iterColumnBlocks(kinetic.shape[1], blockColumns):
+        if cosmicRayRemoval is not None:
+            kinetic.data[:, block] = cosmicRayRemoval.removeCosmicRays(kinetic.data[:, block])
+        kinetic.data[:, block] -= background[:, None]
+    if removeCosmicRays:
+        kinetic.addHistory('cosmic rays')
+    kinetic.background = background
+    kinetic.addHistory('background')
+    store.saveAxes(name, kinetic)
+    return kinetic
+
+
+def alignSegment(store, name, segment, grid, blockColumns=BLOCK_COLUMNS):
+    '''
+    kineticPipeline.resampleWavelengths out of core: segment interpolated on
+    to grid into store under name, blockColumns gates at a time. A segment
+    already on the grid is returned as it is.
+    '''
+    if sameWavelengths(segment.wavelengths, grid):
+        return segment
+    store.deleteDataset(name)
+    matrix = interpolationMatrix(segment.wavelengths, grid)
+    shape = (len(grid), segment.shape[1])
+    aligned = kp.KineticDataset(store.create(name+'/data', shape, dtype=segment.dtype), grid, segment.times.copy(),
+                                metadata=segment.metadata, history=segment.history)
+    if segment.variance is not None:
+        aligned.variance = store.create(name+'/variance', shape, dtype=segment.dtype)
+        squared = matrix.multiply(matrix)
+    for block in iterColumnBlocks(segment.shape[1], blockColumns):
+        aligned.data[:, block] = matrix.dot(segment.data[:, block])
+        if segment.variance is not None:
+            aligned.variance[:, block] = squared.dot(segment.variance[:, block])
+    if segment.background is not None:
+        aligned.background = matrix.dot(segment.background)
+    aligned.addHistory('resample wavelengths', first=grid[0], last=grid[-1], numPixels=len(grid))
+    store.saveAxes(name, aligned)
+    return aligned
+
+
+class SplicePlan(object):
+    '''
+    The joined kinetic so far, held as the columns taken from each segment
+    and the factor each segment is scaled by, so joins can be worked out
+    without writing anything. It has the times, spectrum and
+    spectrumVariance of a KineticDataset for kineticPipeline.matchOverlap.
+    '''
+
+    def __init__(self, first):
+        self.wavelengths = first.wavelengths
+        self.pieces = [(first, np.arange(first.shape[1]), 1.)]
+
+    @property
+    def times(self):
+        return np.concatenate([segment.times[columns] for segment, columns, scalingFactor in self.pieces])
+
+    @property
+    def shape(self):
+        return (len(self.wavelengths), sum(len(columns) for segment, columns, scalingFactor in self.pieces))
+
+    def _locate(self, time):
+        for segment, columns, scalingFactor in self.pieces:
+            match = np.flatnonzero(segment.times[columns] == time)
+            if match.size:
+                return segment, columns[match[0]], scalingFactor
+        raise KeyError(time)
+
+    def spectrum(self, time):
+        segment, column, scalingFactor = self._locate(time)
+        return segment.data[:, column]*scalingFactor
+
+    def spectrumVariance(self, time):
+        # as joinPair, the joined kinetic only has a variance if every segment does
+        if any(segment.variance is None for segment, columns, scalingFactor in self.pieces):
+            return None
+        segment, column, scalingFactor = self._locate(time)
+        return segment.variance[:, column]*scalingFactor**2
+
+    def splice(self, toJoin, overlappedTime, scalingFactor):
+        '''
+        As joinPair: drop the columns from overlappedTime onwards and append
+        all of toJoin. Scaling factors are relative to the joined kinetic,
+        which is already on the first segment's scale.
+        '''
+        self.pieces = [(segment, columns[segment.times[columns] < overlappedTime], factor)
+                       for segment, columns, factor in self.pieces]
+        self.pieces.append((toJoin, np.arange(toJoin.shape[1]), scalingFactor))
+
+
+def joinSegments(store, segments, onJoin=None, bootstrap=0, calibration=None, blockColumns=BLOCK_COLUMNS, weighted=False,
+                 overlapSelection='earliest'):
+    '''
+    kineticPipeline.joinKinetics out of core, writing the joined kinetic into
+    store blockColumns gates at a time, with the calibration applied if one
+    is given. Segments off the common wavelength grid are first resampled
+    on to it with alignSegment. Only the overlapped spectra are read to work out the scaling
+    factors. The store is laid out as by chunkedStore.saveResults.
+
+    Returns
+    -------
+    completeKinetic, sfs, overlappedTimes
+        As for joinKinetics, completeKinetic's data a memmap of the store.
+    '''
+    grid = commonGrid([segment.wavelengths for segment in segments])
+    segments = [alignSegment(store, 'segment{0}_align_wavelengths'.format(index), segment, grid, blockColumns)
+                for index, segment in enumerate(segments, 1)]
+    plan = SplicePlan(segments[0])
+    joins = []
+    for index, toJoin in enumerate(segments[1:], 2):
+        try:
+            overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection = kp.matchOverlap(
+                plan, toJoin, bootstrap, weighted, overlapSelection)
+        except kp.NoOverlapError:
+            raise kp.NoOverlapError('no overlapping time points for join {0}'.format(index))
+        joins.append((overlappedTime, scalingFactor, scalingFactorError, interval, selection))
+        if onJoin is not None:
+            onJoin(index, plan.wavelengths, tuple(np.array(spectrum) for spectrum in overlappedPair), overlappedTime, scalingFactor)
+        plan.splice(toJoin, overlappedTime, scalingFactor)
+
+    correction = None if calibration is None else kp.calibrationCorrection(plan.wavelengths, calibration)[:, None]
+    dtype = np.result_type(*[segment.data for segment in segments])
+    data = _writeSpliced(store.create('completeKinetic/data', plan.shape, dtype), plan, 'data', 1, correction,
+                         blockColumns)
+    variance = None
+    if all(segment.variance is not None for segment in segments):
+        # as joinPair, taking the scaling factors as exact
+        variance = _writeSpliced(store.create('completeKinetic/variance', plan.shape, dtype), plan, 'variance', 2,
+                                 correction, blockColumns)
+
+    first = segments[0]
+    completeKinetic = kp.KineticDataset(data, plan.wavelengths, plan.times, metadata=first.metadata, history=first.history,
+                                        variance=variance)
+    for overlappedTime, scalingFactor, scalingFactorError, interval, selection in joins:
+        completeKinetic.addHistory('join', overlappedTime=overlappedTime, scalingFactor=scalingFactor, **(selection or {}))
+    if correction is not None:
+        completeKinetic.addHistory('calibration')
+    store.saveAxes('completeKinetic', completeKinetic)
+    sfs = kp.scalingFactorTable(list(range(1, len(segments)+1)), joins)
+    overlappedTimes = [str(join[0]) for join in joins]
+    store.saveTable('scalingFactors', sfs)
+    store.attrs['overlappedTimes'] = overlappedTimes
+    store.flush()
+    return completeKinetic, sfs, overlappedTimes
+
+
+def _writeSpliced(out, plan, attribute, power, correction, blockColumns):
+    '''
+    Fill out with the plan's columns of each segment's data (or variance),
+    scaled by the scaling factor and calibration to the given power.
+    '''
+    start = 0
+    for segment, columns, scalingFactor in plan.pieces:
+        for block in iterColumnBlocks(len(columns), blockColumns):
+            values = getattr(segment, attribute)[:, columns[block]]
+            if scalingFactor != 1.:
+                values *= scalingFactor**power
+            if correction is not None:
+                values *= correction**power
+            out[:, start+block.start:start+block.stop] = values
+        start += len(columns)
+    out.flush()
+    return out
+
+
+def saveCsv(kinetic, filepath, chunkRows=CHUNK_ROWS):
+    '''
+    Write kinetic as completeKinetic.csv is written (its toDataFrame),
+    chunkRows wavelengths at a time.
+    '''
+    for start in range(0, kinetic.shape[0], chunkRows):
+        rows = slice(start, start+chunkRows)
+        chunk = pd.DataFrame(kinetic.data[rows], index=kinetic.wavelengths[rows], columns=kinetic.times)
+        chunk.to_csv(filepath, mode='w' if start == 0 else 'a', header=start == 0)
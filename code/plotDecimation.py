@@ -0,0 +1,65 @@
+import numpy as np
+
+'''
+Display-side thinning of dense traces before they are handed to matplotlib.
+The visible x range is split into one bin per screen pixel (in log space on a
+log axis) and only the lowest and highest point of each bin are drawn, so the
+plot looks the same as with every point but draws in a time set by the plot
+width rather than the number of gates. Only the plotted copy is thinned;
+saved data always has every point.
+'''
+
+
+def decimate(x, y, numBins, xlim=None, logX=False):
+    '''
+    Min/max decimation of a trace.
+
+    Parameters
+    ----------
+    x, y : array_like
+        The trace. x need not be sorted; the points kept stay in their
+        original order.
+    numBins : int
+        Number of bins across the visible range, normally the axes width in
+        pixels.
+    xlim : (float, float), optional
+        Visible x range. Points outside it are dropped, apart from the
+        nearest one beyond each edge so that lines still reach the edges.
+        Defaults to the range of x.
+    logX : bool, optional
+        Bin in log10(x), for a log x axis. x must then be positive.
+
+    Returns
+    -------
+    x, y : ndarray
+        At most 2*numBins+2 points.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if xlim is not None:
+        visible = (x >= xlim[0]) & (x <= xlim[1])
+        order = np.argsort(x, kind='stable')
+        inOrder = visible[order]
+        # keep the neighbours just outside the range
+        edges = np.zeros(len(x), dtype=bool)
+        edges[:-1] |= inOrder[1:] & ~inOrder[:-1]
+        edges[1:] |= inOrder[:-1] & ~inOrder[1:]
+        visible[order[edges]] = True
+        x, y = x[visible], y[visible]
+    numBins = max(int(numBins), 1)
+    if len(x) <= 2*numBins:
+        return x, y
+    position = np.log10(x) if logX else x
+    low, high = position.min(), position.max()
+    if not high > low:
+        return x, y
+    bins = np.minimum(((position-low)/(high-low)*numBins).astype(np.int64), numBins-1)
+    # sort by bin then by y, so each bin's run starts at its minimum and
+    # ends at its maximum
+    byBin = np.lexsort((y, bins))
+    sortedBins = bins[byBin]
+    starts = np.flatnonzero(np.r_[True, sortedBins[1:] != sortedBins[:-1]])
+    ends = np.r_[starts[1:], len(byBin)]-1
+    # plus the first and last points, so lines run the full width
+    keep = np.unique(np.concatenate([byBin[starts], byBin[ends], [np.argmin(x), np.argmax(x)]]))
+    return x[keep], y[keep]
@@ -0,0 +1,59 @@
+import numpy as np
+
+'''
+Averaging of repeated acquisitions of the same gate window, one repeat at a
+time. Welford's running mean and sum of squared deviations are updated as
+each repeat is added, so only the accumulator and the repeat being added are
+ever in memory however many repeats there are, and the variance does not
+suffer the cancellation of summing squares.
+'''
+
+
+def welfordUpdate(mean, m2, values, count):
+    '''
+    Fold values, the count-th repeat (counting from 1), into mean and m2 in
+    place. mean and m2 may be any writable arrays, e.g. blocks of memmaps.
+    '''
+    delta = values-mean
+    mean += delta/count
+    m2 += delta*(values-mean)
+
+
+class RepeatAverage(object):
+    '''
+    Running mean and variance of repeats added one at a time with add.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def add(self, values):
+        self.count += 1
+        if self.count == 1:
+            self.mean = np.array(values, dtype=np.float64)
+            self.m2 = np.zeros_like(self.mean)
+            return
+        if np.shape(values) != self.mean.shape:
+            raise ValueError('repeat of shape {0} does not match {1}'.format(np.shape(values), self.mean.shape))
+        welfordUpdate(self.mean, self.m2, values, self.count)
+
+    @property
+    def variance(self):
+        '''
+        Sample variance of a single repeat, None from one repeat.
+        '''
+        if self.count < 2:
+            return None
+        return self.m2/(self.count-1)
+
+    @property
+    def varianceOfMean(self):
+        '''
+        Variance of the mean, i.e. of each averaged point, None from one
+        repeat.
+        '''
+        if self.count < 2:
+            return None
+        return self.m2/(self.count*(self.count-1))
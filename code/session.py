@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import kineticPipeline as kp
+import outOfCore
+from stageGraph import StageGraph
+from chunkedStore import ChunkedStore, saveResults, RESULTS_FOLDER
+
+'''
+A processing run saved as a JSON session file: the files in splicing order
+with their start times and gate steps, and every setting the chain depends
+on. The app saves and opens sessions, and they can be run without it:
+
+    python session.py mySession.json
+
+File paths are stored relative to the session file, so a folder of data and
+its session can be moved together. Each file's size, modification time and
+content hash are stored too, and the parsed files are kept in a cache folder
+beside the session (see StageGraph), so reopening a session on unchanged
+files neither parses nor even reads them.
+
+Besides the .csv files, the results are saved in a ChunkedStore folder
+(results_store) for notebooks to open without parsing. Kinetics too large
+for memory can be processed out of core in that store instead, with the
+--out-of-core option.
+'''
+
+SESSION_VERSION = 2
+CACHE_FOLDER = 'parsed_cache'
+
+
+class Session(object):
+    '''
+    Parameters
+    ----------
+    segments : list of dict
+        One per kinetic file in splicing order, with keys 'kinetic',
+        'background', 'startTime' and 'gateStep', and optionally 'repeats',
+        a list of repeated acquisitions to average with the kinetic. The
+        first background may be None, to estimate it from the kinetic's own
+        gates up to backgroundEndTime.
+    timeZero : int
+    delimiter : str, optional
+    backgroundEndTime : int, optional
+    calibration : str, optional
+        Path of the spectral sensitivity calibration.
+    removeCosmicRays : bool, optional
+    dtype : str, optional
+        'float64' or 'float32'.
+    roi, binning : optional
+        See kineticPipeline.cropAndBin.
+    denoiseRank : int, optional
+        Rank each segment is SVD denoised to before joining.
+    joinedDenoiseRank : int, optional
+        Rank the joined kinetic is SVD denoised to.
+    bootstrap : int, optional
+        Bootstrap resamples for the scaling factor intervals, 0 for none.
+    weighted : bool, optional
+        Weight the scaling factor fits by the pixel variances.
+    overlapSelection : str, optional
+        'earliest' or 'snr', the overlapped gates the scaling factors are
+        fitted to (see kineticPipeline.matchOverlap).
+    files : dict, optional
+        {path: (size, mtime, sha1)} as recorded when the session was saved.
+    '''
+
+    def __init__(self, segments, timeZero, delimiter=',', backgroundEndTime=None, calibration=None,
+                 removeCosmicRays=False, dtype='float64', roi=None, binning=1, denoiseRank=None, bootstrap=0,
+                 weighted=False, overlapSelection='earliest', files=None, joinedDenoiseRank=None):
+        self.segments = [dict(segment) for segment in segments]
+        self.timeZero = timeZero
+        self.delimiter = delimiter
+        self.backgroundEndTime = backgroundEndTime
+        self.calibration = calibration
+        self.removeCosmicRays = removeCosmicRays
+        self.dtype = np.dtype(dtype).name
+        self.roi = None if roi is None else tuple(roi)
+        self.binning = binning
+        self.denoiseRank = denoiseRank
+        self.joinedDenoiseRank = joinedDenoiseRank
+        self.bootstrap = bootstrap
+        self.weighted = weighted
+        self.overlapSelection = overlapSelection
+        self.files = {} if files is None else dict(files)
+        self.cacheDir = None
+
+    def paths(self):
+        paths = []
+        for segment in self.segments:
+            paths += [path for path in (segment['kinetic'], segment['background']) if path is not None]
+            paths += segment.get('repeats', [])
+        if self.calibration is not None:
+            paths.append(self.calibration)
+        return paths
+
+    @staticmethod
+    def cacheDirFor(filepath):
+        return os.path.join(os.path.dirname(os.path.abspath(filepath)), CACHE_FOLDER)
+
+    def save(self, filepath, stageGraph=None):
+        '''
+        Write the session to filepath, recording the current signature of
+        every file. Pass the app's stageGraph to reuse the hashes it already
+        has.
+        '''
+        content = self.toContent(os.path.dirname(os.path.abspath(filepath)), stageGraph)
+        with open(filepath, 'w') as f:
+            json.dump(content, f, indent=1)
+        self.cacheDir = self.cacheDirFor(filepath)
+
+    def toContent(self, directory, stageGraph=None):
+        '''
+        The session as saved: a dict for JSON with the file paths relative
+        to directory, recording the current signature of every file.
+        '''
+        if stageGraph is None:
+            stageGraph = StageGraph()
+
+        def relative(path):
+            if path is None:
+                return None
+            try:
+                return os.path.relpath(path, directory)
+            except ValueError:
+                # on another drive
+                return os.path.abspath(path)
+
+        self.files = {path: stageGraph.fileSignature(path) for path in self.paths()}
+        segments = []
+        for segment in self.segments:
+            segment = dict(segment, kinetic=relative(segment['kinetic']), background=relative(segment['background']))
+            if 'repeats' in segment:
+                segment['repeats'] = [relative(path) for path in segment['repeats']]
+            segments.append(segment)
+        content = {
+            'version': SESSION_VERSION,
+            'segments': segments,
+            'timeZero': self.timeZero,
+            'delimiter': self.delimiter,
+            'backgroundEndTime': self.backgroundEndTime,
+            'calibration': relative(self.calibration),
+            'removeCosmicRays': self.removeCosmicRays,
+            'dtype': self.dtype,
+            'roi': self.roi,
+            'binning': self.binning,
+            'denoiseRank': self.denoiseRank,
+            'joinedDenoiseRank': self.joinedDenoiseRank,
+            'bootstrap': self.bootstrap,
+            'weighted': self.weighted,
+            'overlapSelection': self.overlapSelection,
+            'files': {relative(path): signature for path, signature in self.files.items()},
+        }
+        return content
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath) as f:
+            content = json.load(f)
+        if content.get('version', 0) > SESSION_VERSION:
+            raise ValueError('{0} was saved by a newer version of the app'.format(filepath))
+        session = cls.fromContent(content, os.path.dirname(os.path.abspath(filepath)))
+        session.cacheDir = cls.cacheDirFor(filepath)
+        return session
+
+    @classmethod
+    def fromContent(cls, content, directory):
+        '''
+        The session from toContent's dict, relative paths taken from
+        directory.
+        '''
+        if content.get('version', 0) > SESSION_VERSION:
+            raise ValueError('the session was saved by a newer version of the app')
+
+        def absolute(path):
+            return None if path is None else os.path.normpath(os.path.join(directory, path))
+
+        content = dict(content)
+        content.pop('version', None)
+        content['segments'] = [dict(segment, kinetic=absolute(segment['kinetic']), background=absolute(segment['background']))
+                               for segment in content['segments']]
+        for segment in content['segments']:
+            if 'repeats' in segment:
+                segment['repeats'] = [absolute(path) for path in segment['repeats']]
+        content['calibration'] = absolute(content['calibration'])
+        content['files'] = {absolute(path): tuple(signature) for path, signature in content['files'].items()}
+        return cls(**content)
+
+    def rememberFiles(self, stageGraph):
+        '''
+        Hand the recorded file hashes to a stage graph, so unchanged files
+        are not read to hash them again.
+        '''
+        for path, signature in self.files.items():
+            stageGraph.rememberFile(path, *signature)
+
+    def run(self, stageGraph=None, onJoin=None, calibrate=True, stages=None):
+        '''
+        The whole chain headlessly, as Reprocess does in the app, with the
+        calibration applied if the session has one and calibrate is True.
+        Given a dict as stages, the intermediates of each segment are put in
+        it by join index (see StageGraph.processSegment).
+
+        Returns
+        -------
+        completeKinetic, sfs, overlappedTimes
+        '''
+        if stageGraph is None:
+            stageGraph = StageGraph(cacheDir=self.cacheDir)
+        self.rememberFiles(stageGraph)
+        segments = []
+        for index, segment in enumerate(self.segments, 1):
+            segmentStages = None
+            if stages is not None:
+                segmentStages = stages[index] = {}
+            segments.append(stageGraph.processSegment(segment['kinetic'], segment['background'], segment['startTime'],
+                                                      segment['gateStep'], self.timeZero, self.delimiter,
+                                                      removeCosmicRays=self.removeCosmicRays,
+                                                      backgroundEndTime=self.backgroundEndTime, dtype=self.dtype,
+                                                      roi=self.roi, binning=self.binning, denoiseRank=self.denoiseRank,
+                                                      stages=segmentStages, repeatPaths=segment.get('repeats')))
+        completeKinetic, sfs, overlappedTimes = stageGraph.join(segments, onJoin=onJoin, bootstrap=self.bootstrap,
+                                                                 weighted=self.weighted,
+                                                                 overlapSelection=self.overlapSelection,
+                                                                 denoiseRank=self.joinedDenoiseRank)
+        if calibrate and self.calibration is not None:
+            completeKinetic = kp.applyCalibration(completeKinetic.copy(), kp.readCalibration(self.calibration))
+        return completeKinetic, sfs, overlappedTimes
+
+    def runOutOfCore(self, directory, onJoin=None, calibrate=True, blockColumns=outOfCore.BLOCK_COLUMNS):
+        '''
+        run for kinetics too large for memory: every segment and the joined
+        kinetic are written to a ChunkedStore in directory and processed a
+        block of gates at a time (see outOfCore). SVD denoising needs the
+        whole kinetic at once, so it is not available here.
+
+        Returns
+        -------
+        completeKinetic, sfs, overlappedTimes
+            completeKinetic's data is a memmap of the store.
+        '''
+        if self.denoiseRank is not None or self.joinedDenoiseRank is not None:
+            raise ValueError('SVD denoising cannot be run out of core')
+        store = ChunkedStore(directory)
+        store.clear()
+        segments = []
+        for index, segment in enumerate(self.segments, 1):
+            segments.append(outOfCore.processSegment(store, 'segment{0}'.format(index), segment['kinetic'],
+                                                     segment['background'], segment['startTime'], segment['gateStep'],
+                                                     self.timeZero, self.delimiter,
+                                                     removeCosmicRays=self.removeCosmicRays,
+                                                     backgroundEndTime=self.backgroundEndTime, dtype=self.dtype,
+                                                     roi=self.roi, binning=self.binning, blockColumns=blockColumns,
+                                                     repeatPaths=segment.get('repeats')))
+        calibration = None
+        if calibrate and self.calibration is not None:
+            calibration = kp.readCalibration(self.calibration)
+        return outOfCore.joinSegments(store, segments, onJoin=onJoin, bootstrap=self.bootstrap,
+                                      calibration=calibration, blockColumns=blockColumns, weighted=self.weighted,
+                                      overlapSelection=self.overlapSelection)
+
+    def runToFolder(self, output, onDisk=False, calibrate=True, stageGraph=None):
+        '''
+        run (or with onDisk runOutOfCore) and save the results in output as
+        the app does: completeKinetic.csv, scaling_factors.csv and the
+        results_store.
+
+        Returns
+        -------
+        completeKinetic, sfs
+        '''
+        store = os.path.join(output, RESULTS_FOLDER)
+        if onDisk:
+            completeKinetic, sfs, overlappedTimes = self.runOutOfCore(store, calibrate=calibrate)
+            outOfCore.saveCsv(completeKinetic, os.path.join(output, 'completeKinetic.csv'))
+        else:
+            stages = {}
+            completeKinetic, sfs, overlappedTimes = self.run(stageGraph, calibrate=calibrate, stages=stages)
+            completeKinetic.toDataFrame().to_csv(os.path.join(output, 'completeKinetic.csv'))
+            # each segment's last stage is the segment as joined
+            segments = {index: list(segmentStages.values())[-1] for index, segmentStages in stages.items()}
+            saveResults(ChunkedStore(store), completeKinetic, sfs, overlappedTimes, segments, stages)
+        sfs.to_csv(os.path.join(output, 'scaling_factors.csv'), header=True, index=True)
+        return completeKinetic, sfs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a saved session without the app.')
+    parser.add_argument('session', help='session .json file saved from the app')
+    parser.add_argument('--output', help='folder to save the results in, default the session folder')
+    parser.add_argument('--no-calibration', action='store_true', help='do not apply the calibration')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='process on disk a block of gates at a time, for kinetics too large for memory')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='worker processes to split cosmic ray removal between (Python 3.8 and later)')
+    args = parser.parse_args(argv)
+    session = Session.load(args.session)
+    output = args.output or os.path.dirname(os.path.abspath(args.session))
+    stageGraph = StageGraph(cacheDir=session.cacheDir, processes=args.processes)
+    try:
+        completeKinetic, sfs = session.runToFolder(output, onDisk=args.out_of_core, calibrate=not args.no_calibration,
+                                                   stageGraph=stageGraph)
+    finally:
+        stageGraph.close()
+    print('joined {0} segments into {1} wavelengths x {2} times, saved to {3}'.format(
+        len(session.segments), completeKinetic.shape[0], completeKinetic.shape[1], output))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
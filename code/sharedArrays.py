@@ -0,0 +1,233 @@
+import os
+import contextlib
+import multiprocessing
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python 3.7 and earlier
+    shared_memory = None
+
+'''
+Arrays in shared memory for stages that run in worker processes. The parent
+puts the stack (and an output array) in a SharedArrayStore and sends the
+workers only a SharedArray handle, a few bytes to pickle; each worker maps
+the same memory, reads its part of the input and writes its results straight
+into the output, so nothing is copied between processes.
+
+Worker functions must be importable module level functions, as the worker
+processes are spawned rather than forked; create the pool with makePool.
+
+multiprocessing.shared_memory needs Python 3.8 or later. On older versions
+AVAILABLE is False, makePool raises RuntimeError, and the stages run in one
+process (see StageGraph.poolFor).
+'''
+
+AVAILABLE = shared_memory is not None
+# gates below which a stage is quicker run in one process than handed to
+# the workers
+MIN_PARALLEL_GATES = 1000
+# read by numba and the BLAS libraries when a worker first starts its threads
+THREAD_VARIABLES = ('NUMBA_NUM_THREADS', 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def makePool(processes=None):
+    '''
+    multiprocessing.Pool for use with shared arrays. The workers are always
+    spawned, as on Windows: a worker forked after numba or BLAS have started
+    their threads can deadlock, and spawned workers share the parent's
+    resource tracker, so the store stays the only one to unlink its memory.
+
+    Each worker's numba and BLAS threads are limited to its share of the
+    CPUs, so that the workers between them start no more threads than
+    there are CPUs.
+    '''
+    if not AVAILABLE:
+        raise RuntimeError('sharing arrays with worker processes needs Python 3.8 or later')
+    cpus = os.cpu_count() or 1
+    threads = str(max(cpus//(processes or cpus), 1))
+    # the workers take the environment as it is when they are spawned
+    saved = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update((name, threads) for name in THREAD_VARIABLES)
+    try:
+        return multiprocessing.get_context('spawn').Pool(processes)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+class SharedArray(object):
+    '''
+    Picklable handle to an array held in shared memory.
+    '''
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype.str
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return 'SharedArray({0!r}, {1}, {2})'.format(self.name, self.shape, self.dtype)
+
+
+class SharedArrayStore(object):
+    '''
+    Owner of a set of shared arrays. Use as a context manager, or call
+    close(), so the shared memory is released once the stage is done; any
+    array returned by the store must not be used after that.
+    '''
+
+    def __init__(self):
+        self._blocks = {}
+
+    def create(self, shape, dtype=np.float64):
+        '''
+        New (uninitialised) shared array.
+
+        Returns
+        -------
+        handle : SharedArray
+            To send to the workers.
+        array : ndarray
+            View of the shared memory in this process.
+        '''
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape))*dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self._blocks[block.name] = block
+        handle = SharedArray(block.name, shape, dtype)
+        return handle, self.array(handle)
+
+    def share(self, array):
+        '''
+        Copy an array into shared memory, returning its handle.
+        '''
+        handle, shared = self.create(array.shape, array.dtype)
+        shared[...] = array
+        return handle
+
+    def array(self, handle):
+        return np.ndarray(handle.shape, handle.dtype, buffer=self._blocks[handle.name].buf)
+
+    def detach(self, handle):
+        '''
+        Take a shared array out of the store, as an ordinary array that
+        stays valid after the store is closed. Its name is unlinked at once,
+        so no other process can attach to it any more; the memory is freed
+        when the array is.
+        '''
+        block = self._blocks.pop(handle.name)
+        block.unlink()
+        return np.asarray(_Mapped(block, handle))
+
+    def close(self):
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # an array from the store is still referenced; the mapping
+                # goes when it does, but the memory is unlinked regardless
+                pass
+            block.unlink()
+        self._blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Mapped(object):
+    '''
+    Keeps a shared memory block mapped for as long as an array of it lives:
+    np.asarray of this object has it as its base (as in numpy's as_strided).
+    '''
+
+    def __init__(self, block, handle):
+        self.block = block
+        # only the address is kept, so the block has no view of it left to
+        # stop it closing once the array is gone
+        view = np.ndarray(handle.shape, handle.dtype, buffer=block.buf)
+        self.__array_interface__ = dict(view.__array_interface__)
+        del view
+
+
+@contextlib.contextmanager
+def attached(handle):
+    '''
+    Context manager giving an ndarray view of a shared array, for use inside
+    a worker process. The view must not be kept after the block.
+    '''
+    block = shared_memory.SharedMemory(name=handle.name)
+    try:
+        yield np.ndarray(handle.shape, handle.dtype, buffer=block.buf)
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # a view is still referenced (e.g. by a traceback); the mapping
+            # goes when it does
+            pass
+
+
+def _columnBlockWorker(args):
+    func, inHandle, outHandle, start, stop = args
+    with attached(inHandle) as inarr, attached(outHandle) as out:
+        out[:, start:stop] = func(inarr[:, start:stop])
+
+
+def mapColumnBlocks(func, data, pool, numBlocks=None, dtype=None, store=None):
+    '''
+    Apply func to blocks of columns of a 2-d array in a multiprocessing
+    pool, through shared memory.
+
+    Parameters
+    ----------
+    func : callable
+        Module level function taking a 2-d block of columns and returning
+        a block of the same shape.
+    data : 2-d ndarray
+    pool : multiprocessing.Pool
+        See makePool.
+    numBlocks : int, optional
+        Number of blocks the columns are split into. Default is one per
+        worker process.
+    dtype : dtype, optional
+        Precision of the result. Default is that of data.
+    store : SharedArrayStore, optional
+        Store to keep the result in, valid until the store is closed. By
+        default the result is detached from a temporary store (see
+        SharedArrayStore.detach), so it is returned without being copied.
+
+    Returns
+    -------
+    out : ndarray
+        The blocks put back together, as the workers wrote them.
+    '''
+    if numBlocks is None:
+        numBlocks = pool._processes
+    edges = np.linspace(0, data.shape[1], max(min(numBlocks, data.shape[1]), 1)+1).astype(int)
+    if store is None:
+        with SharedArrayStore() as store:
+            outHandle = _mapColumnBlocks(func, data, pool, edges, dtype, store)
+            return store.detach(outHandle)
+    return store.array(_mapColumnBlocks(func, data, pool, edges, dtype, store))
+
+
+def _mapColumnBlocks(func, data, pool, edges, dtype, store):
+    inHandle = store.share(data)
+    outHandle = store.create(data.shape, data.dtype if dtype is None else dtype)[0]
+    tasks = [(func, inHandle, outHandle, start, stop) for start, stop in zip(edges[:-1], edges[1:])]
+    pool.map(_columnBlockWorker, tasks)
+    return outHandle
@@ -0,0 +1,385 @@
+import os
+import uuid
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import kineticPipeline as kp
+import sharedArrays
+from kineticDataset import KineticDataset
+from wavelengthGrid import commonGrid, sameWavelengths
+
+'''
+Memoised processing chain. Every intermediate result is stored under a key
+built from the keys of its inputs and its own parameters, with the chain
+rooted at a hash of each file's contents. Changing one parameter therefore
+only changes the keys (and recomputes the results) of the stages downstream
+of it; everything else is taken from the cache.
+
+Per segment the chain is
+
+    read (or read repeats) -> time axis -> cosmic rays (optional) -> background
+
+and the joins are chained on top, each join keyed on the previous join and
+the segment being added, so reordering or editing a late segment leaves the
+earlier joins cached.
+
+Cached values are shared, so stage functions must never modify their inputs
+in place.
+
+Given a cacheDir, the parsed files are also kept on disk as .npz files named
+by their key, which is rooted at the file's content hash, so they are never
+parsed twice even across sessions.
+'''
+
+# stages whose results are worth keeping on disk: parsing is slow next to
+# reading back an array
+PERSISTENT_STAGES = ('read kinetic', 'read repeats', 'read background')
+
+
+def hashKey(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _nbytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    try:
+        return int(value.memory_usage(index=True, deep=False).sum())
+    except (AttributeError, TypeError):
+        pass
+    try:
+        return int(value.memory_usage(index=True, deep=False))
+    except (AttributeError, TypeError):
+        pass
+    return getattr(value, 'nbytes', 0)
+
+
+class StageResult(object):
+    '''
+    A cached stage output and the key it is stored under.
+    '''
+    __slots__ = ('key', 'value')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+
+class StageGraph(object):
+    '''
+    Parameters
+    ----------
+    maxBytes : int, optional
+        Approximate memory budget of the cache. The least recently used
+        results are dropped beyond it. Default is 2 GB.
+    cacheDir : str, optional
+        Folder to keep parsed files in, see persist. By default nothing is
+        written to disk.
+    processes : int, optional
+        Worker processes for the stages that can be split between them,
+        see poolFor. Default is 1, running every stage in this process;
+        None is one per CPU if arrays can be shared with them (Python 3.8
+        and later, see sharedArrays), otherwise 1.
+    '''
+
+    def __init__(self, maxBytes=2*2**30, cacheDir=None, processes=1):
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        if processes is None:
+            processes = (os.cpu_count() or 1) if sharedArrays.AVAILABLE else 1
+        self.processes = processes
+        self._pool = None
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._fileHashes = {}
+        self._persistent = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._cache.clear()
+        self._sizes.clear()
+        self._fileHashes.clear()
+        self._persistent.clear()
+
+    def poolFor(self, kinetic):
+        '''
+        The worker pool to split a stage on kinetic between, started the
+        first time it is needed, or None to run the stage in this process:
+        with a single process, or for a kinetic of fewer than
+        sharedArrays.MIN_PARALLEL_GATES gates.
+        '''
+        if self.processes < 2 or kinetic.shape[1] < sharedArrays.MIN_PARALLEL_GATES:
+            return None
+        if self._pool is None:
+            self._pool = sharedArrays.makePool(self.processes)
+        return self._pool
+
+    def close(self):
+        '''
+        Stop the worker pool, if one was started.
+        '''
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def cacheBytes(self):
+        return sum(self._sizes.values())
+
+    def resetCounts(self):
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, name, func, inputs=(), **params):
+        '''
+        Return func(*[i.value for i in inputs], **params), computing it only
+        if no result with the same stage name, input keys and parameters is
+        cached.
+        '''
+        key = hashKey(name, tuple(i.key for i in inputs), tuple(sorted(params.items())))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        persistent = name in PERSISTENT_STAGES
+        value = self._readPersisted(key) if persistent else None
+        if value is None:
+            self.misses += 1
+            value = func(*[i.value for i in inputs], **params)
+        else:
+            self.hits += 1
+        result = StageResult(key, value)
+        self._store(result)
+        if persistent:
+            self._persistent[key] = result
+            self.persist()
+        return result
+
+    def _persistedPath(self, key):
+        return os.path.join(self.cacheDir, key+'.npz')
+
+    def _readPersisted(self, key):
+        if self.cacheDir is None or not os.path.exists(self._persistedPath(key)):
+            return None
+        try:
+            with np.load(self._persistedPath(key)) as arrays:
+                if 'array' in arrays:
+                    return arrays['array']
+            return KineticDataset.load(self._persistedPath(key))
+        except Exception:
+            # unreadable (e.g. written by a run that was killed): parse again
+            return None
+
+    def persist(self):
+        '''
+        Write every parsed file still in memory to cacheDir, if set, unless
+        it is already there. Called after each parse, and worth calling
+        when cacheDir is first set.
+        '''
+        if self.cacheDir is None:
+            return
+        os.makedirs(self.cacheDir, exist_ok=True)
+        for key, result in list(self._persistent.items()):
+            path = self._persistedPath(key)
+            if not os.path.exists(path):
+                # written under a temporary name so a half written file is
+                # never read back, unique as other processes (see jobServer)
+                # may be writing the same file into a shared cacheDir
+                temporary = '{0}.{1}.tmp'.format(path, uuid.uuid4().hex)
+                with open(temporary, 'wb') as f:
+                    if isinstance(result.value, KineticDataset):
+                        result.value.save(f)
+                    else:
+                        np.savez(f, array=result.value)
+                try:
+                    os.replace(temporary, path)
+                except OSError:
+                    # on Windows, another process has its copy open
+                    os.remove(temporary)
+            del self._persistent[key]
+
+    def _store(self, result):
+        self._cache[result.key] = result
+        self._sizes[result.key] = _nbytes(result.value)
+        while len(self._cache) > 1 and self.cacheBytes() > self.maxBytes:
+            key, _ = self._cache.popitem(last=False)
+            del self._sizes[key]
+            self._persistent.pop(key, None)
+
+    def fileHash(self, filepath):
+        '''
+        Hash of a file's contents, only re-read when its size or modification
+        time change.
+        '''
+        stat = os.stat(filepath)
+        signature = (stat.st_size, stat.st_mtime)
+        known = self._fileHashes.get(filepath)
+        if known is not None and known[0] == signature:
+            return known[1]
+        sha = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                sha.update(block)
+        self._fileHashes[filepath] = (signature, sha.hexdigest())
+        return sha.hexdigest()
+
+    def fileSignature(self, filepath):
+        '''
+        (size, modification time, content hash) of a file, for rememberFile.
+        '''
+        sha = self.fileHash(filepath)
+        return self._fileHashes[filepath][0]+(sha,)
+
+    def rememberFile(self, filepath, size, mtime, sha):
+        '''
+        Take a file's content hash from an earlier fileSignature (e.g. saved
+        in a session), so it is trusted without reading the file for as
+        long as the size and modification time still match.
+        '''
+        self._fileHashes[filepath] = ((size, mtime), sha)
+
+    def source(self, filepath):
+        return StageResult(self.fileHash(filepath), filepath)
+
+###############################################################################
+##########################    PIPELINE STAGES    ##############################
+###############################################################################
+
+    def readKinetic(self, filepath, delimiter, nrows=kp.NUM_PIXELS, dtype=np.float64, roi=None, binning=1):
+        return self.run('read kinetic', _readKinetic, (self.source(filepath),), delimiter=delimiter, nrows=nrows,
+                        dtype=np.dtype(dtype).name, roi=roi, binning=binning)
+
+    def readRepeats(self, filepaths, delimiter, nrows=kp.NUM_PIXELS, dtype=np.float64, roi=None, binning=1):
+        return self.run('read repeats', _readRepeats, tuple(self.source(filepath) for filepath in filepaths),
+                        delimiter=delimiter, nrows=nrows, dtype=np.dtype(dtype).name, roi=roi, binning=binning)
+
+    def readBackground(self, filepath, delimiter, nrows=kp.NUM_PIXELS, roi=None, binning=1):
+        return self.run('read background', _readBackground, (self.source(filepath),), delimiter=delimiter, nrows=nrows,
+                        roi=roi, binning=binning)
+
+    def processSegment(self, kineticPath, backgroundPath, startTime, gateStep, timeZero, delimiter,
+                       removeCosmicRays=False, backgroundEndTime=None, nrows=kp.NUM_PIXELS, dtype=np.float64,
+                       roi=None, binning=1, denoiseRank=None, stages=None, repeatPaths=None):
+        '''
+        Read one segment and take it as far as background subtraction, and
+        SVD denoising if a denoiseRank is given. With no backgroundPath the
+        background is estimated from the segment's own gates up to
+        backgroundEndTime. Given repeatPaths, those repeats of the kinetic are
+        averaged with it as it is read. Pass a dict as stages to have the value of every
+        stage put in it by stage name, e.g. to save the intermediates.
+        '''
+        results = OrderedDict()
+        if repeatPaths:
+            result = results['read repeats'] = self.readRepeats([kineticPath]+list(repeatPaths), delimiter, nrows, dtype,
+                                                                roi, binning)
+        else:
+            result = results['read kinetic'] = self.readKinetic(kineticPath, delimiter, nrows, dtype, roi, binning)
+        result = results['time axis'] = self.run('time axis', _addTimeAxis, (result,), timeZero=timeZero,
+                                                 startTime=startTime, gateStep=gateStep)
+        if removeCosmicRays:
+            result = results['cosmic rays'] = self.run('cosmic rays', self._removeCosmicRays, (result,))
+        if backgroundPath is None:
+            result = self.run('background', _subtractOwnBackground, (result,), backgroundEndTime=backgroundEndTime)
+        else:
+            background = results['read background'] = self.readBackground(backgroundPath, delimiter, nrows, roi, binning)
+            result = self.run('background', _subtractBackground, (result, background))
+        results['background'] = result
+        if denoiseRank is not None:
+            result = results['svd denoise'] = self.run('svd denoise', _denoiseSVD, (result,), rank=denoiseRank)
+        if stages is not None:
+            stages.update((stage, stageResult.value) for stage, stageResult in results.items())
+        return result
+
+    def _removeCosmicRays(self, kinetic):
+        # a method, for the pool; the result is the same either way, so the
+        # pool is not part of the key
+        return kp.removeCosmicRays(kinetic.copy(deep=False), pool=self.poolFor(kinetic))
+
+    def alignWavelengths(self, segments):
+        '''
+        Processed segments on a common wavelength grid, see
+        kineticPipeline.alignWavelengths. Segments already on it are
+        returned as they are.
+        '''
+        if len(segments) < 2:
+            return list(segments)
+        grid = commonGrid([segment.value.wavelengths for segment in segments])
+        gridResult = StageResult(hashKey('wavelength grid', grid.tobytes()), grid)
+        return [segment if sameWavelengths(segment.value.wavelengths, grid)
+                else self.run('align wavelengths', _resampleWavelengths, (segment, gridResult))
+                for segment in segments]
+
+    def join(self, segments, onJoin=None, bootstrap=0, weighted=False, overlapSelection='earliest', denoiseRank=None):
+        '''
+        Join processed segments in order, see kineticPipeline.joinKinetics,
+        and SVD denoise the joined kinetic if a denoiseRank is given. onJoin
+        is only called for joins that are actually recomputed.
+
+        Returns
+        -------
+        completeKinetic, sfs, overlappedTimes
+        '''
+        joins = []
+        segments = self.alignWavelengths(segments)
+        joined = segments[0]
+        for index, segment in enumerate(segments[1:], 2):
+            misses = self.misses
+            try:
+                joined = self.run('join', _joinPair, (joined, segment), bootstrap=bootstrap, weighted=weighted,
+                                  overlapSelection=overlapSelection)
+            except kp.NoOverlapError:
+                raise kp.NoOverlapError('no overlapping time points for join {0}'.format(index))
+            spliced, overlappedTime, scalingFactor, scalingFactorError, overlappedPair, interval, selection = joined.value
+            joins.append((overlappedTime, scalingFactor, scalingFactorError, interval, selection))
+            if onJoin is not None and self.misses > misses:
+                onJoin(index, spliced.wavelengths, overlappedPair, overlappedTime, scalingFactor)
+        sfs = kp.scalingFactorTable(list(range(1, len(segments)+1)), joins)
+        overlappedTimes = [str(j[0]) for j in joins]
+        completeKinetic = joined.value if len(segments) == 1 else joined.value[0]
+        if denoiseRank is not None:
+            completeKinetic = self.run('svd denoise', _denoiseSVD, (StageResult(joined.key, completeKinetic),),
+                                       rank=denoiseRank).value
+        return completeKinetic, sfs, overlappedTimes
+
+
+def _readKinetic(filepath, delimiter, nrows, dtype, roi, binning):
+    return kp.readKinetic(filepath, delimiter, nrows=nrows, dtype=dtype, roi=roi, binning=binning)
+
+
+def _readRepeats(*filepaths, delimiter, nrows, dtype, roi, binning):
+    return kp.readRepeats(filepaths, delimiter, nrows=nrows, dtype=dtype, roi=roi, binning=binning)
+
+
+def _readBackground(filepath, delimiter, nrows, roi, binning):
+    return kp.readBackground(filepath, delimiter, nrows=nrows, roi=roi, binning=binning)
+
+
+# The pipeline steps work in place, so each is handed a copy here: shallow
+# where the step only replaces attributes, deep where it writes to the data.
+
+def _addTimeAxis(kinetic, timeZero, startTime, gateStep):
+    return kp.addTimeAxis(kinetic.copy(deep=False), timeZero, startTime, gateStep)
+
+
+def _subtractBackground(kinetic, background):
+    return kp.subtractBackground(kinetic.copy(), background)
+
+
+def _subtractOwnBackground(kinetic, backgroundEndTime):
+    return kp.subtractBackground(kinetic.copy(), kp.estimateBackground(kinetic, backgroundEndTime))
+
+
+def _denoiseSVD(kinetic, rank):
+    return kp.denoiseSVD(kinetic.copy(deep=False), rank)
+
+
+def _resampleWavelengths(kinetic, wavelengths):
+    return kp.resampleWavelengths(kinetic.copy(deep=False), wavelengths)
+
+
+def _joinPair(joined, toJoin, bootstrap, weighted, overlapSelection):
+    # a previous join result is a tuple with the spliced kinetic first
+    if isinstance(joined, tuple):
+        joined = joined[0]
+    return kp.joinPair(joined, toJoin, bootstrap, weighted, overlapSelection)
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import datetime
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+'''
+Timing and memory instrumentation for the processing stages. Each stage is
+wrapped in StageProfiler.stage(), which records wall time, CPU time, peak
+memory and any array shapes the caller attaches, and can optionally dump a
+cProfile of the stage for a closer look.
+
+Peak memory is only tracked when asked for, as tracemalloc slows every
+allocation, and only on Python 3.9 or later, where the traced peak can be
+reset at the start of each stage. Before that it is the peak of the whole
+process so far, which says nothing about the stage.
+'''
+
+
+def shapeOf(data):
+    '''
+    Shape of a DataFrame, Series or ndarray as a list, for the JSON log.
+    '''
+    try:
+        return list(data.shape)
+    except AttributeError:
+        return None
+
+
+class StageProfiler(object):
+    '''
+    Parameters
+    ----------
+    profile : bool, optional
+        Also run cProfile around every stage and dump the stats to a
+        'profiles' folder next to the run log. Default is False.
+    traceMemory : bool, optional
+        Track the peak memory of every stage with tracemalloc, on Python 3.9
+        or later. Default is False.
+    '''
+
+    logName = 'run_log.json'
+
+    def __init__(self, profile=False, traceMemory=False):
+        self.profile = profile
+        self.traceMemory = traceMemory and hasattr(tracemalloc, 'reset_peak')
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.records = []
+        self._stack = []
+        self._profiles = []
+        if self.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, **shapes):
+        '''
+        Context manager timing one stage. Yields the record dict so that
+        shapes (or anything else) can be added once they are known, e.g.
+
+        >>> with profiler.stage('join') as record:
+        ...     joined = join(kinetics)
+        ...     record['shapes']['joined'] = shapeOf(joined)
+        '''
+        record = {
+            'stage': name,
+            'started': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'shapes': {key: shapeOf(value) for key, value in shapes.items()},
+        }
+        frame = self._enterMemory()
+        profiler = None
+        # cProfile cannot be nested, so only the outermost stage is profiled
+        if self.profile and not any(self._profiles):
+            profiler = cProfile.Profile()
+        self._profiles.append(profiler)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = repr(e)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wallTime'] = time.perf_counter()-wall
+            record['cpuTime'] = time.process_time()-cpu
+            record['peakMemoryMB'] = self._exitMemory(frame)
+            self._profiles.pop()
+            if profiler is not None:
+                record['profile'] = profiler
+            self.records.append(record)
+
+    def _enterMemory(self):
+        if not self.traceMemory or not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame = {'base': current, 'peak': current}
+        self._stack.append(frame)
+        return frame
+
+    def _exitMemory(self, frame):
+        if frame is None:
+            return None
+        self._stack.pop()
+        peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        return (peak-frame['base'])/2**20
+
+    @staticmethod
+    def summary(record):
+        '''
+        Short human readable description of a record for the status bar.
+        '''
+        text = '{0:.2f} s wall, {1:.2f} s CPU'.format(record['wallTime'], record['cpuTime'])
+        if record.get('peakMemoryMB') is not None:
+            text += ', {0:.1f} MB peak'.format(record['peakMemoryMB'])
+        return text
+
+    def lastSummary(self, name=None):
+        for record in reversed(self.records):
+            if name is None or record['stage'] == name:
+                return self.summary(record)
+        return ''
+
+    def saveRunLog(self, directory):
+        '''
+        Write all records so far to run_log.json in directory, dumping any
+        cProfile stats to directory/profiles alongside.
+        '''
+        if self.profile:
+            profileDir = os.path.join(directory, 'profiles')
+            if not os.path.exists(profileDir):
+                os.makedirs(profileDir)
+        records = []
+        for count, record in enumerate(self.records):
+            record = dict(record)
+            profiler = record.pop('profile', None)
+            if isinstance(profiler, cProfile.Profile):
+                path = os.path.join(profileDir, '{0}_{1}.prof'.format(count, record['stage'].replace(' ', '_')))
+                profiler.dump_stats(path)
+                self.records[count]['profile'] = path
+                profiler = path
+            if profiler is not None:
+                record['profile'] = profiler
+            records.append(record)
+        log = {'started': self.started, 'stages': records}
+        filepath = os.path.join(directory, self.logName)
+        with open(filepath, 'w') as f:
+            json.dump(log, f, indent=2)
+        return filepath
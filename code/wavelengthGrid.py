@@ -0,0 +1,69 @@
+from functools import lru_cache
+import numpy as np
+
+'''
+Putting kinetics whose wavelength axes differ, e.g. because the grating
+calibration shifted slightly between files, on one common grid. The linear
+interpolation from one axis to another is held as a sparse matrix with two
+weights per row, worked out once for each pair of axes, so resampling every
+gate of a kinetic is a single sparse matrix product.
+'''
+
+# axes closer than this (nm) at every pixel are taken as the same
+WAVELENGTH_TOLERANCE = 1e-4
+
+
+def sameWavelengths(first, second, tolerance=WAVELENGTH_TOLERANCE):
+    if len(first) != len(second):
+        return False
+    return np.array_equal(first, second) or np.allclose(first, second, rtol=0, atol=tolerance)
+
+
+def commonGrid(axes, tolerance=WAVELENGTH_TOLERANCE):
+    '''
+    The wavelengths of the first axis within the range every axis covers, so
+    nothing has to be extrapolated.
+
+    Raises
+    ------
+    ValueError
+        If the axes have fewer than two wavelengths in common.
+    '''
+    reference = np.asarray(axes[0], dtype=np.float64)
+    low = max(np.min(axis) for axis in axes)-tolerance
+    high = min(np.max(axis) for axis in axes)+tolerance
+    grid = reference[(reference >= low) & (reference <= high)]
+    if len(grid) < 2:
+        raise ValueError('the kinetics have no wavelength range in common')
+    return grid
+
+
+def interpolationMatrix(source, target):
+    '''
+    Sparse matrix M, shape (len(target), len(source)), with M.dot(values)
+    the linear interpolation onto target of values sampled at source (along
+    the first axis, so all the gates of a kinetic at once). The last few
+    matrices are cached.
+    '''
+    source = np.ascontiguousarray(source, dtype=np.float64)
+    target = np.ascontiguousarray(target, dtype=np.float64)
+    return _interpolationMatrix(source.tobytes(), target.tobytes())
+
+
+@lru_cache(maxsize=16)
+def _interpolationMatrix(sourceBytes, targetBytes):
+    from scipy.sparse import csr_matrix
+    source = np.frombuffer(sourceBytes)
+    target = np.frombuffer(targetBytes)
+    order = np.argsort(source, kind='stable')
+    ordered = source[order]
+    below = np.clip(np.searchsorted(ordered, target, side='right')-1, 0, len(source)-2)
+    # targets within the tolerance outside the source range take the end pixel
+    fraction = np.clip((target-ordered[below])/(ordered[below+1]-ordered[below]), 0, 1)
+    rows = np.repeat(np.arange(len(target)), 2)
+    columns = np.column_stack([order[below], order[below+1]]).ravel()
+    weights = np.column_stack([1-fraction, fraction]).ravel()
+    matrix = csr_matrix((weights, (rows, columns)), shape=(len(target), len(source)))
+    # wavelengths on the grid carry a zero weight for their neighbour
+    matrix.eliminate_zeros()
+    return matrix